@@ -14,6 +14,8 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -72,6 +74,11 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'idempotency-key',
+)
+
 AUTH_USER_MODEL = 'server.User'
 
 
@@ -83,6 +90,91 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Повтор денежных операций по заголовку Idempotency-Key
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_KEY_WAIT = 5  # секунд ожидания параллельного запроса с тем же ключом
+
+# Месяц считается закрытым для выписок через эту задержку после его конца: дожидаемся фиксации параллельных транзакций БД
+TRANSACTION_ROLLUP_DELAY = timedelta(seconds=30)
+
+# События журнала (payments.outbox): читаются пачками по OUTBOX_BATCH_SIZE в порядке фиксации транзакций БД
+OUTBOX_BATCH_SIZE = 500
+
+# Выплаты по одобренным заявкам на вывод: очередь PayoutJob и команда run_payout_worker.
+# PAYOUT_GATEWAY = None — выплата проводится сразу при одобрении, без шлюза.
+# Заглушку шлюза включают только в локальных настройках разработки или нагрузочных прогонов (при DEBUG):
+# PAYOUT_GATEWAY = 'payments.gateways.StubPayoutGateway'
+# PAYOUT_GATEWAY_OPTIONS = {'latency': 0.5, 'failure_rate': 0.1, 'decline_rate': 0.02}
+PAYOUT_GATEWAY = None
+PAYOUT_GATEWAY_OPTIONS = {}
+PAYOUT_MAX_ATTEMPTS = 5
+PAYOUT_RETRY_BACKOFF = 10  # секунд до первого повтора, дальше удваивается
+PAYOUT_RETRY_BACKOFF_MAX = 600
+PAYOUT_JOB_TIMEOUT = timedelta(minutes=5)  # после этого задание пропавшего обработчика возвращается в очередь
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Счетчики ограничений частоты переводов (VELOCITY_CACHE_ALIAS): incr в Redis атомарен и виден всем процессам.
+    # Нужен пакет redis (requirements.txt); соединение открывается при первом обращении
+    'velocity': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
+
+# Кэш балансов (payments.balance_cache): LRU процесса поверх кэша Django.
+# Для нескольких процессов нужен общий бэкенд CACHES (Redis/Memcached), иначе записи живут не дольше MAX_STALENESS
+BALANCE_CACHE_ALIAS = 'default'
+BALANCE_CACHE_MAX_STALENESS = 2  # секунд, на которые локальная копия процесса может отстать от общего кэша
+BALANCE_CACHE_TIMEOUT = 300
+BALANCE_CACHE_LOCAL_SIZE = 10_000
+
+# Таблицы настроек рангов в памяти (payments.fees): процесс, где прошла правка RankSettings, сбрасывает их сразу,
+# остальные перечитывают не позже чем через столько секунд
+RANK_TABLES_MAX_STALENESS = 60
+
+# На сколько строк SystemAccountShard делится каждый системный счет; увеличивать можно в любой момент
+SYSTEM_ACCOUNT_SHARDS = 16
+
+# Снимки балансов для запросов баланса на дату: каждые EVERY проводок профиля или не реже раза в MAX_AGE
+BALANCE_SNAPSHOT_EVERY = 500
+BALANCE_SNAPSHOT_MAX_AGE = timedelta(days=1)
+
+# Завершенные транзакции старше этого срока переносятся в TransactionArchive командой archive_transactions
+TRANSACTION_ARCHIVE_AFTER = timedelta(days=180)
+
+# Выписки по счету (payments.statements): файл закрытого месяца формируется один раз командой run_statement_worker
+STATEMENT_CACHE_ALIAS = 'default'
+STATEMENT_JOB_TIMEOUT = timedelta(minutes=10)  # после этого выписка пропавшего обработчика возвращается в очередь
+# Шрифт с кириллицей для PDF; формат PDF доступен, только если установлен reportlab
+STATEMENT_PDF_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+# Сводка расходов и поступлений профиля (payments.insights): ключ кэша меняется с каждой проводкой профиля,
+# поэтому срок жизни ограничивает только место в кэше
+INSIGHTS_CACHE_ALIAS = 'default'
+INSIGHTS_CACHE_TIMEOUT = 60 * 60 * 24
+INSIGHTS_MONTHS = 12  # месяцев в сводке по умолчанию, включая текущий
+INSIGHTS_MAX_MONTHS = 36
+
+# Ограничения частоты переводов бонусов (payments.velocity). Счетчики скользящих окон хранятся в кэше
+# VELOCITY_CACHE_ALIAS корзинами по window / VELOCITY_BUCKETS секунд. Кэш должен быть общим для всех процессов
+# и доступным: при непустых правилах проверки payments.E001 (кэш процесса) и payments.E002 (бэкенд не импортируется
+# или не отвечает) не дают запустить проект, а сбой кэша во время работы отклоняет переводы с ответом 503.
+# metric: count — переводов в окне, amount — сумма в рублях, recipients — разных получателей.
+# VELOCITY_RULES = {} — ограничения выключены. Правила включают в локальных настройках вместе с Redis:
+# VELOCITY_RULES = {
+#     'bonus_transfer': [
+#         {'name': 'transfers_per_hour', 'metric': 'count', 'window': 3600, 'limit': 30},
+#         {'name': 'amount_per_day', 'metric': 'amount', 'window': 86400, 'limit': 50_000},
+#         {'name': 'recipients_per_day', 'metric': 'recipients', 'window': 86400, 'limit': 10},
+#     ],
+# }
+VELOCITY_CACHE_ALIAS = 'velocity'
+VELOCITY_BUCKETS = 12
+VELOCITY_RULES = {}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
@@ -152,6 +244,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Тестовая БД в файле: в SQLite в памяти параллельные потоки тестов получают "table is locked"
+        # вместо ожидания блокировки
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
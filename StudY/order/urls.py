@@ -22,6 +22,10 @@ order_confirm = OrderCustomerActionsViewSet.as_view({
     'post': 'confirm_order'
 })
 
+order_complete = OrderCustomerActionsViewSet.as_view({
+    'post': 'complete_order'
+})
+
 router.register(r'views-discipline', OrderDisciplinesViewSet, basename='views-discipline')
 router.register(r'views-executors', ExecutorDisciplineViewSet, basename='views-executor'),
 router.register(r'executor-disciplines', ExecutorSelfDisciplineViewSet, basename='executor-discipline'),
@@ -38,5 +42,6 @@ urlpatterns = [
                   path('orders/<int:order_id>/reject/', order_reject, name='reject_order'),
                   path('orders/<int:order_id>/edit/', order_edit, name='edit_order'),
                   path('orders/<int:order_id>/confirm/', order_confirm, name='confirm_order'),
+                  path('orders/<int:order_id>/complete/', order_complete, name='complete_order'),
 
               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -3,6 +3,7 @@ from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import viewsets, status, generics
 from rest_framework.response import Response
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet, ViewSet
@@ -14,6 +15,7 @@ from functools import partial
 from rest_framework.permissions import IsAuthenticated
 from server.decorators import IsRole, IsVerified
 from server.models import *
+from payments.escrow import hold_order_funds, settle_order_holds
 
 
 
@@ -494,18 +496,25 @@ class OrderCustomerActionsViewSet(ViewSet):
 
         decision = request.data.get('decision')  # 'accept' или 'reject'
         if decision == 'accept':
-            order.status = 'in_progress'
-            order.save(update_fields=['status'])
-            OrderStatusLog.objects.create(
-                order=order,
-                status='accepted_customer',
-                comment="Заказ принят заказчиком"
-            )
-            OrderStatusLog.objects.create(
-                order=order,
-                status='in_progress',
-                comment="Заказ перешел на этап 'В работе'"
-            )
+            # Стоимость заказа удерживается со счета заказчика до завершения заказа;
+            # удержание и смена статуса фиксируются вместе
+            try:
+                with transaction.atomic():
+                    hold_order_funds(order)
+                    order.status = 'in_progress'
+                    order.save(update_fields=['status'])
+                    OrderStatusLog.objects.create(
+                        order=order,
+                        status='accepted_customer',
+                        comment="Заказ принят заказчиком"
+                    )
+                    OrderStatusLog.objects.create(
+                        order=order,
+                        status='in_progress',
+                        comment="Заказ перешел на этап 'В работе'"
+                    )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=400)
             return Response({'message': 'Заказ запущен в работу', 'new_status': order.status})
 
         elif decision == 'reject':
@@ -520,4 +529,21 @@ class OrderCustomerActionsViewSet(ViewSet):
             return Response({'message': 'Заказ отклонен заказчиком', 'new_status': order.status})
 
         else:
-            return Response({'error': 'Некорректное решение. Ожидается "accept" или "reject".'}, status=400)
\ No newline at end of file
+            return Response({'error': 'Некорректное решение. Ожидается "accept" или "reject".'}, status=400)
+
+    def complete_order(self, request, order_id):
+        """
+        Заказчик принимает работу: удержанная стоимость заказа переводится исполнителю.
+        Может сработать на статусах 'in_progress', 'sent_for_revision', 'guaranteed_flight'.
+        """
+        order = self.get_order(order_id)
+        if isinstance(order, Response):
+            return order
+
+        if order.status not in ['in_progress', 'sent_for_revision', 'guaranteed_flight']:
+            return Response({'error': 'Заказ не находится в работе'}, status=400)
+
+        summary = settle_order_holds([order.id], 'release')
+        if not summary['settled']:
+            return Response({'error': 'По заказу нет удержанной оплаты или не назначен исполнитель'}, status=400)
+        return Response({'message': 'Заказ завершен, оплата передана исполнителю', 'new_status': 'completed'})
\ No newline at end of file
@@ -4,3 +4,10 @@ from .models import *
 admin.site.register(Balance)
 admin.site.register(WithdrawalRequest)
 admin.site.register(Transaction)
+admin.site.register(TransactionArchive)
+admin.site.register(BalanceSnapshot)
+admin.site.register(AccountStatement)
+admin.site.register(EscrowHold)
+admin.site.register(SystemAccountShard)
+admin.site.register(OutboxEvent)
+admin.site.register(OutboxConsumer)
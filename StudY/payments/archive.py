@@ -0,0 +1,46 @@
+"""
+Архивация старых транзакций: завершенные транзакции старше TRANSACTION_ARCHIVE_AFTER
+переносятся пачками в TransactionArchive с прежним id, поэтому горячая таблица и ее индексы
+не растут вместе с историей. Истории пользователей и финансового отдела читают обе таблицы.
+"""
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils.timezone import now
+
+from .models import Transaction, TransactionArchive, WithdrawalRequest
+
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_STATUSES = ('completed',)
+ARCHIVE_FIELDS = ('id', 'profile_id', 'target_profile_id', 'amount', 'transaction_type', 'comment',
+                  'status', 'error_message', 'created_at', 'dsc')
+
+
+def archivable_transactions(before):
+    # Транзакции, на которые ссылаются заявки на вывод, остаются в горячей таблице вместе с заявками
+    return (Transaction.objects
+            .filter(status__in=ARCHIVE_STATUSES, created_at__lt=before)
+            .exclude(id__in=WithdrawalRequest.objects.filter(transaction__isnull=False).values('transaction_id')))
+
+
+def archive_transactions(before=None, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """
+    Переносит транзакции, созданные раньше before, пачками по batch_size.
+    Каждая пачка копируется и удаляется в одной транзакции БД. Возвращает число перенесенных строк.
+    """
+    before = before or now() - settings.TRANSACTION_ARCHIVE_AFTER
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        # Читаем до транзакции БД: завершенные транзакции не изменяются, а на SQLite
+        # транзакция должна начинаться с записи (см. lock_balances)
+        rows = list(archivable_transactions(before).order_by('id').values(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            break
+        with db_transaction.atomic():
+            # ignore_conflicts: строка могла попасть в архив в прерванном прошлом запуске
+            TransactionArchive.objects.bulk_create([TransactionArchive(**row) for row in rows],
+                                                   batch_size=1000, ignore_conflicts=True)
+            Transaction.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+        batches += 1
+    return moved
+
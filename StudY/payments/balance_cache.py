@@ -0,0 +1,153 @@
+"""
+Кэш балансов профилей: LRU в памяти процесса поверх кэша Django.
+Движок платежей записывает новые значения после фиксации транзакции БД (write-through),
+сигналы Balance сбрасывают запись при правках вне движка (админка, get_or_create).
+
+Гарантия свежести: в процессе, где прошла операция, и в общем кэше (Redis/Memcached)
+новое значение появляется сразу после фиксации; локальная копия другого процесса
+может отставать не более чем на BALANCE_CACHE_MAX_STALENESS секунд.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction as db_transaction
+
+from .models import Balance, Profile
+
+BALANCE_FIELDS = ('fiat_balance', 'frozen_balance', 'bonus_balance', 'forfeited_balance', 'last_entry_id')
+
+
+class LRUCache:
+    """Потокобезопасный LRU со временем жизни записей (ttl=None — бессрочно)."""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic())
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def set_if_newer(self, key, value, version_field):
+        """Не дает более старому значению затереть новое, если колбэки on_commit выполнились не по порядку."""
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None and item[0][version_field] > value[version_field]:
+                return
+        self.set(key, value)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+_local = LRUCache(settings.BALANCE_CACHE_LOCAL_SIZE, ttl=settings.BALANCE_CACHE_MAX_STALENESS)
+# Профиль пользователя не меняется, поэтому соответствие user_id -> profile_id храним бессрочно
+_profile_ids = LRUCache(settings.BALANCE_CACHE_LOCAL_SIZE)
+
+
+def _cache():
+    return caches[settings.BALANCE_CACHE_ALIAS]
+
+
+def _timeout():
+    # Кэш в памяти процесса другие процессы не видят: тогда и его записи живут не дольше гарантии свежести
+    if isinstance(_cache(), (LocMemCache, DummyCache)):
+        return settings.BALANCE_CACHE_MAX_STALENESS
+    return settings.BALANCE_CACHE_TIMEOUT
+
+
+def _key(profile_id):
+    return f'balance:{profile_id}'
+
+
+def snapshot(balance):
+    return {field: getattr(balance, field) for field in BALANCE_FIELDS}
+
+
+def get_balance(profile_id):
+    """Словарь полей баланса профиля или None, если баланса нет."""
+    value = _local.get(profile_id)
+    if value is not None:
+        return value
+
+    value = _cache().get(_key(profile_id))
+    if value is None:
+        value = Balance.objects.filter(profile_id=profile_id).values(*BALANCE_FIELDS).first()
+        if value is None:
+            return None
+        # add, а не set: прочитанное из БД значение не должно затереть записанное движком после чтения
+        _cache().add(_key(profile_id), value, _timeout())
+    _local.set_if_newer(profile_id, value, 'last_entry_id')
+    return value
+
+
+def get_profile_id(user):
+    """id профиля пользователя из памяти процесса или None, если профиля нет."""
+    profile_id = _profile_ids.get(user.pk)
+    if profile_id is None:
+        profile_id = Profile.objects.filter(user_id=user.pk).values_list('id', flat=True).first()
+        if profile_id is not None:
+            _profile_ids.set(user.pk, profile_id)
+    return profile_id
+
+
+def store_balances(balances):
+    """
+    Записывает значения балансов в кэш после фиксации текущей транзакции БД.
+    Вызывается движком после изменения строк Balance, заблокированных lock_balances.
+    """
+    values = {balance.profile_id: snapshot(balance) for balance in balances}
+    if not values:
+        return
+
+    def store():
+        cache = _cache()
+        cached = cache.get_many([_key(profile_id) for profile_id in values])
+        fresh = {
+            _key(profile_id): value for profile_id, value in values.items()
+            if cached.get(_key(profile_id), value)['last_entry_id'] <= value['last_entry_id']
+        }
+        cache.set_many(fresh, _timeout())
+        for profile_id, value in values.items():
+            _local.set_if_newer(profile_id, value, 'last_entry_id')
+
+    db_transaction.on_commit(store)
+
+
+def invalidate_balances(profile_ids):
+    """Сбрасывает записи после фиксации транзакции: следующее чтение возьмет значение из БД."""
+    profile_ids = list(profile_ids)
+
+    def invalidate():
+        _cache().delete_many([_key(profile_id) for profile_id in profile_ids])
+        for profile_id in profile_ids:
+            _local.delete(profile_id)
+
+    db_transaction.on_commit(invalidate)
@@ -0,0 +1,207 @@
+"""
+Вспомогательные функции для нагрузочных прогонов платежного модуля.
+Создают и удаляют синтетических пользователей с отдельным префиксом логина,
+чтобы не затрагивать реальные данные.
+"""
+import random
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction as db_transaction
+from django.db.models import Min, Sum
+
+from .ledger import apply_system_deltas, post_opening_entries
+from .models import *
+from .money import Money
+from .reconcile import reconcile_system_accounts
+from .services import process_transaction
+
+BENCH_RANK_NAME = "bench"
+
+
+def get_bench_rank():
+    """Ранг с практически неограниченным бонусным счетом для синтетических профилей."""
+    rank, _ = Rank.objects.get_or_create(
+        rank_name=BENCH_RANK_NAME, rank_type="customer", defaults={"rank_price": 0}
+    )
+    RankSettings.objects.get_or_create(
+        rank=rank, defaults={"type_role": "customer", "bonus_account_limit": 10 ** 9}
+    )
+    return rank
+
+
+def seed_profiles(prefix, count, fiat=Decimal("0.00"), bonus=Decimal("0.00"), rank=None, frozen=Decimal("0.00")):
+    """
+    Создает `count` пользователей `<prefix>_<n>` с профилями и балансами.
+    Возвращает список профилей в порядке создания.
+    """
+    rank = rank or get_bench_rank()
+    password = make_password(None)
+    with db_transaction.atomic():
+        User.objects.bulk_create([
+            User(username=f"{prefix}_{n}", password=password, role="заказчик", is_verification=True)
+            for n in range(count)
+        ])
+        users = User.objects.filter(username__startswith=f"{prefix}_").order_by("id")
+        Profile.objects.bulk_create([Profile(user=user, rank=rank) for user in users])
+        profiles = list(Profile.objects.filter(user__in=users).select_related("user").order_by("id"))
+        Balance.objects.bulk_create([
+            Balance(profile=profile, fiat_balance=fiat, bonus_balance=bonus, frozen_balance=frozen) for profile in profiles
+        ])
+        if fiat or bonus or frozen:
+            post_opening_entries(list(Balance.objects.filter(profile__user__in=users)))
+    return profiles
+
+
+def cleanup_profiles(prefix, batch_size=5000):
+    """Удаляет синтетических пользователей вместе с профилями, балансами, транзакциями, их событиями и проводками."""
+    profiles = Profile.objects.filter(user__username__startswith=f"{prefix}_")
+    operations = LedgerEntry.objects.filter(profile__in=profiles).values("operation")
+    with db_transaction.atomic():
+        # Системные проводки прогона уходят вместе с операциями: снимаем их и с частей системных счетов
+        system = (LedgerEntry.objects.filter(operation__in=operations, profile__isnull=True)
+                  .values_list("account").annotate(total=Sum("amount")).order_by())
+        apply_system_deltas([LedgerEntry(account=account, amount=-total) for account, total in system])
+        LedgerEntry.objects.filter(operation__in=operations).delete()
+    # Транзакции удаляем пачками: каскад SET NULL по всем строкам сразу упирается в лимит параметров SQLite
+    while True:
+        ids = list(Transaction.objects.filter(profile__in=profiles).values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        OutboxEvent.objects.filter(transaction_id__in=ids).delete()
+        Transaction.objects.filter(id__in=ids).delete()
+    User.objects.filter(username__startswith=f"{prefix}_").delete()
+
+
+# Смесь операций нагрузочного прогона: тип -> (вес, диапазон суммы)
+WORKLOAD_MIX = {
+    "bonus_transfer": (40, (1, 50)),
+    "freeze": (15, (1, 50)),
+    "unfreeze": (15, (1, 50)),
+    "payment": (20, (1, 20)),
+    "withdrawal": (10, (1, 20)),
+}
+
+
+class LockWaitTimer:
+    """
+    Обертка выполнения запросов (connection.execute_wrapper), которая суммирует время запросов
+    блокировки балансов из lock_balances: SELECT ... FOR UPDATE или холостого UPDATE на SQLite.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if "payments_balance" not in sql or ("FOR UPDATE" not in sql and not sql.startswith("UPDATE")):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+
+def run_workload(prefix, seed, operations, mix=WORKLOAD_MIX):
+    """
+    Выполняет `operations` случайных операций над синтетическими профилями `prefix`.
+    Возвращает список замеров (тип, результат, сумма, задержка в секундах, ожидание блокировки в секундах);
+    результат — success, failed (отказ по бизнес-правилам) или error (исключение).
+    """
+    users = list(User.objects.filter(username__startswith=f"{prefix}_").select_related("profile"))
+    rnd = random.Random(seed)
+    types = list(mix)
+    weights = [mix[transaction_type][0] for transaction_type in types]
+    samples = []
+    timer = LockWaitTimer()
+    try:
+        with connection.execute_wrapper(timer):
+            for transaction_type in rnd.choices(types, weights, k=operations):
+                low, high = mix[transaction_type][1]
+                amount = Decimal(rnd.randint(low, high))
+                user_from, user_to = rnd.sample(users, 2)
+                timer.elapsed = 0.0
+                started = time.perf_counter()
+                try:
+                    result = process_transaction(
+                        user_from=user_from, amount=amount, transaction_type=transaction_type,
+                        user_to=user_to if transaction_type == "bonus_transfer" else None,
+                    )
+                    outcome = result["status"]
+                except Exception:
+                    outcome = "error"
+                samples.append((transaction_type, outcome, amount, time.perf_counter() - started, timer.elapsed))
+    finally:
+        connection.close()
+    return samples
+
+
+def check_invariants(prefix, opening_total, samples):
+    """
+    Проверяет балансы синтетических профилей после прогона:
+    проекции совпадают с журналом, счета не ушли в минус, проводки каждой операции дают в сумме ноль,
+    а общая сумма счетов уменьшилась ровно на успешные оплаты и выводы.
+    Части системных счетов сверяются с журналом целиком.
+    """
+
+    profiles = Profile.objects.filter(user__username__startswith=f"{prefix}_")
+    balances = Balance.objects.filter(profile__in=profiles)
+    fields = dict(LedgerEntry.PROFILE_ACCOUNTS)
+    aggregates = balances.aggregate(
+        **{account: Sum(field) for account, field in fields.items()},
+        **{f"{account}_min": Min(field) for account, field in fields.items()},
+    )
+    journal = dict(LedgerEntry.objects.filter(profile__in=profiles).values_list("account").annotate(total=Sum("amount")))
+    operations = LedgerEntry.objects.filter(profile__in=profiles).values("operation")
+    unbalanced = (LedgerEntry.objects.filter(operation__in=operations).values("operation")
+                  .annotate(total=Sum("amount")).exclude(total=0).count())
+
+    spent = sum(amount for transaction_type, outcome, amount, _, _ in samples
+                if outcome == "success" and transaction_type in ("payment", "withdrawal"))
+    total = sum(aggregates[account] or 0 for account in fields)
+    expected_total = opening_total - spent
+    mismatched = [account for account in fields if Money.of(aggregates[account] or 0) != journal.get(account, 0)]
+    negative = [account for account in fields if (aggregates[f"{account}_min"] or 0) < 0]
+    system_mismatch = [drift["account"] for drift in reconcile_system_accounts()]
+    return {
+        "ok": not mismatched and not negative and not unbalanced and not system_mismatch and total == expected_total,
+        "total": str(total),
+        "expected_total": str(expected_total),
+        "ledger_mismatch": mismatched,
+        "negative_accounts": negative,
+        "unbalanced_operations": unbalanced,
+        "system_account_mismatch": system_mismatch,
+    }
+
+
+def summarize(samples, elapsed):
+    """Пропускная способность, перцентили задержки и доля ожидания блокировок по замерам прогона."""
+    def stats(rows):
+        latencies = np.array([row[3] for row in rows]) * 1000
+        lock_waits = np.array([row[4] for row in rows]) * 1000
+        outcomes = {outcome: sum(row[1] == outcome for row in rows) for outcome in ("success", "failed", "error")}
+        return {
+            "operations": len(rows),
+            **outcomes,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "max_ms": round(float(latencies.max()), 3),
+            "lock_wait_p50_ms": round(float(np.percentile(lock_waits, 50)), 3),
+            "lock_wait_p99_ms": round(float(np.percentile(lock_waits, 99)), 3),
+            "lock_wait_total_ms": round(float(lock_waits.sum()), 3),
+            "lock_wait_share": round(float(lock_waits.sum() / latencies.sum()), 4) if latencies.sum() else 0.0,
+        }
+
+    if not samples:
+        return {"operations": 0, "elapsed_s": round(elapsed, 3), "ops_per_sec": 0.0, "by_type": {}}
+    by_type = {}
+    for row in samples:
+        by_type.setdefault(row[0], []).append(row)
+    return {
+        **stats(samples),
+        "elapsed_s": round(elapsed, 3),
+        "ops_per_sec": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "by_type": {transaction_type: stats(rows) for transaction_type, rows in sorted(by_type.items())},
+    }
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+# Бэкенды, которые хранят данные в памяти одного процесса (или не хранят вовсе)
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+@register(Tags.caches)
+def check_velocity_cache(app_configs, **kwargs):
+    """
+    Счетчики VELOCITY_RULES должны быть общими для всех процессов: в кэше процесса
+    каждый воркер считает свои окна, и лимиты умножаются на число воркеров.
+    Бэкенд должен импортироваться и отвечать: без него переводы с правилами получают 503.
+    """
+    if not any(settings.VELOCITY_RULES.values()):
+        return []
+    alias = settings.VELOCITY_CACHE_ALIAS
+    try:
+        cache = caches[alias]
+        if isinstance(cache, PROCESS_LOCAL_CACHES):
+            return [Error(
+                f"Кэш '{alias}' ({type(cache).__name__}) хранит счетчики VELOCITY_RULES в памяти процесса",
+                hint="Укажите в VELOCITY_CACHE_ALIAS общий бэкенд CACHES (Redis, Memcached) "
+                     "или отключите правила: VELOCITY_RULES = {}.",
+                id='payments.E001',
+            )]
+        # Клиент бэкенда (например, пакет redis) импортируется при первом обращении
+        cache.get('velocity:check')
+    except Exception as exc:
+        return [Error(
+            f"Кэш '{alias}' для счетчиков VELOCITY_RULES недоступен: {type(exc).__name__}: {exc}",
+            hint="Установите клиент бэкенда (pip install -r requirements.txt), проверьте LOCATION в CACHES "
+                 "или отключите правила: VELOCITY_RULES = {}.",
+            id='payments.E002',
+        )]
+    return []
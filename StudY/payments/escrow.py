@@ -0,0 +1,150 @@
+"""
+Удержания по заказам (EscrowHold).
+Когда заказ переходит в работу, его стоимость переносится с фиатного счета заказчика на системный
+счет escrow и записывается отдельная строка удержания. По завершении заказа удержания закрываются
+пакетом: один условный UPDATE закрывает строки удержаний, проводки и транзакции пишутся bulk_create,
+балансы получателей обновляются одним bulk_update на пачку.
+"""
+import uuid
+from collections import defaultdict
+
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.utils.timezone import now
+
+from order.models import Order, OrderStatusLog
+
+from .balance_cache import store_balances
+from .fees import quantize_money
+from .ledger import LedgerOperation, apply_system_deltas, lock_balances
+from .models import Balance, EscrowHold, LedgerEntry, Transaction
+from .outbox import publish_transactions
+from .services import NO_ERROR_MESSAGE, create_transaction
+from .statements import invalidate_late_statements
+
+ESCROW_BATCH_LIMIT = 500
+
+# Действие -> (статус удержания, тип транзакции получателя, статус заказа)
+SETTLEMENT_ACTIONS = {
+    'release': ('released', 'escrow_release', 'completed'),
+    'refund': ('refunded', 'refund', 'rejected_customer'),
+}
+# Статусы отмены заказа: удержание по такому заказу возвращается заказчику
+CANCELLED_ORDER_STATUSES = ('not_accepted_customer', 'rejected_executor', 'rejected_customer')
+
+
+def hold_order_funds(order):
+    """
+    Переносит стоимость заказа с фиатного счета заказчика в удержание.
+    Выбрасывает ValueError, если средств не хватает или заказ уже оплачен.
+    """
+    amount = quantize_money(order.cost)
+    with db_transaction.atomic():
+        balance = lock_balances(order.customer_id)[order.customer_id]
+        if EscrowHold.objects.filter(order=order, status='held').exists():
+            raise ValueError("Заказ уже оплачен")
+        if balance.fiat_balance < amount:
+            raise ValueError(f"Недостаточно средств для оплаты заказа. Не хватает {amount - balance.fiat_balance}р")
+
+        ledger = LedgerOperation()
+        ledger.move(amount, (balance, "fiat"), "escrow")
+        transaction = create_transaction(order.customer, amount, "escrow_hold", f"Оплата заказа №{order.pk}",
+                                         target_profile=order.performer)
+        ledger.commit(transaction)
+        return EscrowHold.objects.create(profile_id=order.customer_id, order=order, amount=amount)
+
+
+def get_escrow_totals(profile_ids):
+    """Суммы действующих удержаний профилей: {profile_id: сумма}."""
+    rows = (EscrowHold.objects
+            .filter(profile_id__in=profile_ids, status='held')
+            .values_list('profile_id')
+            .annotate(total=Sum('amount'))
+            .order_by())
+    return {profile_id: quantize_money(total) for profile_id, total in rows}
+
+
+def settle_order_holds(order_ids, action, comment="", order_status=None):
+    """
+    Закрывает удержания заказов пакетами по ESCROW_BATCH_LIMIT: release — выплата исполнителю
+    и статус заказа completed, refund — возврат заказчику и статус rejected_customer
+    (или order_status, если он задан). Заказы без действующего удержания
+    (или без исполнителя при release) пропускаются.
+    Возвращает сводку: закрыто, сумма, пропущенные заказы.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    summary = {"settled": 0, "total": quantize_money(0), "skipped": []}
+    for offset in range(0, len(order_ids), ESCROW_BATCH_LIMIT):
+        _settle_chunk(order_ids[offset:offset + ESCROW_BATCH_LIMIT], action, comment, summary, order_status)
+    return summary
+
+
+def refund_cancelled_order(order):
+    """Возвращает заказчику удержание отмененного заказа; статус отмены заказа сохраняется."""
+    if order.status not in CANCELLED_ORDER_STATUSES:
+        return None
+    if not EscrowHold.objects.filter(order_id=order.pk, status='held').exists():
+        return None
+    return settle_order_holds([order.pk], 'refund', "Возврат оплаты по отмененному заказу", order_status=order.status)
+
+
+def _settle_chunk(order_ids, action, comment, summary, order_status=None):
+    hold_status, transaction_type, default_order_status = SETTLEMENT_ACTIONS[action]
+    order_status = order_status or default_order_status
+    eligible = EscrowHold.objects.filter(order_id__in=order_ids, status='held')
+    if action == 'release':
+        eligible = eligible.filter(order__performer__isnull=False)
+    settlement = uuid.uuid4()
+    timestamp = now()
+
+    with db_transaction.atomic():
+        # Сначала запись: условный UPDATE закрывает удержания, параллельный расчет тех же заказов их уже не получит
+        eligible.update(status=hold_status, settlement=settlement, settled_at=timestamp)
+        holds = list(EscrowHold.objects.filter(settlement=settlement)
+                     .values('id', 'order_id', 'profile_id', 'order__performer_id', 'amount'))
+        settled = {hold['order_id'] for hold in holds}
+        summary["skipped"].extend(order_id for order_id in order_ids if order_id not in settled)
+        if not holds:
+            return
+
+        recipient = 'order__performer_id' if action == 'release' else 'profile_id'
+        balances = lock_balances(*{hold[recipient] for hold in holds})
+
+        transactions = Transaction.objects.bulk_create([
+            Transaction(profile_id=hold[recipient], amount=hold['amount'], transaction_type=transaction_type,
+                        comment=comment or f"Расчет по заказу №{hold['order_id']}", status="completed",
+                        error_message=NO_ERROR_MESSAGE)
+            for hold in holds
+        ], batch_size=500)
+        publish_transactions(transactions)
+        invalidate_late_statements(transactions)
+        entries = []
+        deltas = defaultdict(lambda: quantize_money(0))
+        for transaction, hold in zip(transactions, holds):
+            operation = uuid.uuid4()
+            entries.append(LedgerEntry(operation=operation, transaction=transaction, account="escrow",
+                                       amount=-hold['amount']))
+            entries.append(LedgerEntry(operation=operation, transaction=transaction,
+                                       profile_id=hold[recipient], account="fiat", amount=hold['amount']))
+            deltas[hold[recipient]] += hold['amount']
+        entries = LedgerEntry.objects.bulk_create(entries, batch_size=500)
+        apply_system_deltas(entries, settlement)
+
+        for entry in entries:
+            if entry.profile_id and entry.pk:
+                balance = balances[entry.profile_id]
+                balance.last_entry_id = max(balance.last_entry_id, entry.pk)
+        for profile_id, delta in deltas.items():
+            balances[profile_id].fiat_balance += delta
+        Balance.objects.bulk_update(list(balances.values()), ['fiat_balance', 'last_entry_id'], batch_size=500)
+        store_balances(balances.values())
+
+        Order.objects.filter(id__in=settled).update(status=order_status, last_modified_at=timestamp)
+        OrderStatusLog.objects.bulk_create([
+            OrderStatusLog(order_id=order_id, status=order_status,
+                           comment="Оплата передана исполнителю" if action == 'release' else "Оплата возвращена заказчику")
+            for order_id in settled
+        ])
+
+    summary["settled"] += len(holds)
+    summary["total"] += sum(hold['amount'] for hold in holds)
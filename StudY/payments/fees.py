@@ -0,0 +1,78 @@
+"""
+Расчет комиссий и бонусов по рангам.
+Настройки всех рангов загружаются одним запросом и хранятся в памяти процесса,
+поэтому платежи считают сборы без запросов к RankSettings.
+Таблицы сбрасываются сигналами RankSettings в процессе, где прошла правка, и перечитываются
+остальными процессами не позже чем через RANK_TABLES_MAX_STALENESS секунд.
+
+Правила округления денежных сумм заданы здесь: до копеек, половина — вверх.
+"""
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from rank.models import RankSettings
+
+MONEY_QUANT = Decimal("0.01")
+MONEY_ROUNDING = ROUND_HALF_UP
+HUNDRED = Decimal(100)
+
+
+def quantize_money(value):
+    """Округляет сумму до копеек по правилам MONEY_ROUNDING."""
+    return Decimal(value).quantize(MONEY_QUANT, rounding=MONEY_ROUNDING)
+
+
+def percent_of(amount, percent):
+    """Доля percent процентов от суммы, округленная до копеек."""
+    return quantize_money(Decimal(amount) * Decimal(percent) / HUNDRED)
+
+
+_tables = None  # (время загрузки, {rank_id: значения RankSettings})
+_lock = threading.Lock()
+
+
+def _get_tables():
+    global _tables
+    tables = _tables
+    if tables is None or time.monotonic() - tables[0] > settings.RANK_TABLES_MAX_STALENESS:
+        with _lock:
+            tables = _tables
+            if tables is None or time.monotonic() - tables[0] > settings.RANK_TABLES_MAX_STALENESS:
+                rows = {row['rank_id']: row for row in RankSettings.objects.values()}
+                tables = _tables = (time.monotonic(), rows)
+    return tables
+
+
+def get_rank_settings(rank_id):
+    """Значения полей RankSettings ранга или None, если настроек нет."""
+    return _get_tables()[1].get(rank_id)
+
+
+def get_bonus_account_limits():
+    """Лимиты бонусного счета всех рангов: {rank_id: лимит}."""
+    return {rank_id: row['bonus_account_limit'] for rank_id, row in _get_tables()[1].items()}
+
+
+def invalidate_rank_tables():
+    """Сбрасывает таблицы после фиксации транзакции: следующее обращение перечитает настройки."""
+    def invalidate():
+        global _tables
+        _tables = None
+
+    db_transaction.on_commit(invalidate)
+
+
+def commission_amount(amount, percent):
+    """Комиссия percent процентов с суммы, округленная до копеек."""
+    if not percent:
+        return Decimal("0.00")
+    return percent_of(amount, percent)
+
+
+def with_bonus_percent(amount, percent):
+    """Сумма бонуса с надбавкой percent процентов (бонус реферера по его рангу)."""
+    return quantize_money(Decimal(amount) * (1 + Decimal(percent) / HUNDRED))
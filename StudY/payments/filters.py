@@ -1,5 +1,7 @@
 import django_filters
-from .models import Transaction
+
+from server.search import filter_users_by_username
+from .models import Profile, Transaction, TransactionDailyRollup, User
 
 
 class TransactionFilter(django_filters.FilterSet):
@@ -15,7 +17,7 @@ class TransactionFilter(django_filters.FilterSet):
 
 
 class TransactionForFinanceFilter(django_filters.FilterSet):
-    username = django_filters.CharFilter(field_name='profile__user__username', lookup_expr='icontains', label='По имени пользователя')
+    username = django_filters.CharFilter(method='filter_username', label='По имени пользователя')
     transaction_type = django_filters.ChoiceFilter(choices=Transaction.TRANSACTION_TYPES, label='Тип транзакции')
     amount_min = django_filters.NumberFilter(field_name='amount', lookup_expr='gte', label='Минимальная сумма')
     amount_max = django_filters.NumberFilter(field_name='amount', lookup_expr='lte', label='Максимальная сумма')
@@ -26,3 +28,18 @@ class TransactionForFinanceFilter(django_filters.FilterSet):
         model = Transaction
         fields = ['username', 'transaction_type', 'amount_min', 'amount_max', 'date_min', 'date_max']
 
+    def filter_username(self, queryset, name, value):
+        # Сначала находим профили по индексу логинов, затем транзакции по индексу profile_id
+        users = filter_users_by_username(User.objects.all(), value)
+        return queryset.filter(profile__in=Profile.objects.filter(user__in=users).values('id'))
+
+
+class TransactionRollupFilter(django_filters.FilterSet):
+    transaction_type = django_filters.ChoiceFilter(choices=Transaction.TRANSACTION_TYPES, label='Тип транзакции')
+    status = django_filters.ChoiceFilter(choices=Transaction.STATUS_CHOICES, label='Статус')
+    date_min = django_filters.DateFilter(field_name='day', lookup_expr='gte', label='Дата с')
+    date_max = django_filters.DateFilter(field_name='day', lookup_expr='lte', label='Дата по')
+
+    class Meta:
+        model = TransactionDailyRollup
+        fields = ['transaction_type', 'status', 'date_min', 'date_max']
@@ -0,0 +1,77 @@
+"""
+Клиенты платежных шлюзов для выплат по заявкам на вывод.
+Класс шлюза задается настройкой PAYOUT_GATEWAY, параметры конструктора — PAYOUT_GATEWAY_OPTIONS.
+"""
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+class PayoutError(Exception):
+    """Шлюз не выполнил выплату. retryable=False — окончательный отказ, повторять бессмысленно."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class BasePayoutGateway:
+    def payout(self, withdrawal_request, idempotency_key):
+        """
+        Выплачивает сумму заявки на карту. Возвращает (идентификатор выплаты, сообщение шлюза)
+        или выбрасывает PayoutError. Повтор с тем же idempotency_key не должен платить дважды.
+        """
+        raise NotImplementedError
+
+
+class StubPayoutGateway(BasePayoutGateway):
+    """
+    Локальная заглушка шлюза для разработки и нагрузочных прогонов:
+    задержка ответа, доля временных сбоев (failure_rate) и окончательных отказов (decline_rate).
+    Денег не переводит, поэтому работает только при DEBUG.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.2, failure_rate=0.1, decline_rate=0.02, seed=None):
+        if not settings.DEBUG:
+            raise ImproperlyConfigured("StubPayoutGateway не переводит деньги и доступен только при DEBUG")
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.random = random.Random(seed)
+        self.completed = {}
+        self.lock = threading.Lock()
+
+    def payout(self, withdrawal_request, idempotency_key):
+        with self.lock:
+            if idempotency_key in self.completed:
+                return self.completed[idempotency_key], "Повтор выплаты, возвращен прежний результат"
+            roll = self.random.random()
+            delay = max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0)
+        time.sleep(delay)
+
+        if roll < self.decline_rate:
+            raise PayoutError("Банк-эмитент отклонил выплату", retryable=False)
+        if roll < self.decline_rate + self.failure_rate:
+            raise PayoutError("Шлюз не ответил вовремя")
+
+        reference = f"stub-{uuid.uuid4().hex[:16]}"
+        with self.lock:
+            self.completed[idempotency_key] = reference
+        return reference, f"Заглушка шлюза: выплата {withdrawal_request.amount}р принята, деньги не переводились"
+
+
+def payouts_enabled():
+    """Без PAYOUT_GATEWAY выплата проводится сразу при одобрении заявки, без очереди."""
+    return bool(getattr(settings, 'PAYOUT_GATEWAY', None))
+
+
+def get_payout_gateway():
+    if not payouts_enabled():
+        raise ImproperlyConfigured("Шлюз выплат не задан: PAYOUT_GATEWAY = None")
+    return import_string(settings.PAYOUT_GATEWAY)(**getattr(settings, 'PAYOUT_GATEWAY_OPTIONS', {}))
@@ -0,0 +1,107 @@
+"""
+Идемпотентность денежных операций по заголовку Idempotency-Key.
+
+Первый запрос с ключом занимает запись (уникальная пара пользователь + ключ) и выполняется,
+ответ сохраняется. Повтор с тем же ключом и телом получает сохраненный ответ без повторного
+выполнения операции; параллельный дубль ждет завершения первого запроса.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(request):
+    """Отпечаток запроса: метод, путь и тело в каноническом виде."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _claim_key(user, key, fingerprint):
+    """Занимает ключ. Возвращает (запись, создана_ли_она_этим_запросом)."""
+    now = timezone.now()
+    IdempotencyKey.objects.filter(user=user, key=key, expires_at__lte=now).delete()
+    try:
+        with db_transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint,
+                expires_at=now + getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+
+
+def _wait_for_result(record):
+    """Ждет, пока параллельный запрос с тем же ключом сохранит ответ."""
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_KEY_WAIT', 5)
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Декоратор метода APIView: повтор запроса с тем же Idempotency-Key возвращает сохраненный ответ."""
+
+    @wraps(view_method)
+    def _wrapped_view(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 64:
+            return Response({"error": f"Заголовок {IDEMPOTENCY_HEADER} длиннее 64 символов"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, created = _claim_key(request.user, key, fingerprint)
+
+        if not created:
+            if record is None:
+                return Response({"error": "Запрос с этим ключом уже обрабатывается, повторите позже"},
+                                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+            if record.fingerprint != fingerprint:
+                return Response({"error": "Ключ идемпотентности уже использован для другого запроса"},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            record = _wait_for_result(record)
+            if record is None or record.status_code is None:
+                return Response({"error": "Запрос с этим ключом уже обрабатывается, повторите позже"},
+                                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+            return _replay(record)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            # Ошибку сервера не запоминаем, чтобы клиент мог повторить запрос
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status_code', 'response_body'])
+        return response
+
+    return _wrapped_view
@@ -0,0 +1,104 @@
+"""
+Сводка расходов и поступлений профиля по типам транзакций и месяцам.
+Итоги считаются одним сгруппированным запросом по каждой таблице транзакций (горячей и архиву)
+по индексу (profile, status, created_at, id). Готовая сводка хранится в кэше под ключом с
+Balance.last_entry_id: любая проводка профиля меняет ключ, поэтому сбрасывать записи не нужно.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .balance_cache import get_balance
+from .fees import quantize_money
+from .models import Transaction, TransactionArchive
+from .statements import month_bounds
+
+SOURCES = (Transaction, TransactionArchive)
+
+# Направление типа для строки профиля-владельца транзакции; остальные типы (заморозка,
+# упущенная прибыль) деньги профиля не тратят и не приносят и попадают только в итоги по типам
+EARNING_TYPES = {'bonus_add', 'deposit', 'refund', 'compensation', 'escrow_release'}
+SPENDING_TYPES = {'bonus_transfer', 'withdrawal', 'payment', 'payment_bonus', 'payment_mixed', 'penalty',
+                  'fiat_transfer', 'escrow_hold'}
+
+
+def direction(transaction_type):
+    if transaction_type in EARNING_TYPES:
+        return 'earned'
+    if transaction_type in SPENDING_TYPES:
+        return 'spent'
+    return None
+
+
+def first_month(months):
+    """Первый день месяца, с которого начинается сводка за months последних месяцев, включая текущий."""
+    today = timezone.localdate()
+    index = today.year * 12 + today.month - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def insights_cache_key(profile_id, start, last_entry_id):
+    return f'insights:{profile_id}:{start:%Y-%m}:{last_entry_id}'
+
+
+def build_insights(profile_id, start):
+    """Итоги завершенных транзакций профиля с месяца start: по типам и по месяцам."""
+    by_type = defaultdict(lambda: [0, 0])
+    by_month = defaultdict(lambda: {'count': 0, 'earned': 0, 'spent': 0})
+    for model in SOURCES:
+        rows = (model.objects
+                .filter(profile_id=profile_id, status='completed', created_at__gte=month_bounds(start)[0])
+                .annotate(month=TruncMonth('created_at'))
+                .values('month', 'transaction_type')
+                .annotate(count=Count('id'), total=Sum('amount'))
+                .order_by())
+        for row in rows:
+            by_type[row['transaction_type']][0] += row['count']
+            by_type[row['transaction_type']][1] += row['total']
+            month = by_month[row['month'].date()]
+            month['count'] += row['count']
+            kind = direction(row['transaction_type'])
+            if kind:
+                month[kind] += row['total']
+
+    types = dict(Transaction.TRANSACTION_TYPES)
+    return {
+        'since': start,
+        'types': [{
+            'transaction_type': transaction_type,
+            'transaction_type_display': types.get(transaction_type, transaction_type),
+            'direction': direction(transaction_type),
+            'count': count,
+            'total': quantize_money(total),
+        } for transaction_type, (count, total) in sorted(by_type.items())],
+        'months': [{
+            'month': f'{month:%Y-%m}',
+            'count': values['count'],
+            'earned': quantize_money(values['earned']),
+            'spent': quantize_money(values['spent']),
+        } for month, values in sorted(by_month.items())],
+    }
+
+
+def get_insights(profile_id, months):
+    """
+    Сводка из кэша или свежая. Ключ берется до запроса итогов, поэтому в кэше не окажется
+    сводки старше своей проводки; в другом процессе ключ может отставать от проводок
+    на BALANCE_CACHE_MAX_STALENESS секунд.
+    """
+    start = first_month(months)
+    balance = get_balance(profile_id)
+    last_entry_id = balance['last_entry_id'] if balance else 0
+    key = insights_cache_key(profile_id, start, last_entry_id)
+    cache = caches[settings.INSIGHTS_CACHE_ALIAS]
+    data = cache.get(key)
+    if data is None:
+        data = build_insights(profile_id, start)
+        data['last_entry_id'] = last_entry_id
+        cache.set(key, data, settings.INSIGHTS_CACHE_TIMEOUT)
+    return key, data
@@ -0,0 +1,219 @@
+"""
+Движок балансов: блокировка строк Balance, атомарное применение изменений
+и двойная запись операций в журнал проводок LedgerEntry.
+"""
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Max, Sum
+
+from .balance_cache import store_balances
+from .fees import quantize_money
+from .models import Balance, LedgerEntry, SystemAccountShard
+from .money import Money
+
+
+def lock_balances(*profiles):
+    """
+    Блокирует строки балансов профилей в фиксированном порядке (по id профиля),
+    чтобы встречные переводы не приводили к взаимоблокировкам. Принимает профили или их id.
+    Возвращает словарь {profile_id: Balance}. Вызывается только внутри atomic().
+    """
+    profile_ids = sorted({getattr(profile, 'pk', profile) for profile in profiles if profile is not None})
+    queryset = Balance.objects.filter(profile_id__in=profile_ids).order_by('profile_id')
+
+    if connections[queryset.db].features.has_select_for_update:
+        balances = list(queryset.select_for_update())
+    else:
+        # SQLite не поддерживает SELECT ... FOR UPDATE: холостой UPDATE сразу берет
+        # блокировку записи до конца транзакции, поэтому прочитанные ниже значения не устареют
+        queryset.update(profile_id=F('profile_id'))
+        balances = list(queryset)
+
+    locked = {balance.profile_id: balance for balance in balances}
+    if len(locked) != len(profile_ids):
+        raise Balance.DoesNotExist("Баланс пользователя не найден")
+    return locked
+
+
+def apply_balance_deltas(balance, last_entry_id=None, **deltas):
+    """
+    Применяет изменения к балансу одним UPDATE через F()-выражения.
+    Для списаний добавляется условие `поле >= сумма`, поэтому счет не уходит в минус
+    даже при гонке. Записываются только изменённые столбцы и контрольная точка журнала.
+    """
+    deltas = {
+        field: quantize_money(delta)
+        for field, delta in deltas.items() if delta
+    }
+    if not deltas:
+        return balance
+
+    conditions = {f"{field}__gte": -delta for field, delta in deltas.items() if delta < 0}
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if last_entry_id:
+        changes['last_entry_id'] = last_entry_id
+
+    updated = Balance.objects.filter(pk=balance.pk, **conditions).update(**changes)
+    if not updated:
+        raise ValueError("Недостаточно средств на счете.")
+
+    for field, delta in deltas.items():
+        setattr(balance, field, getattr(balance, field) + delta)
+    if last_entry_id:
+        balance.last_entry_id = last_entry_id
+    return balance
+
+
+def apply_system_deltas(entries, key=None):
+    """
+    Переносит проводки системных счетов из entries в строки SystemAccountShard.
+    Все системные проводки вызова попадают в одну часть, выбранную по ключу операции (UUID),
+    части разных счетов обновляются в порядке названий счетов: параллельные операции
+    не ждут друг друга по кругу. Вызывается в той же транзакции БД, что и запись проводок.
+    """
+    deltas = defaultdict(Money)
+    for entry in entries:
+        if entry.profile_id is None:
+            deltas[entry.account] += Money.of(entry.amount)
+    shard = (key or uuid.uuid4()).int % settings.SYSTEM_ACCOUNT_SHARDS
+
+    for account in sorted(deltas):
+        if not deltas[account]:
+            continue
+        queryset = SystemAccountShard.objects.filter(account=account, shard=shard)
+        if not queryset.update(balance=F('balance') + deltas[account].minor):
+            # Первая проводка в эту часть: создаем строку и повторяем UPDATE
+            SystemAccountShard.objects.bulk_create([SystemAccountShard(account=account, shard=shard)],
+                                                   ignore_conflicts=True)
+            queryset.update(balance=F('balance') + deltas[account].minor)
+
+
+def get_system_balances():
+    """Остатки системных счетов: {счет: сумма частей в Money}."""
+    return dict(SystemAccountShard.objects.values_list('account').annotate(total=Sum('balance')).order_by('account'))
+
+
+class LedgerOperation:
+    """
+    Проводки одной операции. Счет пользователя задается парой (Balance, 'bonus'),
+    системный счет — его названием ('external', 'bonus_fund', 'revenue', 'commission').
+    """
+
+    def __init__(self):
+        self.operation = uuid.uuid4()
+        self.postings = []
+
+    def move(self, amount, source, target):
+        """Переносит сумму со счета source на счет target."""
+        amount = quantize_money(amount)
+        if amount:
+            self.postings.append((source, -amount))
+            self.postings.append((target, amount))
+
+    def commit(self, transaction=None):
+        """
+        Записывает проводки одной вставкой и обновляет проекции затронутых балансов.
+        Возвращает созданные проводки.
+        """
+        entries = []
+        balances = {}
+        deltas = defaultdict(lambda: defaultdict(Decimal))
+
+        for account, amount in self.postings:
+            if isinstance(account, tuple):
+                balance, account = account
+                balances[balance.pk] = balance
+                deltas[balance.pk][LedgerEntry.PROFILE_ACCOUNTS[account]] += amount
+                profile_id = balance.profile_id
+            else:
+                profile_id = None
+            entries.append(LedgerEntry(operation=self.operation, transaction=transaction,
+                                       profile_id=profile_id, account=account, amount=amount))
+
+        entries = LedgerEntry.objects.bulk_create(entries)
+        apply_system_deltas(entries, self.operation)
+        last_entry_id = max((entry.pk for entry in entries if entry.pk), default=None)
+        for balance_id, fields in deltas.items():
+            apply_balance_deltas(balances[balance_id], last_entry_id=last_entry_id, **fields)
+        store_balances(balances.values())
+
+        self.postings = []
+        return entries
+
+
+def sync_balance(balance):
+    """
+    Догоняет проекцию баланса по проводкам, записанным после контрольной точки last_entry_id.
+    Вызывается внутри atomic() после lock_balances.
+    """
+    rows = (LedgerEntry.objects
+            .filter(profile_id=balance.profile_id, id__gt=balance.last_entry_id)
+            .values('account')
+            .annotate(total=Sum('amount'), last_id=Max('id')))
+    deltas = {}
+    last_entry_id = None
+    for row in rows:
+        deltas[LedgerEntry.PROFILE_ACCOUNTS[row['account']]] = row['total'].amount
+        last_entry_id = max(last_entry_id or 0, row['last_id'])
+    if last_entry_id:
+        Balance.objects.filter(pk=balance.pk).update(
+            last_entry_id=last_entry_id,
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        balance.refresh_from_db()
+        store_balances([balance])
+    return balance
+
+
+def rebuild_balance(balance):
+    """
+    Пересчитывает проекцию баланса целиком по журналу проводок.
+    Исправляет расхождения после правок баланса в обход движка. Вызывается внутри atomic() после lock_balances.
+    """
+    totals = dict(LedgerEntry.objects
+                  .filter(profile_id=balance.profile_id)
+                  .values_list('account')
+                  .annotate(total=Sum('amount')))
+    last_entry_id = (LedgerEntry.objects.filter(profile_id=balance.profile_id)
+                     .aggregate(last=Max('id'))['last'] or 0)
+    for account, field in LedgerEntry.PROFILE_ACCOUNTS.items():
+        setattr(balance, field, totals[account].amount if account in totals else quantize_money(0))
+    balance.last_entry_id = last_entry_id
+    Balance.objects.filter(pk=balance.pk).update(
+        last_entry_id=last_entry_id,
+        **{field: getattr(balance, field) for field in LedgerEntry.PROFILE_ACCOUNTS.values()}
+    )
+    store_balances([balance])
+    return balance
+
+
+def post_opening_entries(balances):
+    """
+    Записывает текущие остатки балансов проводками со счета начальных остатков
+    и ставит контрольную точку проекции. Используется при первичном заполнении журнала.
+    """
+    entries = []
+    for balance in balances:
+        operation = uuid.uuid4()
+        for account, field in LedgerEntry.PROFILE_ACCOUNTS.items():
+            amount = getattr(balance, field)
+            if amount:
+                entries.append(LedgerEntry(operation=operation, profile_id=None, account='opening', amount=-amount))
+                entries.append(LedgerEntry(operation=operation, profile_id=balance.profile_id,
+                                           account=account, amount=amount))
+    entries = LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+    apply_system_deltas(entries)
+
+    last_ids = {}
+    for entry in entries:
+        if entry.profile_id and entry.pk:
+            last_ids[entry.profile_id] = max(last_ids.get(entry.profile_id, 0), entry.pk)
+    for balance in balances:
+        balance.last_entry_id = last_ids.get(balance.profile_id, balance.last_entry_id)
+    Balance.objects.bulk_update(balances, ['last_entry_id'], batch_size=1000)
+    store_balances(balances)
+    return entries
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.archive import ARCHIVE_BATCH_SIZE, archive_transactions
+from payments.models import Transaction, TransactionArchive
+
+
+class Command(BaseCommand):
+    help = "Переносит завершенные транзакции старше TRANSACTION_ARCHIVE_AFTER в архив"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int,
+                            help="Переносить транзакции старше указанного числа дней вместо TRANSACTION_ARCHIVE_AFTER")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Строк в одной пачке")
+        parser.add_argument("--max-batches", type=int, help="Остановиться после указанного числа пачек")
+
+    def handle(self, *args, **options):
+        horizon = (timedelta(days=options["older_than_days"]) if options["older_than_days"] is not None
+                   else settings.TRANSACTION_ARCHIVE_AFTER)
+        before = timezone.now() - horizon
+
+        started = time.perf_counter()
+        moved = archive_transactions(before, batch_size=options["batch_size"], max_batches=options["max_batches"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено в архив: {moved} транзакций до {before:%Y-%m-%d %H:%M} за {time.perf_counter() - started:.1f}с. "
+            f"В рабочей таблице {Transaction.objects.count()}, в архиве {TransactionArchive.objects.count()}"
+        ))
@@ -0,0 +1,67 @@
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.velocity import VelocityRule, backtest_rules, get_rules
+
+
+def _parse_date(value):
+    try:
+        return timezone.make_aware(datetime.strptime(value, "%Y-%m-%d"))
+    except ValueError:
+        raise CommandError("Дата указывается в формате ГГГГ-ММ-ДД")
+
+
+class Command(BaseCommand):
+    help = ("Прогоняет ограничения частоты переводов по истории транзакций и показывает, "
+            "сколько переводов и профилей отклонило бы каждое правило")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", default="bonus_transfer", help="Тип транзакций с правилами в VELOCITY_RULES")
+        parser.add_argument("--since", help="С даты ГГГГ-ММ-ДД")
+        parser.add_argument("--until", help="До даты ГГГГ-ММ-ДД, не включая")
+        parser.add_argument("--limit", action="append", default=[], metavar="ПРАВИЛО=ЛИМИТ",
+                            help="Проверить правило с другим лимитом, можно указать несколько раз")
+        parser.add_argument("--top", type=int, default=10, help="Сколько профилей с нарушениями показать")
+        parser.add_argument("--output", help="JSON-файл с результатами")
+
+    def handle(self, *args, **options):
+        rules = {rule.name: rule for rule in get_rules(options["type"])}
+        for override in options["limit"]:
+            name, _, limit = override.partition("=")
+            if name not in rules or not limit:
+                raise CommandError(f"Ожидается ПРАВИЛО=ЛИМИТ, правила: {', '.join(rules) or 'нет'}")
+            rule = rules[name]
+            rules[name] = VelocityRule.from_settings(
+                {"name": name, "metric": rule.metric, "window": rule.window, "limit": limit}
+            )
+        if not rules:
+            raise CommandError(f"Для {options['type']} не заданы правила в VELOCITY_RULES")
+
+        started = time.perf_counter()
+        report = backtest_rules(
+            list(rules.values()), options["type"],
+            since=_parse_date(options["since"]) if options["since"] else None,
+            until=_parse_date(options["until"]) if options["until"] else None,
+            top=options["top"],
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Переводов: {report['transfers']}, профилей: {report['profiles']}, за {elapsed:.2f}с")
+        for result in report["rules"]:
+            self.stdout.write(
+                f"{result['rule']} ({result['metric']} за {result['window']}с, лимит {result['limit']}): "
+                f"отклонено переводов {result['flagged_transfers']}, профилей {result['flagged_profiles']}, "
+                f"максимум {result['max_value']}"
+            )
+            for row in result["top_profiles"]:
+                self.stdout.write(f"  профиль {row['profile_id']}: {row['flagged']}")
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+        self.stdout.write(self.style.SUCCESS("Готово"))
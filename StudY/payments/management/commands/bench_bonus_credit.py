@@ -0,0 +1,58 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from payments.bench import cleanup_profiles, seed_profiles
+from payments.models import Balance, LedgerEntry
+from payments.services import bulk_credit_bonuses, process_transaction
+
+
+class Command(BaseCommand):
+    help = "Замер пропускной способности массового начисления бонусов в сравнении с поштучным"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipients", type=int, default=100_000, help="Количество получателей")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Начислений в одной транзакции БД")
+        parser.add_argument("--baseline", type=int, default=1000,
+                            help="Сколько получателей начислить поштучно через process_transaction для сравнения")
+        parser.add_argument("--prefix", default="bench_bonus", help="Префикс логинов синтетических пользователей")
+        parser.add_argument("--keep", action="store_true", help="Не удалять созданные данные")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        cleanup_profiles(prefix)
+
+        started = time.perf_counter()
+        profiles = seed_profiles(prefix, options["recipients"])
+        self.stdout.write(f"Создано профилей: {len(profiles)} за {time.perf_counter() - started:.1f}с")
+
+        baseline = profiles[:options["baseline"]]
+        started = time.perf_counter()
+        for profile in baseline:
+            process_transaction(user_from=profile, amount=Decimal("100.00"), transaction_type="bonus_add",
+                                comment="Замер поштучного начисления", is_profile=True)
+        baseline_elapsed = time.perf_counter() - started
+
+        items = [(profile.pk, Decimal("100.00"), "Замер массового начисления") for profile in profiles]
+        started = time.perf_counter()
+        summary = bulk_credit_bonuses(items, chunk_size=options["chunk_size"])
+        bulk_elapsed = time.perf_counter() - started
+
+        if baseline:
+            self.stdout.write(f"Поштучно: {len(baseline)} получателей за {baseline_elapsed:.2f}с — "
+                              f"{len(baseline) / baseline_elapsed:.0f} получателей/с")
+        self.stdout.write(f"Пачками: {len(items)} получателей за {bulk_elapsed:.2f}с — "
+                          f"{len(items) / bulk_elapsed:.0f} получателей/с")
+        self.stdout.write(f"Зачислено: {summary['credited_total']}р, упущенная прибыль: {summary['forfeited_total']}р")
+
+        balances = Balance.objects.filter(profile__user__username__startswith=f"{prefix}_")
+        projected = balances.aggregate(total=Sum("bonus_balance"))["total"]
+        journal = LedgerEntry.objects.filter(
+            profile__user__username__startswith=f"{prefix}_", account="bonus"
+        ).aggregate(total=Sum("amount"))["total"]
+        self.stdout.write(f"Бонусы по балансам: {projected}р, по журналу проводок: {journal}р")
+
+        if not options["keep"]:
+            cleanup_profiles(prefix)
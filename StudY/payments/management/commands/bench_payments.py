@@ -0,0 +1,131 @@
+import json
+import multiprocessing
+import threading
+import time
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test.utils import override_settings
+from django.utils.timezone import now
+
+from payments.bench import WORKLOAD_MIX, check_invariants, cleanup_profiles, run_workload, seed_profiles, summarize
+from payments.models import Balance
+
+
+def _run_process(args):
+    # Соединения родителя после fork не используем: каждый процесс открывает свое
+    connections.close_all()
+    return run_workload(*args)
+
+
+def _database_info():
+    if connection.vendor == "postgresql":
+        version = connection.pg_version
+    elif connection.vendor == "sqlite":
+        version = connection.Database.sqlite_version
+    else:
+        version = None
+    return {"vendor": connection.vendor, "version": version}
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный прогон process_transaction: смесь переводов бонусов, заморозок, разморозок, оплат "
+            "и выводов из пула потоков и пула процессов. База данных — из DATABASES['default'] "
+            "(SQLite или Postgres), результаты — в JSON для сравнения версий")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", type=int, default=20,
+                            help="Количество синтетических профилей (меньше — сильнее конкуренция)")
+        parser.add_argument("--workers", type=int, default=8, help="Потоков или процессов")
+        parser.add_argument("--operations", type=int, default=200, help="Операций на одного исполнителя")
+        parser.add_argument("--modes", nargs="+", choices=["thread", "process"], default=["thread", "process"],
+                            help="Пулы исполнителей, каждый прогоняется на свежих данных")
+        parser.add_argument("--fiat", type=Decimal, default=Decimal("5000.00"), help="Стартовый фиатный счет")
+        parser.add_argument("--frozen", type=Decimal, default=Decimal("2000.00"), help="Стартовый замороженный счет")
+        parser.add_argument("--bonus", type=Decimal, default=Decimal("1000.00"), help="Стартовый бонусный счет")
+        parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора операций")
+        parser.add_argument("--label", default="", help="Метка прогона в JSON, например версия кода")
+        parser.add_argument("--output", help="JSON-файл с результатами")
+        parser.add_argument("--prefix", default="bench_payments", help="Префикс логинов синтетических пользователей")
+        parser.add_argument("--system-shards", type=int,
+                            help="Частей системных счетов на время прогона (по умолчанию SYSTEM_ACCOUNT_SHARDS)")
+        parser.add_argument("--keep", action="store_true", help="Не удалять данные последнего прогона")
+
+    def handle(self, *args, **options):
+        system_shards = options["system_shards"] or settings.SYSTEM_ACCOUNT_SHARDS
+        with override_settings(SYSTEM_ACCOUNT_SHARDS=system_shards):
+            self._run(options)
+
+    def _run(self, options):
+        prefix = options["prefix"]
+        report = {
+            "label": options["label"],
+            "started_at": now().isoformat(),
+            "django": django.get_version(),
+            "database": _database_info(),
+            "parameters": {key: options[key] for key in ("profiles", "workers", "operations", "seed")},
+            "system_account_shards": settings.SYSTEM_ACCOUNT_SHARDS,
+            "mix": {transaction_type: weight for transaction_type, (weight, _) in WORKLOAD_MIX.items()},
+            "runs": [],
+        }
+
+        failed = []
+        for mode in options["modes"]:
+            cleanup_profiles(prefix)
+            seed_profiles(prefix, options["profiles"], fiat=options["fiat"], bonus=options["bonus"],
+                          frozen=options["frozen"])
+            opening_total = Balance.objects.filter(profile__user__username__startswith=f"{prefix}_").aggregate(
+                total=Sum("fiat_balance") + Sum("frozen_balance") + Sum("bonus_balance")
+            )["total"]
+            tasks = [(prefix, options["seed"] + worker, options["operations"]) for worker in range(options["workers"])]
+
+            started = time.perf_counter()
+            if mode == "process":
+                connections.close_all()
+                with multiprocessing.get_context("fork").Pool(options["workers"]) as pool:
+                    results = pool.map(_run_process, tasks, chunksize=1)
+            else:
+                results = [None] * len(tasks)
+
+                def worker(index):
+                    results[index] = run_workload(*tasks[index])
+
+                threads = [threading.Thread(target=worker, args=(index,)) for index in range(len(tasks))]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            elapsed = time.perf_counter() - started
+
+            samples = [sample for result in results for sample in result or []]
+            run = {"mode": mode, **summarize(samples, elapsed),
+                   "invariants": check_invariants(prefix, opening_total, samples)}
+            report["runs"].append(run)
+            if not run["invariants"]["ok"] or run.get("error"):
+                failed.append(mode)
+
+            self.stdout.write(
+                f"{mode}: {run['operations']} операций за {run['elapsed_s']:.2f}с — {run['ops_per_sec']:.0f} операций/с, "
+                f"p50 {run.get('p50_ms', 0):.1f}мс, p99 {run.get('p99_ms', 0):.1f}мс, "
+                f"ожидание блокировок {run.get('lock_wait_share', 0):.0%}, "
+                f"отказов {run.get('failed', 0)}, ошибок {run.get('error', 0)}"
+            )
+            for transaction_type, stats in run["by_type"].items():
+                self.stdout.write(f"  {transaction_type}: {stats['operations']} операций, "
+                                  f"p50 {stats['p50_ms']:.1f}мс, p99 {stats['p99_ms']:.1f}мс, "
+                                  f"ожидание блокировок p99 {stats['lock_wait_p99_ms']:.1f}мс")
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+
+        if not options["keep"]:
+            cleanup_profiles(prefix)
+        if failed:
+            raise CommandError(f"Ошибки или нарушение инвариантов балансов в прогонах: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS("Инварианты балансов соблюдены"))
@@ -0,0 +1,81 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from payments.bench import cleanup_profiles, seed_profiles
+from payments.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Сравнивает стоимость глубоких страниц истории транзакций: OFFSET + COUNT(*) против курсора"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2_000_000, help="Сколько транзакций создать")
+        parser.add_argument("--profiles", type=int, default=20, help="Среди скольких профилей распределить строки")
+        parser.add_argument("--pages", default="1,100,1000,10000", help="Номера страниц для замера через запятую")
+        parser.add_argument("--page-size", type=int, default=30)
+        parser.add_argument("--repeat", type=int, default=5, help="Повторов каждого замера")
+        parser.add_argument("--prefix", default="bench_history", help="Префикс логинов синтетических пользователей")
+        parser.add_argument("--keep", action="store_true", help="Не удалять созданные данные")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        cleanup_profiles(prefix)
+        profiles = seed_profiles(prefix, options["profiles"])
+        self.seed_transactions(profiles, options["rows"])
+
+        profile = profiles[0]
+        queryset = Transaction.objects.filter(profile=profile, status="completed").order_by("-created_at", "-id")
+        page_size = options["page_size"]
+
+        total = queryset.count()
+        for page in map(int, options["pages"].split(",")):
+            offset = (page - 1) * page_size
+            if offset >= total:
+                self.stdout.write(f"Страница {page}: за пределами истории профиля ({total} строк)")
+                continue
+            offset_time = self.measure(options["repeat"], lambda: (
+                queryset.count(), list(queryset[offset:offset + page_size])
+            ))
+
+            # Граница предыдущей страницы — то, что клиент получил бы в курсоре
+            boundary = queryset[offset - 1] if offset else None
+            keyset = queryset
+            if boundary:
+                keyset = queryset.filter(Q(created_at__lte=boundary.created_at) & (
+                    Q(created_at__lt=boundary.created_at) | Q(id__lt=boundary.id)
+                ))
+            keyset_time = self.measure(options["repeat"], lambda: list(keyset[:page_size + 1]))
+
+            self.stdout.write(f"Страница {page}: OFFSET {offset_time * 1000:.1f}мс, курсор {keyset_time * 1000:.1f}мс")
+
+        if not options["keep"]:
+            cleanup_profiles(prefix)
+
+    def seed_transactions(self, profiles, rows, batch_size=10_000):
+        started = time.perf_counter()
+        rnd = random.Random(0)
+        types = [choice for choice, _ in Transaction.TRANSACTION_TYPES]
+        created = 0
+        while created < rows:
+            batch = []
+            for _ in range(min(batch_size, rows - created)):
+                batch.append(Transaction(
+                    profile=rnd.choice(profiles), amount=Decimal(rnd.randint(1, 10_000)),
+                    transaction_type=rnd.choice(types), status=rnd.choice(["completed"] * 9 + ["failed"]),
+                ))
+            Transaction.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(f"Создано транзакций: {created} за {time.perf_counter() - started:.1f}с")
+
+    @staticmethod
+    def measure(repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)[len(timings) // 2]
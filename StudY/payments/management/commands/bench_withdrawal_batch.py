@@ -0,0 +1,80 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.test import override_settings
+
+from payments.bench import cleanup_profiles, seed_profiles
+from payments.models import Balance, LedgerEntry, WithdrawalRequest
+from payments.money import Money
+from payments.services import WITHDRAWAL_BATCH_LIMIT, process_transaction, process_withdrawal_batch
+
+
+class Command(BaseCommand):
+    help = "Замер пакетной обработки заявок на вывод в сравнении с поштучной"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Заявок для пакетной обработки")
+        parser.add_argument("--baseline", type=int, default=500, help="Заявок для поштучной обработки")
+        parser.add_argument("--batch-size", type=int, default=WITHDRAWAL_BATCH_LIMIT, help="Заявок в одном пакете")
+        parser.add_argument("--prefix", default="bench_withdrawal", help="Префикс логинов синтетических пользователей")
+        parser.add_argument("--keep", action="store_true", help="Не удалять созданные данные")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        amount = Decimal("5000.00")
+        cleanup_profiles(prefix)
+        profiles = seed_profiles(prefix, options["baseline"] + options["requests"], frozen=amount)
+        WithdrawalRequest.objects.bulk_create([
+            WithdrawalRequest(user=profile.user, amount=amount, card_number="0000", status="pending")
+            for profile in profiles
+        ])
+        requests = list(WithdrawalRequest.objects.filter(user__username__startswith=f"{prefix}_")
+                        .select_related("user").order_by("id"))
+        baseline, batched = requests[:options["baseline"]], requests[options["baseline"]:]
+
+        # Поштучно — как ApproveRejectWithdrawalRequest: process_transaction и сохранение заявки
+        started = time.perf_counter()
+        for n, withdrawal_request in enumerate(baseline):
+            approve = n % 2 == 0
+            result = process_transaction(user_from=withdrawal_request.user, amount=withdrawal_request.amount,
+                                         transaction_type="withdrawal" if approve else "unfreeze",
+                                         comment="Вывод средств на БК" if approve else "Возврат средств после отклонения заявки")
+            if result["status"] == "success":
+                withdrawal_request.status = "completed" if approve else "cancelled"
+                if approve:
+                    withdrawal_request.transaction = result["transaction"]
+                withdrawal_request.save()
+        baseline_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        failed = 0
+        for offset in range(0, len(batched), options["batch_size"]):
+            items = [
+                {"id": withdrawal_request.id, "action": "approve" if n % 2 == 0 else "reject", "comment": "Замер"}
+                for n, withdrawal_request in enumerate(batched[offset:offset + options["batch_size"]])
+            ]
+            # Одобрение сразу проводит выплату, как поштучный путь выше, без очереди платежного шлюза
+            with override_settings(PAYOUT_GATEWAY=None):
+                failed += sum(result["status"] != "success" for result in process_withdrawal_batch(items))
+        batch_elapsed = time.perf_counter() - started
+
+        if baseline:
+            self.stdout.write(f"Поштучно: {len(baseline)} заявок за {baseline_elapsed:.2f}с — "
+                              f"{len(baseline) / baseline_elapsed:.0f} заявок/с")
+        if batched:
+            self.stdout.write(f"Пакетами по {options['batch_size']}: {len(batched)} заявок за {batch_elapsed:.2f}с — "
+                              f"{len(batched) / batch_elapsed:.0f} заявок/с, ошибок {failed}")
+
+        balances = Balance.objects.filter(profile__user__username__startswith=f"{prefix}_")
+        projected = balances.aggregate(fiat=Sum("fiat_balance"), frozen=Sum("frozen_balance"))
+        journal = dict(LedgerEntry.objects.filter(profile__user__username__startswith=f"{prefix}_")
+                       .values_list("account").annotate(total=Sum("amount")))
+        self.stdout.write(f"Балансы: фиат {projected['fiat']}р, заморожено {projected['frozen']}р; "
+                          f"по журналу: фиат {journal.get('fiat')}р, заморожено {journal.get('frozen')}р")
+
+        if not options["keep"]:
+            cleanup_profiles(prefix)
+        if failed or any(Money.of(projected[account] or 0) != journal.get(account, 0) for account in ("fiat", "frozen")):
+            raise CommandError("Обнаружены ошибки или расхождение балансов с журналом")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from payments.models import OutboxConsumer, OutboxSequence
+from payments.outbox import COMPACT_CHUNK_SIZE, compact_outbox
+
+
+class Command(BaseCommand):
+    help = "Удаляет события журнала, подтвержденные всеми обработчиками, и выводит отставание обработчиков"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=COMPACT_CHUNK_SIZE, help="Событий за один DELETE")
+
+    def handle(self, *args, **options):
+        deleted = compact_outbox(options["batch_size"])
+        # Позиция обработчика — номер события, поэтому отставание считается от последнего выданного номера, а не от id
+        last_sequence = OutboxSequence.objects.filter(pk=1).values_list("value", flat=True).first() or 0
+        for consumer in OutboxConsumer.objects.order_by("name"):
+            self.stdout.write(f"{consumer.name}: позиция {consumer.position}, "
+                              f"отставание {max(last_sequence - consumer.position, 0)} событий")
+        self.stdout.write(self.style.SUCCESS(f"Удалено событий: {deleted}"))
@@ -0,0 +1,47 @@
+import csv
+import sys
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.services import bulk_credit_bonuses
+
+
+class Command(BaseCommand):
+    help = "Массовое начисление бонусов из CSV-файла со строками profile_id,amount[,comment]"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="Путь к CSV-файлу или '-' для чтения из stdin")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Начислений в одной транзакции БД")
+        parser.add_argument("--comment", default="", help="Комментарий по умолчанию")
+
+    def handle(self, *args, **options):
+        stream = sys.stdin if options["file"] == "-" else open(options["file"], newline="", encoding="utf-8")
+        with stream:
+            summary = bulk_credit_bonuses(self.read_items(stream, options["comment"]),
+                                          chunk_size=options["chunk_size"])
+
+        self.stdout.write(
+            f"Зачислено полностью: {summary['credited']}, частично: {summary['partial']}, "
+            f"в упущенную прибыль: {summary['forfeited']}"
+        )
+        self.stdout.write(f"Сумма зачислений: {summary['credited_total']}р, "
+                          f"упущенная прибыль: {summary['forfeited_total']}р")
+        if summary["missing"]:
+            self.stdout.write(self.style.WARNING(
+                f"Не найдены балансы профилей: {', '.join(map(str, summary['missing']))}"
+            ))
+        self.stdout.write(self.style.SUCCESS("Начисление завершено"))
+
+    def read_items(self, stream, default_comment):
+        for line_number, row in enumerate(csv.reader(stream), start=1):
+            if not row or row[0].startswith("#"):
+                continue
+            try:
+                profile_id, amount = int(row[0]), Decimal(row[1])
+            except (IndexError, ValueError, InvalidOperation):
+                raise CommandError(f"Некорректная строка {line_number}: {','.join(row)}")
+            if amount <= 0:
+                raise CommandError(f"Сумма должна быть положительной (строка {line_number})")
+            comment = row[2] if len(row) > 2 and row[2] else default_comment
+            yield profile_id, amount, comment
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные ключи идемпотентности"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Записей за один DELETE")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted_total = 0
+        while True:
+            ids = list(IdempotencyKey.objects.filter(expires_at__lte=now)
+                       .values_list("id", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            deleted, _ = IdempotencyKey.objects.filter(id__in=ids).delete()
+            deleted_total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Удалено ключей: {deleted_total}"))
@@ -0,0 +1,90 @@
+import csv
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from payments.models import Balance
+from payments.reconcile import RECONCILE_CHUNK_SIZE, reconcile_range, reconcile_system_accounts, repair_balances
+
+
+def _run_range(args):
+    # Соединения родителя после fork не используем: каждый процесс открывает свое
+    connections.close_all()
+    try:
+        return reconcile_range(*args)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Сверяет балансы с журналом проводок и при необходимости исправляет проекции"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Параллельных процессов по диапазонам профилей")
+        parser.add_argument("--range-size", type=int, default=100_000, help="Профилей в одном диапазоне")
+        parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE, help="Проводок в одной выборке")
+        parser.add_argument("--profile-min", type=int, help="Первый id профиля")
+        parser.add_argument("--profile-max", type=int, help="Последний id профиля")
+        parser.add_argument("--repair", action="store_true", help="Пересчитать балансы с расхождениями по журналу")
+        parser.add_argument("--output", help="CSV-файл со всеми расхождениями")
+        parser.add_argument("--show", type=int, default=20, help="Сколько расхождений вывести на экран")
+
+    def handle(self, *args, **options):
+        bounds = Balance.objects.aggregate(low=Min("profile_id"), high=Max("profile_id"))
+        if bounds["low"] is None:
+            self.stdout.write("Балансов нет")
+            return
+        low = options["profile_min"] if options["profile_min"] is not None else bounds["low"]
+        high = (options["profile_max"] if options["profile_max"] is not None else bounds["high"]) + 1
+        if low >= high:
+            raise CommandError("Пустой диапазон профилей")
+
+        step = options["range_size"]
+        ranges = [(start, min(start + step, high), options["chunk_size"]) for start in range(low, high, step)]
+
+        started = time.perf_counter()
+        if options["workers"] > 1:
+            connections.close_all()
+            with multiprocessing.get_context("fork").Pool(options["workers"]) as pool:
+                results = pool.map(_run_range, ranges, chunksize=1)
+        else:
+            results = [reconcile_range(*args) for args in ranges]
+        elapsed = time.perf_counter() - started
+
+        scanned = sum(count for count, _ in results)
+        drifts = [drift for _, range_drifts in results for drift in range_drifts]
+        self.stdout.write(f"Проверено профилей {low}..{high - 1}, проводок {scanned} за {elapsed:.1f}с "
+                          f"({scanned / elapsed if elapsed else 0:.0f} проводок/с)")
+
+        for drift in drifts[:options["show"]]:
+            self.stdout.write(
+                f"Профиль {drift['profile_id']}: {drift['field']} = {drift['balance'] / 100:.2f}, "
+                f"по журналу {drift['ledger'] / 100:.2f} (разница {(drift['balance'] - drift['ledger']) / 100:+.2f})"
+            )
+        if options["output"]:
+            with open(options["output"], "w", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=["profile_id", "field", "balance", "ledger"])
+                writer.writeheader()
+                writer.writerows(
+                    {**drift, "balance": f"{drift['balance'] / 100:.2f}", "ledger": f"{drift['ledger'] / 100:.2f}"}
+                    for drift in drifts
+                )
+
+        for drift in reconcile_system_accounts():
+            self.stdout.write(self.style.WARNING(
+                f"Системный счет {drift['account']}: по частям {drift['shards']}, по журналу {drift['ledger']}"
+            ))
+
+        profiles = {drift["profile_id"] for drift in drifts}
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS("Расхождений не обнаружено"))
+        elif options["repair"]:
+            repaired = repair_balances(profiles)
+            self.stdout.write(self.style.SUCCESS(f"Пересчитано балансов: {repaired}"))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Расхождения у {len(profiles)} профилей ({len(drifts)} полей), для исправления запустите с --repair"
+            ))
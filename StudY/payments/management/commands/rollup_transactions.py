@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.rollups import ROLLUP_CHUNK_SIZE, get_position, get_watermark, reset_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = "Обновляет дневные итоги транзакций от последней отметки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backfill", action="store_true",
+                            help="Пересчитать итоги по всей истории заново")
+        parser.add_argument("--chunk-size", type=int, default=ROLLUP_CHUNK_SIZE, help="Событий журнала в одной пачке")
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Работать постоянно, обновляя итоги раз в указанное число секунд")
+
+    def handle(self, *args, **options):
+        if options["backfill"]:
+            reset_rollups()
+            self.stdout.write("Итоги сброшены, пересчет истории")
+
+        while True:
+            started = time.perf_counter()
+            processed = chunks = 0
+            while True:
+                # Пачки по одной, чтобы показывать прогресс длинного пересчета
+                rows, done = update_rollups(chunk_size=options["chunk_size"], max_chunks=1)
+                if not done:
+                    break
+                processed += rows
+                chunks += done
+                if options["backfill"]:
+                    self.stdout.write(f"Пачка {chunks}: учтено {processed} транзакций")
+
+            watermark = get_watermark()
+            self.stdout.write(self.style.SUCCESS(
+                f"Учтено транзакций: {processed} за {time.perf_counter() - started:.1f}с, "
+                f"позиция в журнале событий {get_position()} ({watermark.last_created_at})"
+            ))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
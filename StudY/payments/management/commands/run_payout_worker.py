@@ -0,0 +1,67 @@
+import os
+import socket
+import threading
+import time
+from collections import Counter
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from payments.gateways import get_payout_gateway
+from payments.payouts import claim_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Обработчик очереди выплат: передает одобренные заявки на вывод в платежный шлюз"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="Параллельных выплат")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Пауза при пустой очереди, секунд")
+        parser.add_argument("--once", action="store_true", help="Завершиться, когда готовых заданий не останется")
+
+    def handle(self, *args, **options):
+        try:
+            gateway = get_payout_gateway()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь зависших заданий: {requeued}")
+
+        counters = Counter()
+        lock = threading.Lock()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        def worker(number):
+            name = f"{prefix}:{number}"
+            try:
+                while True:
+                    job = claim_job(name)
+                    if job is None:
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll_interval"])
+                        continue
+                    outcome = run_job(job, gateway)
+                    with lock:
+                        counters[outcome] += 1
+                    self.stdout.write(f"Заявка {job.withdrawal_request_id}: {outcome} (попытка {job.attempts})")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(number,), daemon=True) for number in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Остановка: задания в работе вернутся в очередь по PAYOUT_JOB_TIMEOUT")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Выплачено: {counters['succeeded']}, отказов: {counters['failed']}, отложено: {counters['retry']} "
+            f"за {time.perf_counter() - started:.1f}с"
+        ))
@@ -0,0 +1,72 @@
+import os
+import socket
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import AccountStatement, Transaction, TransactionArchive
+from payments.statements import (STATEMENT_FORMATS, claim_statement, generate_statement, is_closed, month_bounds,
+                                 requeue_stale_statements)
+
+
+class Command(BaseCommand):
+    help = "Обработчик очереди выписок: формирует файлы месячных выписок по счету"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll-interval", type=float, default=5.0, help="Пауза при пустой очереди, секунд")
+        parser.add_argument("--once", action="store_true", help="Завершиться, когда очередь опустеет")
+        parser.add_argument("--enqueue-month", help="Поставить в очередь выписки всех профилей с транзакциями "
+                                                    "за месяц ГГГГ-ММ")
+        parser.add_argument("--format", default="csv", help="Формат выписок для --enqueue-month")
+
+    def handle(self, *args, **options):
+        if options["enqueue_month"]:
+            self.enqueue_month(options["enqueue_month"], options["format"])
+
+        requeued = requeue_stale_statements()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь зависших выписок: {requeued}")
+
+        counters = Counter()
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        started = time.perf_counter()
+        while True:
+            statement = claim_statement(name)
+            if statement is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+            outcome = generate_statement(statement)
+            counters[outcome] += 1
+            self.stdout.write(f"Выписка профиля {statement.profile_id} за {statement.month:%m.%Y} "
+                              f"({statement.statement_format}): {outcome}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Сформировано: {counters['ready']}, ошибок: {counters['failed']} за {time.perf_counter() - started:.1f}с"
+        ))
+
+    def enqueue_month(self, value, statement_format):
+        try:
+            month = datetime.strptime(value, "%Y-%m").date()
+        except ValueError:
+            raise CommandError("Месяц указывается в формате ГГГГ-ММ")
+        if statement_format not in STATEMENT_FORMATS:
+            raise CommandError(f"Недоступный формат. Доступные: {', '.join(STATEMENT_FORMATS)}")
+        if not is_closed(month):
+            raise CommandError("Месяц еще не закрыт")
+
+        start, end = month_bounds(month)
+        profiles = set()
+        for model in (Transaction, TransactionArchive):
+            profiles.update(model.objects.filter(created_at__gte=start, created_at__lt=end)
+                            .values_list("profile_id", flat=True).distinct())
+        existing = set(AccountStatement.objects.filter(month=month, statement_format=statement_format)
+                       .values_list("profile_id", flat=True))
+        created = AccountStatement.objects.bulk_create([
+            AccountStatement(profile_id=profile_id, month=month, statement_format=statement_format)
+            for profile_id in sorted(profiles - existing)
+        ], batch_size=1000, ignore_conflicts=True)
+        self.stdout.write(f"Поставлено в очередь выписок: {len(created)}")
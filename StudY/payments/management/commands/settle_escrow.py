@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from payments.escrow import settle_order_holds
+from payments.models import EscrowHold
+
+
+class Command(BaseCommand):
+    help = "Передает исполнителям оплату заказов, у которых закончился гарантийный период"
+
+    def handle(self, *args, **options):
+        order_ids = list(EscrowHold.objects
+                         .filter(status="held", order__status="guaranteed_flight",
+                                 order__warranty_period_until__lt=now())
+                         .values_list("order_id", flat=True))
+        summary = settle_order_holds(order_ids, "release", "Оплата по заказу после гарантийного периода")
+        self.stdout.write(self.style.SUCCESS(
+            f"Завершено заказов: {summary['settled']} на {summary['total']}р, пропущено: {len(summary['skipped'])}"
+        ))
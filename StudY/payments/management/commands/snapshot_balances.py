@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.snapshots import SNAPSHOT_CHUNK_SIZE, take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Записывает снимки балансов для запросов баланса на дату"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--every", type=int, default=settings.BALANCE_SNAPSHOT_EVERY,
+                            help="Снимок после стольких проводок профиля")
+        parser.add_argument("--max-age-hours", type=float,
+                            default=settings.BALANCE_SNAPSHOT_MAX_AGE.total_seconds() / 3600,
+                            help="Снимок, если прошлому больше стольких часов и были новые проводки")
+        parser.add_argument("--chunk-size", type=int, default=SNAPSHOT_CHUNK_SIZE, help="Балансов в одной выборке")
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Работать постоянно, проверяя балансы раз в указанное число секунд")
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options["max_age_hours"])
+        while True:
+            started = time.perf_counter()
+            written = take_snapshots(every=options["every"], max_age=max_age, chunk_size=options["chunk_size"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Записано снимков: {written} за {time.perf_counter() - started:.1f}с"
+            ))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,86 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Min, Sum
+
+from payments.bench import cleanup_profiles, seed_profiles
+from payments.models import Balance, LedgerEntry
+from payments.money import Money
+from payments.services import process_transaction
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест переводов бонусов: параллельные потоки, проверка сохранения суммы балансов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", type=int, default=10, help="Количество синтетических профилей")
+        parser.add_argument("--threads", type=int, default=8, help="Количество потоков")
+        parser.add_argument("--transfers", type=int, default=200, help="Переводов на поток")
+        parser.add_argument("--bonus", type=Decimal, default=Decimal("1000.00"), help="Стартовый бонусный счет")
+        parser.add_argument("--prefix", default="stress", help="Префикс логинов синтетических пользователей")
+        parser.add_argument("--keep", action="store_true", help="Не удалять созданные данные")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        cleanup_profiles(prefix)
+        profiles = seed_profiles(prefix, options["profiles"], bonus=options["bonus"])
+        users = [profile.user for profile in profiles]
+        balances = Balance.objects.filter(profile__in=profiles)
+        expected_total = balances.aggregate(total=Sum("bonus_balance"))["total"]
+
+        counters = {"success": 0, "failed": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            local = {"success": 0, "failed": 0, "errors": 0}
+            try:
+                for _ in range(options["transfers"]):
+                    user_from, user_to = rnd.sample(users, 2)
+                    amount = Decimal(rnd.randint(1, 300))
+                    try:
+                        result = process_transaction(user_from=user_from, user_to=user_to, amount=amount,
+                                                     transaction_type="bonus_transfer")
+                    except Exception as e:
+                        local["errors"] += 1
+                        self.stderr.write(f"Ошибка перевода: {e}")
+                        continue
+                    local["success" if result["status"] == "success" else "failed"] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in local.items():
+                        counters[key] += value
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        totals = balances.aggregate(total=Sum("bonus_balance"), minimum=Min("bonus_balance"))
+        ledger_total = LedgerEntry.objects.filter(
+            profile__in=profiles, account="bonus"
+        ).aggregate(total=Sum("amount"))["total"] or Money(0)
+        drift = totals["total"] - expected_total
+        total_ops = sum(counters.values())
+
+        self.stdout.write(
+            f"Переводов: {total_ops} (успешно {counters['success']}, отклонено {counters['failed']}, "
+            f"ошибок {counters['errors']}) за {elapsed:.2f}с — {total_ops / elapsed:.1f} переводов/с"
+        )
+        self.stdout.write(f"Сумма бонусов: ожидалось {expected_total}, получено {totals['total']}, "
+                          f"по журналу проводок {ledger_total}, минимальный баланс {totals['minimum']}")
+
+        if not options["keep"]:
+            cleanup_profiles(prefix)
+
+        if drift or ledger_total != Money.of(totals["total"] or 0) or totals["minimum"] < 0 or counters["errors"]:
+            raise CommandError(f"Обнаружено расхождение балансов: {drift}")
+        self.stdout.write(self.style.SUCCESS("Расхождений не обнаружено"))
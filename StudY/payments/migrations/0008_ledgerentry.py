@@ -0,0 +1,42 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_alter_withdrawalrequest_card_number'),
+        ('server', '0009_remove_user_is_start_auth_user_count_auth'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balance',
+            name='last_entry_id',
+            field=models.BigIntegerField(default=0, verbose_name='Последняя учтенная проводка'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('bonus_add', 'Пополнение бонусов'), ('bonus_transfer', 'Перевод бонусов'), ('deposit', 'Пополнение фиата'), ('withdrawal', 'Вывод фиата'), ('payment', 'Оплата заказа фиатом'), ('payment_bonus', 'Оплата внутренней покупки бонусами'), ('payment_mixed', 'Оплата заказа/покупки бонусами + фиатом'), ('refund', 'Возврат средств'), ('freeze', 'Заморозка средств'), ('unfreeze', 'Разморозка средств'), ('penalty', 'Штраф (списание средств)'), ('compensation', 'Компенсация (начисление средств)'), ('fiat_transfer', 'Перевод фиата между пользователями'), ('bonus_forfeited', 'Бонусы в упущенную прибыль'), ('bonus_transfer_failed', 'Неудачный перевод бонусов')], max_length=155, verbose_name='Тип'),
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.UUIDField(db_index=True, verbose_name='Операция')),
+                ('account', models.CharField(choices=[('fiat', 'Фиатный счет'), ('frozen', 'Замороженный счет'), ('bonus', 'Бонусный счет'), ('forfeited', 'Упущенная прибыль'), ('external', 'Внешние расчеты'), ('bonus_fund', 'Фонд бонусов'), ('revenue', 'Выручка платформы'), ('commission', 'Комиссия платформы'), ('opening', 'Начальные остатки')], max_length=20, verbose_name='Счет')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма (приход +, расход -)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата проводки')),
+                ('profile', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='server.profile', verbose_name='Профиль')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entries', to='payments.transaction', verbose_name='Транзакция')),
+            ],
+            options={
+                'verbose_name': 'Проводка',
+                'verbose_name_plural': 'Проводки',
+                'indexes': [models.Index(fields=['profile', 'account', 'id'], name='payments_le_profile_2ce773_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+import uuid
+
+from django.db import migrations
+
+PROFILE_ACCOUNTS = {
+    'fiat': 'fiat_balance',
+    'frozen': 'frozen_balance',
+    'bonus': 'bonus_balance',
+    'forfeited': 'forfeited_balance',
+}
+
+
+def post_opening_entries(apps, schema_editor):
+    """Переносит текущие остатки балансов в журнал проводок со счета начальных остатков."""
+    Balance = apps.get_model('payments', 'Balance')
+    LedgerEntry = apps.get_model('payments', 'LedgerEntry')
+
+    for balance in Balance.objects.filter(last_entry_id=0).iterator():
+        operation = uuid.uuid4()
+        last_entry_id = 0
+        for account, field in PROFILE_ACCOUNTS.items():
+            amount = getattr(balance, field)
+            if amount:
+                LedgerEntry.objects.create(operation=operation, account='opening', amount=-amount)
+                entry = LedgerEntry.objects.create(operation=operation, profile_id=balance.profile_id,
+                                                   account=account, amount=amount)
+                last_entry_id = entry.pk
+        if last_entry_id:
+            Balance.objects.filter(pk=balance.pk).update(last_entry_id=last_entry_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(post_opening_entries, migrations.RunPython.noop),
+    ]
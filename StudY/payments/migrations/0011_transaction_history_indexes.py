@@ -0,0 +1,26 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_idempotencykey'),
+        ('server', '0009_remove_user_is_start_auth_user_count_auth'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['profile', 'status', 'created_at', 'id'], name='payments_tr_profile_b2f7e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'created_at', 'id'], name='payments_tr_transac_9c2d6d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created_at', 'id'], name='payments_tr_created_60b600_idx'),
+        ),
+    ]
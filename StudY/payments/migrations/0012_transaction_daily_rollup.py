@@ -0,0 +1,43 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='ID последней транзакции')),
+                ('last_created_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата последней транзакции')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Отметка агрегации',
+                'verbose_name_plural': 'Отметки агрегации',
+            },
+        ),
+        migrations.CreateModel(
+            name='TransactionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('transaction_type', models.CharField(choices=[('bonus_add', 'Пополнение бонусов'), ('bonus_transfer', 'Перевод бонусов'), ('deposit', 'Пополнение фиата'), ('withdrawal', 'Вывод фиата'), ('payment', 'Оплата заказа фиатом'), ('payment_bonus', 'Оплата внутренней покупки бонусами'), ('payment_mixed', 'Оплата заказа/покупки бонусами + фиатом'), ('refund', 'Возврат средств'), ('freeze', 'Заморозка средств'), ('unfreeze', 'Разморозка средств'), ('penalty', 'Штраф (списание средств)'), ('compensation', 'Компенсация (начисление средств)'), ('fiat_transfer', 'Перевод фиата между пользователями'), ('bonus_forfeited', 'Бонусы в упущенную прибыль'), ('bonus_transfer_failed', 'Неудачный перевод бонусов')], max_length=155, verbose_name='Тип')),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('completed', 'Завершено'), ('cancel', 'Отклонено'), ('failed', 'Ошибка'), ('frozen', 'Заморожено'), ('waiting_confirmation', 'Ожидание подтверждения'), ('reversed', 'Отменено после обработки'), ('penalized', 'Санкционное списание')], max_length=155, verbose_name='Статус')),
+                ('count', models.PositiveBigIntegerField(default=0, verbose_name='Количество')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Сумма')),
+            ],
+            options={
+                'verbose_name': 'Дневной итог транзакций',
+                'verbose_name_plural': 'Дневные итоги транзакций',
+                'unique_together': {('day', 'transaction_type', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_withdrawalrequest_eligibility_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='withdrawalrequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В обработке'), ('processing', 'Передана в платежный шлюз'), ('completed', 'Завершена'), ('cancelled', 'Отклонена'), ('cancelled_whores', 'Отклонена платежным шлюзом')], default='pending', max_length=40, verbose_name='Статус заявки'),
+        ),
+        migrations.CreateModel(
+            name='PayoutJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('processing', 'Выполняется'), ('succeeded', 'Выплачено'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(verbose_name='Следующая попытка')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Обработчик')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                ('gateway_reference', models.CharField(blank=True, default='', max_length=100, verbose_name='Идентификатор выплаты в шлюзе')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('withdrawal_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='payout_job', to='payments.withdrawalrequest', verbose_name='Заявка на вывод')),
+            ],
+            options={
+                'verbose_name': 'Задание на выплату',
+                'verbose_name_plural': 'Задания на выплату',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='payments_pa_status_c73994_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0014_payoutjob'),
+        ('server', '0010_username_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='transaction',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='entries', to='payments.transaction', verbose_name='Транзакция'),
+        ),
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('transaction_type', models.CharField(choices=[('bonus_add', 'Пополнение бонусов'), ('bonus_transfer', 'Перевод бонусов'), ('deposit', 'Пополнение фиата'), ('withdrawal', 'Вывод фиата'), ('payment', 'Оплата заказа фиатом'), ('payment_bonus', 'Оплата внутренней покупки бонусами'), ('payment_mixed', 'Оплата заказа/покупки бонусами + фиатом'), ('refund', 'Возврат средств'), ('freeze', 'Заморозка средств'), ('unfreeze', 'Разморозка средств'), ('penalty', 'Штраф (списание средств)'), ('compensation', 'Компенсация (начисление средств)'), ('fiat_transfer', 'Перевод фиата между пользователями'), ('bonus_forfeited', 'Бонусы в упущенную прибыль'), ('bonus_transfer_failed', 'Неудачный перевод бонусов')], max_length=155, verbose_name='Тип')),
+                ('comment', models.CharField(blank=True, max_length=155, null=True, verbose_name='Комментарий')),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('completed', 'Завершено'), ('cancel', 'Отклонено'), ('failed', 'Ошибка'), ('frozen', 'Заморожено'), ('waiting_confirmation', 'Ожидание подтверждения'), ('reversed', 'Отменено после обработки'), ('penalized', 'Санкционное списание')], default='completed', max_length=155, verbose_name='Статус')),
+                ('error_message', models.TextField(blank=True, null=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('dsc', models.CharField(blank=True, max_length=155, null=True, verbose_name='Дополнение')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='server.profile', verbose_name='Профиль отправителя')),
+                ('target_profile', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='received_archived_transactions', to='server.profile', verbose_name='Профиль получателя')),
+            ],
+            options={
+                'verbose_name': 'Архивная транзакция',
+                'verbose_name_plural': 'Архив транзакций',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['profile', 'status', 'created_at', 'id'], name='payments_tr_profile_313f1b_idx'), models.Index(fields=['transaction_type', 'created_at', 'id'], name='payments_tr_transac_ee65cd_idx'), models.Index(fields=['created_at', 'id'], name='payments_tr_created_b6c8ce_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0015_transaction_archive'),
+        ('server', '0010_username_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_entry_id', models.BigIntegerField(verbose_name='Последняя учтенная проводка')),
+                ('taken_at', models.DateTimeField(verbose_name='Дата последней учтенной проводки')),
+                ('fiat_balance', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Фиатный счет')),
+                ('frozen_balance', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Замороженный счет')),
+                ('bonus_balance', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Бонусный счет')),
+                ('forfeited_balance', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Баланс упущенной прибыли')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='server.profile', verbose_name='Профиль')),
+            ],
+            options={
+                'verbose_name': 'Снимок баланса',
+                'verbose_name_plural': 'Снимки балансов',
+                'indexes': [models.Index(fields=['profile', 'taken_at'], name='payments_ba_profile_8e0d89_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('profile', 'last_entry_id'), name='unique_balance_snapshot_entry'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0016_balance_snapshot'),
+        ('server', '0010_username_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц (первое число)')),
+                ('statement_format', models.CharField(choices=[('csv', 'CSV'), ('pdf', 'PDF')], max_length=10, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('processing', 'Формируется'), ('ready', 'Готова'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('file', models.FileField(blank=True, upload_to='statements/%Y/%m/', verbose_name='Файл')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Обработчик')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('generated_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата формирования')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statements', to='server.profile', verbose_name='Профиль')),
+            ],
+            options={
+                'verbose_name': 'Выписка по счету',
+                'verbose_name_plural': 'Выписки по счету',
+                'indexes': [models.Index(fields=['status', 'id'], name='payments_ac_status_dfb15f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='accountstatement',
+            constraint=models.UniqueConstraint(fields=('profile', 'month', 'statement_format'), name='unique_account_statement'),
+        ),
+    ]
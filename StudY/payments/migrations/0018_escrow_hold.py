@@ -0,0 +1,58 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0006_alter_orderstatuslog_status'),
+        ('payments', '0017_account_statement'),
+        ('server', '0010_username_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='account',
+            field=models.CharField(choices=[('fiat', 'Фиатный счет'), ('frozen', 'Замороженный счет'), ('bonus', 'Бонусный счет'), ('forfeited', 'Упущенная прибыль'), ('external', 'Внешние расчеты'), ('bonus_fund', 'Фонд бонусов'), ('revenue', 'Выручка платформы'), ('commission', 'Комиссия платформы'), ('opening', 'Начальные остатки'), ('escrow', 'Удержания по заказам')], max_length=20, verbose_name='Счет'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('bonus_add', 'Пополнение бонусов'), ('bonus_transfer', 'Перевод бонусов'), ('deposit', 'Пополнение фиата'), ('withdrawal', 'Вывод фиата'), ('payment', 'Оплата заказа фиатом'), ('payment_bonus', 'Оплата внутренней покупки бонусами'), ('payment_mixed', 'Оплата заказа/покупки бонусами + фиатом'), ('refund', 'Возврат средств'), ('freeze', 'Заморозка средств'), ('unfreeze', 'Разморозка средств'), ('penalty', 'Штраф (списание средств)'), ('compensation', 'Компенсация (начисление средств)'), ('fiat_transfer', 'Перевод фиата между пользователями'), ('bonus_forfeited', 'Бонусы в упущенную прибыль'), ('bonus_transfer_failed', 'Неудачный перевод бонусов'), ('escrow_hold', 'Оплата заказа в удержание'), ('escrow_release', 'Выплата исполнителю по заказу')], max_length=155, verbose_name='Тип'),
+        ),
+        migrations.AlterField(
+            model_name='transactionarchive',
+            name='transaction_type',
+            field=models.CharField(choices=[('bonus_add', 'Пополнение бонусов'), ('bonus_transfer', 'Перевод бонусов'), ('deposit', 'Пополнение фиата'), ('withdrawal', 'Вывод фиата'), ('payment', 'Оплата заказа фиатом'), ('payment_bonus', 'Оплата внутренней покупки бонусами'), ('payment_mixed', 'Оплата заказа/покупки бонусами + фиатом'), ('refund', 'Возврат средств'), ('freeze', 'Заморозка средств'), ('unfreeze', 'Разморозка средств'), ('penalty', 'Штраф (списание средств)'), ('compensation', 'Компенсация (начисление средств)'), ('fiat_transfer', 'Перевод фиата между пользователями'), ('bonus_forfeited', 'Бонусы в упущенную прибыль'), ('bonus_transfer_failed', 'Неудачный перевод бонусов'), ('escrow_hold', 'Оплата заказа в удержание'), ('escrow_release', 'Выплата исполнителю по заказу')], max_length=155, verbose_name='Тип'),
+        ),
+        migrations.AlterField(
+            model_name='transactiondailyrollup',
+            name='transaction_type',
+            field=models.CharField(choices=[('bonus_add', 'Пополнение бонусов'), ('bonus_transfer', 'Перевод бонусов'), ('deposit', 'Пополнение фиата'), ('withdrawal', 'Вывод фиата'), ('payment', 'Оплата заказа фиатом'), ('payment_bonus', 'Оплата внутренней покупки бонусами'), ('payment_mixed', 'Оплата заказа/покупки бонусами + фиатом'), ('refund', 'Возврат средств'), ('freeze', 'Заморозка средств'), ('unfreeze', 'Разморозка средств'), ('penalty', 'Штраф (списание средств)'), ('compensation', 'Компенсация (начисление средств)'), ('fiat_transfer', 'Перевод фиата между пользователями'), ('bonus_forfeited', 'Бонусы в упущенную прибыль'), ('bonus_transfer_failed', 'Неудачный перевод бонусов'), ('escrow_hold', 'Оплата заказа в удержание'), ('escrow_release', 'Выплата исполнителю по заказу')], max_length=155, verbose_name='Тип'),
+        ),
+        migrations.CreateModel(
+            name='EscrowHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('status', models.CharField(choices=[('held', 'Удерживается'), ('released', 'Выплачено исполнителю'), ('refunded', 'Возвращено заказчику')], default='held', max_length=20, verbose_name='Статус')),
+                ('settlement', models.UUIDField(blank=True, null=True, verbose_name='Пакет расчета')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('settled_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата расчета')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='escrow_holds', to='order.order', verbose_name='Заказ')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='escrow_holds', to='server.profile', verbose_name='Заказчик')),
+            ],
+            options={
+                'verbose_name': 'Удержание по заказу',
+                'verbose_name_plural': 'Удержания по заказам',
+                'indexes': [models.Index(fields=['profile', 'status', 'amount'], name='payments_es_profile_bd153d_idx'), models.Index(fields=['order', 'status'], name='payments_es_order_i_0d2179_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='escrowhold',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'held')), fields=('order',), name='unique_held_order'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:52
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_system_shards(apps, schema_editor):
+    """Переносит остатки системных счетов из журнала проводок в первую часть каждого счета."""
+    LedgerEntry = apps.get_model('payments', 'LedgerEntry')
+    SystemAccountShard = apps.get_model('payments', 'SystemAccountShard')
+
+    totals = (LedgerEntry.objects.filter(profile__isnull=True)
+              .values_list('account').annotate(total=Sum('amount')).order_by())
+    SystemAccountShard.objects.bulk_create([
+        SystemAccountShard(account=account, shard=0, balance=total) for account, total in totals if total
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0018_escrow_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SystemAccountShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.CharField(choices=[('fiat', 'Фиатный счет'), ('frozen', 'Замороженный счет'), ('bonus', 'Бонусный счет'), ('forfeited', 'Упущенная прибыль'), ('external', 'Внешние расчеты'), ('bonus_fund', 'Фонд бонусов'), ('revenue', 'Выручка платформы'), ('commission', 'Комиссия платформы'), ('opening', 'Начальные остатки'), ('escrow', 'Удержания по заказам')], max_length=20, verbose_name='Счет')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Часть')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Остаток')),
+            ],
+            options={
+                'verbose_name': 'Часть системного счета',
+                'verbose_name_plural': 'Части системных счетов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='systemaccountshard',
+            constraint=models.UniqueConstraint(fields=('account', 'shard'), name='unique_system_account_shard'),
+        ),
+        migrations.RunPython(fill_system_shards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:55
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0019_system_account_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxConsumer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название')),
+                ('position', models.BigIntegerField(default=0, verbose_name='ID последнего события')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Обработчик событий',
+                'verbose_name_plural': 'Обработчики событий',
+            },
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(choices=[('transaction_created', 'Создана транзакция')], max_length=50, verbose_name='Тип события')),
+                ('transaction_id', models.BigIntegerField(verbose_name='ID транзакции')),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Событие журнала',
+                'verbose_name_plural': 'События журнала',
+            },
+        ),
+    ]
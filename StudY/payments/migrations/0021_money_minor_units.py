@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from payments.money import MoneyField, minor_units_operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0020_outbox'),
+    ]
+
+    operations = [
+        *minor_units_operations('payments', 'ledgerentry', 'amount',
+                                MoneyField(verbose_name='Сумма в копейках (приход +, расход -)')),
+        *minor_units_operations('payments', 'systemaccountshard', 'balance',
+                                MoneyField(verbose_name='Остаток в копейках', default=0)),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.3 on 2026-10-18 19:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0021_money_minor_units'),
+        ('server', '0010_username_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='server.profile', verbose_name='Профиль'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.3 on 2026-10-18 19:23
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_events(apps, schema_editor):
+    """Существующие события нумеруются по id: позиции обработчиков (id) остаются верными курсорами."""
+    OutboxEvent = apps.get_model('payments', 'OutboxEvent')
+    OutboxSequence = apps.get_model('payments', 'OutboxSequence')
+
+    OutboxEvent.objects.update(sequence=F('id'))
+    last_id = OutboxEvent.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    OutboxSequence.objects.create(pk=1, value=last_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0022_ledger_entry_protect_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Последний номер')),
+            ],
+            options={
+                'verbose_name': 'Счетчик событий журнала',
+                'verbose_name_plural': 'Счетчики событий журнала',
+            },
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, null=True, unique=True, verbose_name='Номер в порядке фиксации'),
+        ),
+        migrations.AlterField(
+            model_name='outboxconsumer',
+            name='position',
+            field=models.BigIntegerField(default=0, verbose_name='Номер последнего события'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('sequence__isnull', True)), fields=['id'], name='outbox_unsequenced'),
+        ),
+        migrations.RunPython(number_existing_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-18 19:32
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0023_outbox_sequence'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='rollupwatermark',
+            name='last_id',
+        ),
+    ]
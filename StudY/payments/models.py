@@ -1,6 +1,9 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from server.models import *
 
+from .money import MoneyField
+
 
 class Balance(models.Model):
     """Баланс пользователя"""
@@ -13,6 +16,7 @@ class Balance(models.Model):
     frozen_balance = models.DecimalField(verbose_name='Замороженный счет', max_digits=10, decimal_places=2, default=0)
     bonus_balance = models.DecimalField(verbose_name='Бонусный счет', max_digits=10, decimal_places=2, default=0)
     forfeited_balance = models.DecimalField(verbose_name='Баланс упущенной прибыли', max_digits=10, decimal_places=2, default=0)
+    last_entry_id = models.BigIntegerField(verbose_name='Последняя учтенная проводка', default=0)
 
     def __str__(self):
         return f'Баланс {self.profile.user.username}'
@@ -23,6 +27,9 @@ class WithdrawalRequest(models.Model):
     class Meta:
         verbose_name = 'Заявка на вывод'
         verbose_name_plural = 'Заявки на вывод'
+        indexes = [
+            models.Index(fields=['user', 'status', 'date_submitted']),
+        ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
     amount = models.DecimalField(verbose_name='Сумма', max_digits=10, decimal_places=2)
@@ -30,6 +37,7 @@ class WithdrawalRequest(models.Model):
     status = models.CharField(
         verbose_name='Статус заявки', max_length=40, choices=[
             ('pending', 'В обработке'),
+            ('processing', 'Передана в платежный шлюз'),
             ('completed', 'Завершена'),
             ('cancelled', 'Отклонена'),
             ('cancelled_whores', 'Отклонена платежным шлюзом')
@@ -53,6 +61,11 @@ class Transaction(models.Model):
         verbose_name = 'Транзакция'
         verbose_name_plural = 'Транзакции'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['profile', 'status', 'created_at', 'id']),
+            models.Index(fields=['transaction_type', 'created_at', 'id']),
+            models.Index(fields=['created_at', 'id']),
+        ]
 
     TRANSACTION_TYPES = [
         ('bonus_add', 'Пополнение бонусов'),
@@ -68,6 +81,10 @@ class Transaction(models.Model):
         ('penalty', 'Штраф (списание средств)'),
         ('compensation', 'Компенсация (начисление средств)'),
         ('fiat_transfer', 'Перевод фиата между пользователями'),
+        ('bonus_forfeited', 'Бонусы в упущенную прибыль'),
+        ('bonus_transfer_failed', 'Неудачный перевод бонусов'),
+        ('escrow_hold', 'Оплата заказа в удержание'),
+        ('escrow_release', 'Выплата исполнителю по заказу'),
     ]
 
     STATUS_CHOICES = [
@@ -96,3 +113,364 @@ class Transaction(models.Model):
 
     def __str__(self):
         return f"{self.profile.user.username} | {self.transaction_type} | {self.amount} | {self.get_status_display()}"
+
+
+class TransactionArchive(models.Model):
+    """
+    Завершенные транзакции старше TRANSACTION_ARCHIVE_AFTER, перенесенные командой archive_transactions.
+    id сохраняется прежним, поля совпадают с Transaction.
+    """
+    class Meta:
+        verbose_name = 'Архивная транзакция'
+        verbose_name_plural = 'Архив транзакций'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['profile', 'status', 'created_at', 'id']),
+            models.Index(fields=['transaction_type', 'created_at', 'id']),
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+    id = models.BigIntegerField(primary_key=True)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="archived_transactions", verbose_name="Профиль отправителя")
+    target_profile = models.ForeignKey(
+        Profile, on_delete=models.SET_NULL, null=True, blank=True, related_name="received_archived_transactions",
+        verbose_name="Профиль получателя"
+    )
+    amount = models.DecimalField(verbose_name="Сумма", max_digits=10, decimal_places=2)
+    transaction_type = models.CharField(verbose_name="Тип", max_length=155, choices=Transaction.TRANSACTION_TYPES)
+    comment = models.CharField(verbose_name='Комментарий', max_length=155, blank=True, null=True)
+    status = models.CharField(verbose_name="Статус", max_length=155, choices=Transaction.STATUS_CHOICES, default='completed')
+    error_message = models.TextField(verbose_name="Ошибка", blank=True, null=True)
+    created_at = models.DateTimeField(verbose_name="Дата создания")
+    dsc = models.CharField(verbose_name='Дополнение', max_length=155, null=True, blank=True)
+    archived_at = models.DateTimeField(verbose_name="Дата архивации", auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.profile.user.username} | {self.transaction_type} | {self.amount} | {self.get_status_display()}"
+
+
+class LedgerEntry(models.Model):
+    """
+    Проводка двойной записи. Таблица только пополняется: проводки одной операции
+    имеют общий `operation` и в сумме дают ноль. Balance — проекция этих проводок.
+    """
+    class Meta:
+        verbose_name = 'Проводка'
+        verbose_name_plural = 'Проводки'
+        indexes = [
+            models.Index(fields=['profile', 'account', 'id']),
+        ]
+
+    # Счета пользователя соответствуют полям Balance
+    PROFILE_ACCOUNTS = {
+        'fiat': 'fiat_balance',
+        'frozen': 'frozen_balance',
+        'bonus': 'bonus_balance',
+        'forfeited': 'forfeited_balance',
+    }
+
+    ACCOUNT_CHOICES = [
+        ('fiat', 'Фиатный счет'),
+        ('frozen', 'Замороженный счет'),
+        ('bonus', 'Бонусный счет'),
+        ('forfeited', 'Упущенная прибыль'),
+        ('external', 'Внешние расчеты'),
+        ('bonus_fund', 'Фонд бонусов'),
+        ('revenue', 'Выручка платформы'),
+        ('commission', 'Комиссия платформы'),
+        ('opening', 'Начальные остатки'),
+        ('escrow', 'Удержания по заказам'),
+    ]
+
+    operation = models.UUIDField(verbose_name='Операция', db_index=True)
+    # Без ограничения внешнего ключа: при архивации транзакция переезжает в TransactionArchive с тем же id,
+    # а проводки журнала не изменяются
+    transaction = models.ForeignKey(
+        Transaction, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='entries',
+        verbose_name='Транзакция'
+    )
+    profile = models.ForeignKey(
+        Profile, on_delete=models.PROTECT, null=True, blank=True, related_name='ledger_entries', verbose_name='Профиль'
+    )
+    account = models.CharField(verbose_name='Счет', max_length=20, choices=ACCOUNT_CHOICES)
+    amount = MoneyField(verbose_name='Сумма в копейках (приход +, расход -)')
+    created_at = models.DateTimeField(verbose_name='Дата проводки', auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Проводки нельзя изменять, только добавлять новые")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.operation} | {self.account} | {self.amount}"
+
+
+class IdempotencyKey(models.Model):
+    """Результат запроса с заголовком Idempotency-Key для повтора без повторного выполнения"""
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+        unique_together = ('user', 'key')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
+    key = models.CharField(verbose_name='Ключ', max_length=64)
+    fingerprint = models.CharField(verbose_name='Отпечаток запроса', max_length=64)
+    status_code = models.PositiveSmallIntegerField(verbose_name='HTTP-статус ответа', null=True, blank=True)
+    response_body = models.JSONField(verbose_name='Тело ответа', encoder=DjangoJSONEncoder, null=True, blank=True)
+    created_at = models.DateTimeField(verbose_name='Дата создания', auto_now_add=True)
+    expires_at = models.DateTimeField(verbose_name='Действует до', db_index=True)
+
+    def __str__(self):
+        return f'{self.user_id} | {self.key}'
+
+
+class SystemAccountShard(models.Model):
+    """
+    Часть остатка системного счета (выручка, комиссия, фонд бонусов...). Счет разбит на
+    SYSTEM_ACCOUNT_SHARDS строк: операция обновляет одну из них, выбранную по хешу операции,
+    поэтому параллельные платежи не ждут одну общую строку. Остаток счета — сумма его частей.
+    """
+    class Meta:
+        verbose_name = 'Часть системного счета'
+        verbose_name_plural = 'Части системных счетов'
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'shard'], name='unique_system_account_shard'),
+        ]
+
+    account = models.CharField(verbose_name='Счет', max_length=20, choices=LedgerEntry.ACCOUNT_CHOICES)
+    shard = models.PositiveSmallIntegerField(verbose_name='Часть')
+    balance = MoneyField(verbose_name='Остаток в копейках', default=0)
+
+    def __str__(self):
+        return f'{self.account}[{self.shard}] | {self.balance}'
+
+
+class BalanceSnapshot(models.Model):
+    """
+    Состояние баланса после проводки last_entry_id. Записывается командой snapshot_balances
+    каждые BALANCE_SNAPSHOT_EVERY проводок профиля или раз в BALANCE_SNAPSHOT_MAX_AGE.
+    Баланс на момент X — ближайший снимок не позже X и проводки после него.
+    """
+    class Meta:
+        verbose_name = 'Снимок баланса'
+        verbose_name_plural = 'Снимки балансов'
+        indexes = [
+            models.Index(fields=['profile', 'taken_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'last_entry_id'], name='unique_balance_snapshot_entry'),
+        ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='balance_snapshots',
+                                verbose_name='Профиль')
+    last_entry_id = models.BigIntegerField(verbose_name='Последняя учтенная проводка')
+    taken_at = models.DateTimeField(verbose_name='Дата последней учтенной проводки')
+    fiat_balance = models.DecimalField(verbose_name='Фиатный счет', max_digits=10, decimal_places=2)
+    frozen_balance = models.DecimalField(verbose_name='Замороженный счет', max_digits=10, decimal_places=2)
+    bonus_balance = models.DecimalField(verbose_name='Бонусный счет', max_digits=10, decimal_places=2)
+    forfeited_balance = models.DecimalField(verbose_name='Баланс упущенной прибыли', max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(verbose_name='Дата создания', auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.profile_id} | {self.taken_at} | {self.last_entry_id}'
+
+
+class EscrowHold(models.Model):
+    """
+    Удержание стоимости заказа: деньги заказчика переходят с фиатного счета на системный счет escrow,
+    пока заказ в работе, и по завершении уходят исполнителю или возвращаются заказчику.
+    Сумма удержаний профиля считается по индексу (profile, status, amount) без общей колонки в Balance.
+    """
+    class Meta:
+        verbose_name = 'Удержание по заказу'
+        verbose_name_plural = 'Удержания по заказам'
+        indexes = [
+            models.Index(fields=['profile', 'status', 'amount']),
+            models.Index(fields=['order', 'status']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['order'], condition=models.Q(status='held'), name='unique_held_order'),
+        ]
+
+    STATUS_CHOICES = [
+        ('held', 'Удерживается'),
+        ('released', 'Выплачено исполнителю'),
+        ('refunded', 'Возвращено заказчику'),
+    ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.PROTECT, related_name='escrow_holds', verbose_name='Заказчик')
+    order = models.ForeignKey('order.Order', on_delete=models.PROTECT, related_name='escrow_holds', verbose_name='Заказ')
+    amount = models.DecimalField(verbose_name='Сумма', max_digits=10, decimal_places=2)
+    status = models.CharField(verbose_name='Статус', max_length=20, choices=STATUS_CHOICES, default='held')
+    # Общий идентификатор пакета, в котором удержание было закрыто
+    settlement = models.UUIDField(verbose_name='Пакет расчета', null=True, blank=True)
+    created_at = models.DateTimeField(verbose_name='Дата создания', auto_now_add=True)
+    settled_at = models.DateTimeField(verbose_name='Дата расчета', null=True, blank=True)
+
+    def __str__(self):
+        return f'Заказ {self.order_id} | {self.amount} | {self.get_status_display()}'
+
+
+class TransactionDailyRollup(models.Model):
+    """Количество и сумма транзакций за день в разрезе типа и статуса. Заполняется командой rollup_transactions."""
+    class Meta:
+        verbose_name = 'Дневной итог транзакций'
+        verbose_name_plural = 'Дневные итоги транзакций'
+        unique_together = ('day', 'transaction_type', 'status')
+
+    day = models.DateField(verbose_name='День')
+    transaction_type = models.CharField(verbose_name='Тип', max_length=155, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(verbose_name='Статус', max_length=155, choices=Transaction.STATUS_CHOICES)
+    count = models.PositiveBigIntegerField(verbose_name='Количество', default=0)
+    total = models.DecimalField(verbose_name='Сумма', max_digits=16, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.day} | {self.transaction_type} | {self.status} | {self.count} | {self.total}'
+
+
+class RollupWatermark(models.Model):
+    """
+    Отметка агрегации: ее блокировка упорядочивает обновления итогов, last_created_at — до какого
+    момента учтены данные. Позиция в журнале событий хранится у обработчика OutboxConsumer.
+    """
+    class Meta:
+        verbose_name = 'Отметка агрегации'
+        verbose_name_plural = 'Отметки агрегации'
+
+    name = models.CharField(verbose_name='Название', max_length=50, unique=True)
+    last_created_at = models.DateTimeField(verbose_name='Дата последней транзакции', null=True, blank=True)
+    updated_at = models.DateTimeField(verbose_name='Дата обновления', auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} | {self.last_created_at}'
+
+
+class PayoutJob(models.Model):
+    """Задание на выплату одобренной заявки через платежный шлюз. Выполняется командой run_payout_worker."""
+    class Meta:
+        verbose_name = 'Задание на выплату'
+        verbose_name_plural = 'Задания на выплату'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('processing', 'Выполняется'),
+        ('succeeded', 'Выплачено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    withdrawal_request = models.OneToOneField(
+        WithdrawalRequest, on_delete=models.CASCADE, related_name='payout_job', verbose_name='Заявка на вывод'
+    )
+    status = models.CharField(verbose_name='Статус', max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(verbose_name='Попыток', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка')
+    locked_by = models.CharField(verbose_name='Обработчик', max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(verbose_name='Взято в работу', null=True, blank=True)
+    gateway_reference = models.CharField(verbose_name='Идентификатор выплаты в шлюзе', max_length=100, blank=True, default='')
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True, default='')
+    created_at = models.DateTimeField(verbose_name='Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='Дата обновления', auto_now=True)
+
+    def __str__(self):
+        return f'Выплата по заявке {self.withdrawal_request_id} | {self.get_status_display()} | попыток {self.attempts}'
+
+
+class AccountStatement(models.Model):
+    """
+    Выписка по счету профиля за закрытый месяц. Файл формируется командой run_statement_worker
+    и заново — только если транзакция месяца зафиксировалась после его закрытия.
+    """
+    class Meta:
+        verbose_name = 'Выписка по счету'
+        verbose_name_plural = 'Выписки по счету'
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'month', 'statement_format'], name='unique_account_statement'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('pdf', 'PDF'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('processing', 'Формируется'),
+        ('ready', 'Готова'),
+        ('failed', 'Ошибка'),
+    ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='statements', verbose_name='Профиль')
+    month = models.DateField(verbose_name='Месяц (первое число)')
+    statement_format = models.CharField(verbose_name='Формат', max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(verbose_name='Статус', max_length=20, choices=STATUS_CHOICES, default='queued')
+    file = models.FileField(verbose_name='Файл', upload_to='statements/%Y/%m/', blank=True)
+    locked_by = models.CharField(verbose_name='Обработчик', max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(verbose_name='Взято в работу', null=True, blank=True)
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True, default='')
+    created_at = models.DateTimeField(verbose_name='Дата создания', auto_now_add=True)
+    generated_at = models.DateTimeField(verbose_name='Дата формирования', null=True, blank=True)
+
+    def __str__(self):
+        return f'Выписка {self.profile_id} за {self.month:%m.%Y} | {self.statement_format} | {self.get_status_display()}'
+
+
+class OutboxEvent(models.Model):
+    """
+    Событие журнала для внешних обработчиков (уведомления, аналитика, рефералы).
+    Пишется в той же транзакции БД, что и сама транзакция, поэтому событие есть тогда и только тогда,
+    когда транзакция зафиксирована. Курсор чтения — sequence: номер в порядке фиксации,
+    который событие получает уже после фиксации (payments.outbox.sequence_events).
+    """
+    EVENT_TYPES = [
+        ('transaction_created', 'Создана транзакция'),
+    ]
+
+    class Meta:
+        verbose_name = 'Событие журнала'
+        verbose_name_plural = 'События журнала'
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(sequence__isnull=True), name='outbox_unsequenced'),
+        ]
+
+    id = models.BigAutoField(primary_key=True)
+    sequence = models.BigIntegerField(verbose_name='Номер в порядке фиксации', null=True, blank=True, unique=True)
+    event_type = models.CharField(verbose_name='Тип события', max_length=50, choices=EVENT_TYPES)
+    # Без внешнего ключа: транзакцию могут перенести в архив раньше, чем событие прочитают
+    transaction_id = models.BigIntegerField(verbose_name='ID транзакции')
+    payload = models.JSONField(verbose_name='Данные', encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(verbose_name='Дата создания', auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.id} | {self.event_type} | {self.transaction_id}'
+
+
+class OutboxConsumer(models.Model):
+    """Обработчик событий журнала и номер (sequence) последнего обработанного им события"""
+    class Meta:
+        verbose_name = 'Обработчик событий'
+        verbose_name_plural = 'Обработчики событий'
+
+    name = models.CharField(verbose_name='Название', max_length=50, unique=True)
+    position = models.BigIntegerField(verbose_name='Номер последнего события', default=0)
+    updated_at = models.DateTimeField(verbose_name='Дата обновления', auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} | {self.position}'
+
+
+class OutboxSequence(models.Model):
+    """Последний выданный номер события журнала. Одна строка; ее блокировка упорядочивает нумерацию."""
+    class Meta:
+        verbose_name = 'Счетчик событий журнала'
+        verbose_name_plural = 'Счетчики событий журнала'
+
+    value = models.BigIntegerField(verbose_name='Последний номер', default=0)
+
+    def __str__(self):
+        return str(self.value)
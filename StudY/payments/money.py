@@ -0,0 +1,163 @@
+"""
+Денежные суммы в копейках.
+Money — неизменяемая сумма с целым числом копеек, MoneyField хранит ее в BigIntegerField:
+сложение, сравнение, индексы и агрегаты по такому полю целочисленные, а предел суммы —
+диапазон bigint, а не max_digits. Рубли в копейки переводятся по правилу округления из fees.
+
+Поле подключается к модели по одному: minor_units_operations дает операции миграции,
+переводящие существующее DecimalField в копейки. Сейчас в копейках хранится только журнал
+(LedgerEntry.amount, SystemAccountShard.balance). Balance, Transaction, WithdrawalRequest, Order.cost
+и Rank.rank_price остаются DecimalField в рублях, и расчет комиссий идет в Decimal.
+"""
+from decimal import Decimal
+from functools import total_ordering
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+from .fees import MONEY_QUANT, MONEY_ROUNDING, HUNDRED
+
+MINOR_UNITS = 100
+
+
+@total_ordering
+class Money:
+    """Сумма в копейках. Складывается и сравнивается только с Money; 0 допускается для sum()."""
+    __slots__ = ('minor',)
+
+    def __init__(self, minor=0):
+        if not isinstance(minor, int) or isinstance(minor, bool):
+            raise TypeError(f"Сумма задается целым числом копеек, получено {minor!r}")
+        object.__setattr__(self, 'minor', minor)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money неизменяем")
+
+    def __reduce__(self):
+        return Money, (self.minor,)
+
+    @classmethod
+    def from_decimal(cls, value):
+        """Сумма в рублях (Decimal, строка или int), округленная до копеек по MONEY_ROUNDING."""
+        if isinstance(value, float):
+            raise TypeError("Денежные суммы не задаются числами с плавающей точкой")
+        return cls(int(Decimal(value).quantize(MONEY_QUANT, rounding=MONEY_ROUNDING).scaleb(2)))
+
+    @classmethod
+    def of(cls, value):
+        """Money как есть, остальное — рубли через from_decimal."""
+        return value if isinstance(value, Money) else cls.from_decimal(value)
+
+    @property
+    def amount(self):
+        """Сумма в рублях: Decimal с двумя знаками после запятой."""
+        return Decimal(self.minor).scaleb(-2)
+
+    def percent(self, percent):
+        """Доля percent процентов от суммы с округлением до копеек, как fees.percent_of."""
+        return Money.from_decimal(self.amount * Decimal(percent) / HUNDRED)
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.minor + other.minor)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.minor - other.minor)
+        return NotImplemented
+
+    def __mul__(self, other):
+        if isinstance(other, int) and not isinstance(other, bool):
+            return Money(self.minor * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.minor)
+
+    def __abs__(self):
+        return Money(abs(self.minor))
+
+    def __bool__(self):
+        return self.minor != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.minor == other.minor
+        if other == 0:
+            return self.minor == 0
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.minor < other.minor
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.minor)
+
+    def __str__(self):
+        return str(self.amount)
+
+    def __repr__(self):
+        return f"Money('{self.amount}')"
+
+
+def to_minor_units(expression):
+    """Выражение ORM: сумма DecimalField в копейках целым числом."""
+    return Cast(Round(expression * MINOR_UNITS), models.BigIntegerField())
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Сумма в копейках. Из БД читается как Money. При записи и в фильтрах принимает Money
+    или рубли (Decimal, строка, int); float не принимается.
+    В выражениях F() прибавляйте копейки (money.minor), а не Decimal: рубли к копейкам БД не приведет.
+    """
+    description = "Сумма в копейках"
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else Money(value)
+
+    def to_python(self, value):
+        return None if value is None else Money.of(value)
+
+    def get_prep_value(self, value):
+        if value is None or hasattr(value, 'resolve_expression'):
+            return value
+        return Money.of(value).minor
+
+
+def minor_units_operations(app_label, model_name, name, field):
+    """
+    Операции миграции, переводящие DecimalField `name` модели в MoneyField `field`:
+    новое поле заполняется одним UPDATE с ROUND(сумма * 100), старое удаляется, новое получает его имя.
+    Старое поле на время перевода становится nullable, поэтому миграция обратима.
+    """
+    temporary = f'{name}_minor'
+
+    def forward(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        model.objects.update(**{temporary: to_minor_units(F(name))})
+
+    def backward(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        model.objects.update(**{name: Cast(F(temporary), models.DecimalField(max_digits=20, decimal_places=2))
+                                / MINOR_UNITS})
+
+    return [
+        migrations.AlterField(model_name, name, models.DecimalField(max_digits=16, decimal_places=2, null=True)),
+        migrations.AddField(model_name, temporary, MoneyField(default=0)),
+        migrations.RunPython(forward, backward),
+        migrations.RemoveField(model_name, name),
+        migrations.RenameField(model_name, temporary, name),
+        migrations.AlterField(model_name, name, field),
+    ]
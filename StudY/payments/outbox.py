@@ -0,0 +1,119 @@
+"""
+Исходящие события журнала (OutboxEvent) для внешних обработчиков.
+Событие о транзакции пишется в той же транзакции БД, что и сама транзакция. id выдается при вставке,
+а фиксируются транзакции в другом порядке, поэтому курсором служит не id, а номер sequence:
+sequence_events нумерует уже зафиксированные события под блокировкой счетчика OutboxSequence.
+Обработчик читает события пачками по возрастанию номера начиная со своей позиции OutboxConsumer
+и подтверждает прочитанное; события, которые прочитали все обработчики, удаляет compact_outbox.
+"""
+from django.conf import settings
+from django.db import connections, transaction as db_transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import OutboxConsumer, OutboxEvent, OutboxSequence
+
+COMPACT_CHUNK_SIZE = 5000
+SEQUENCE_CHUNK_SIZE = 5000
+
+
+def transaction_payload(transaction):
+    """Данные события без обращений к связанным таблицам."""
+    return {
+        'id': transaction.pk,
+        'profile_id': transaction.profile_id,
+        'target_profile_id': transaction.target_profile_id,
+        'amount': str(transaction.amount),
+        'transaction_type': transaction.transaction_type,
+        'status': transaction.status,
+        'created_at': transaction.created_at,
+    }
+
+
+def publish_transactions(transactions):
+    """Записывает события о созданных транзакциях. Вызывается в транзакции БД, создавшей их."""
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(event_type='transaction_created', transaction_id=transaction.pk,
+                    payload=transaction_payload(transaction))
+        for transaction in transactions
+    ], batch_size=500)
+
+
+def sequence_events(limit=SEQUENCE_CHUNK_SIZE):
+    """
+    Нумерует зафиксированные события без номера по возрастанию id, не больше limit за вызов.
+    Нумерация идет под блокировкой счетчика, и номера становятся видны только вместе со всеми меньшими:
+    событие транзакции БД, зафиксированной позже, получит номер больше любого уже прочитанного.
+    Возвращает число пронумерованных событий.
+    """
+    OutboxSequence.objects.get_or_create(pk=1)
+    with db_transaction.atomic():
+        counter = OutboxSequence.objects.filter(pk=1)
+        if connections[counter.db].features.has_select_for_update:
+            value = counter.select_for_update().values_list('value', flat=True).get()
+        else:
+            # SQLite: холостой UPDATE берет блокировку записи до конца транзакции, как в lock_balances
+            counter.update(value=F('value'))
+            value = counter.values_list('value', flat=True).get()
+        # Читаем после блокировки: события, пронумерованные предыдущим вызовом, сюда уже не попадут
+        ids = list(OutboxEvent.objects.filter(sequence__isnull=True).order_by('id')
+                   .values_list('id', flat=True)[:limit])
+        if not ids:
+            return 0
+        OutboxEvent.objects.bulk_update(
+            [OutboxEvent(id=event_id, sequence=value + number) for number, event_id in enumerate(ids, 1)],
+            ['sequence'], batch_size=500,
+        )
+        counter.update(value=value + len(ids))
+    return len(ids)
+
+
+def read_events(consumer, after=None, limit=None):
+    """
+    Пачка событий после позиции обработчика (или после номера after) и курсор для подтверждения.
+    Перед чтением нумерует новые зафиксированные события; события незафиксированных транзакций
+    получат номера позже и курсор их не перескочит.
+    """
+    if after is None:
+        after = OutboxConsumer.objects.get_or_create(name=consumer)[0].position
+    limit = limit or settings.OUTBOX_BATCH_SIZE
+    sequence_events()
+    events = list(OutboxEvent.objects.filter(sequence__gt=after).order_by('sequence')
+                  .values('sequence', 'id', 'event_type', 'transaction_id', 'payload', 'created_at')[:limit])
+    return events, events[-1]['sequence'] if events else after
+
+
+def acknowledge(consumer, cursor):
+    """Сдвигает позицию обработчика вперед до cursor. Повторное или устаревшее подтверждение ничего не меняет."""
+    updated = OutboxConsumer.objects.filter(name=consumer, position__lt=cursor).update(
+        position=cursor, updated_at=timezone.now()
+    )
+    return bool(updated)
+
+
+def consume(consumer, handler, limit=None):
+    """Передает handler пачку событий и подтверждает ее, если handler не выбросил исключение."""
+    events, cursor = read_events(consumer, limit=limit)
+    if events:
+        handler(events)
+        acknowledge(consumer, cursor)
+    return len(events)
+
+
+def compact_outbox(chunk_size=COMPACT_CHUNK_SIZE):
+    """
+    Удаляет события, подтвержденные всеми обработчиками, пачками по номеру.
+    Пока обработчиков нет, события не удаляются. Возвращает число удаленных событий.
+    """
+    position = OutboxConsumer.objects.aggregate(position=Min('position'))['position']
+    if not position:
+        return 0
+    deleted_total = 0
+    while True:
+        ids = list(OutboxEvent.objects.filter(sequence__lte=position).order_by('sequence')
+                   .values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        deleted, _ = OutboxEvent.objects.filter(id__in=ids).delete()
+        deleted_total += deleted
+    return deleted_total
@@ -0,0 +1,144 @@
+import base64
+import heapq
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (поле сортировки, id) вместо номера страницы.
+    Не считает COUNT(*) и не делает OFFSET, поэтому любая страница стоит как первая.
+    Поле сортировки берется из запроса (OrderingFilter) или из Meta.ordering модели.
+    """
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 30)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        queryset может быть списком выборок с одинаковыми полями (например, горячая таблица и архив):
+        из каждой берется страница по тому же курсору, результаты сливаются в общем порядке.
+        """
+        sources = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(sources[0])
+        cursor = self.decode_cursor(request, sources[0].model)
+
+        # При переходе назад выбираем строки в обратном порядке и разворачиваем результат
+        backwards = bool(cursor and cursor['reverse'])
+        descending = self.descending != backwards
+        prefix = '-' if descending else ''
+        pages = []
+        for source in sources:
+            source = source.order_by(f'{prefix}{self.field}', f'{prefix}id')
+            if cursor:
+                source = source.filter(self.position_filter(cursor['value'], cursor['id'], descending))
+            pages.append(list(source[:self.page_size + 1]))
+
+        if len(pages) == 1:
+            rows = pages[0]
+        else:
+            rows = list(islice(heapq.merge(*pages, key=lambda row: (getattr(row, self.field), row.pk),
+                                           reverse=descending), self.page_size + 1))
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+
+        self.page = rows
+        self.has_next = has_more if not backwards else True
+        self.has_previous = bool(cursor) if not backwards else has_more
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['-id']
+        field = ordering[0]
+        return field.lstrip('-'), field.startswith('-')
+
+    def position_filter(self, value, row_id, descending):
+        lookup = 'lt' if descending else 'gt'
+        # Внешнее нестрогое условие дает планировщику диапазон по индексу (field, id), OR внутри — только уточнение
+        return Q(**{f'{self.field}__{lookup}e': value}) & (
+            Q(**{f'{self.field}__{lookup}': value}) | Q(**{f'id__{lookup}': row_id})
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        value = getattr(row, self.field)
+        payload = {'v': value.isoformat() if hasattr(value, 'isoformat') else str(value), 'id': row.pk, 'r': reverse}
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            value = model._meta.get_field(self.field).to_python(payload['v'])
+            return {'value': value, 'id': int(payload['id']), 'reverse': bool(payload.get('r'))}
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор страницы из полей next/previous',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Количество записей на странице',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,137 @@
+"""
+Очередь выплат по одобренным заявкам на вывод (PayoutJob).
+Одобрение только переводит заявку в статус processing и ставит задание;
+команда run_payout_worker забирает задания, вызывает платежный шлюз и по результату
+списывает замороженные средства или возвращает их на фиатный счет.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .gateways import PayoutError, payouts_enabled
+from .models import PayoutJob, WithdrawalRequest
+from .services import process_transaction
+
+logger = logging.getLogger(__name__)
+
+# Сколько кандидатов просматривать при захвате задания: остальные могли забрать другие обработчики
+CLAIM_CANDIDATES = 10
+
+
+def enqueue_payout(withdrawal_request):
+    """
+    Переводит заявку из pending в processing и ставит задание на выплату.
+    Возвращает False, если заявку уже обработал другой запрос.
+    """
+    timestamp = now()
+    with db_transaction.atomic():
+        updated = WithdrawalRequest.objects.filter(pk=withdrawal_request.pk, status="pending").update(
+            status="processing", date_updated=timestamp
+        )
+        if not updated:
+            return False
+        PayoutJob.objects.create(withdrawal_request=withdrawal_request, next_attempt_at=timestamp)
+    withdrawal_request.status = "processing"
+    return True
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задания, обработчик которых пропал дольше PAYOUT_JOB_TIMEOUT назад."""
+    return PayoutJob.objects.filter(
+        status="processing", locked_at__lt=now() - settings.PAYOUT_JOB_TIMEOUT
+    ).update(status="queued", locked_by="", next_attempt_at=now())
+
+
+def claim_job(worker_name):
+    """
+    Забирает ближайшее готовое задание условным UPDATE: из нескольких обработчиков
+    его получит только тот, чей UPDATE первым сменит статус queued. Работает без SELECT ... FOR UPDATE.
+    """
+    candidates = list(PayoutJob.objects
+                      .filter(status="queued", next_attempt_at__lte=now())
+                      .order_by("next_attempt_at", "id")
+                      .values_list("id", flat=True)[:CLAIM_CANDIDATES])
+    for job_id in candidates:
+        claimed = PayoutJob.objects.filter(pk=job_id, status="queued").update(
+            status="processing", locked_by=worker_name, locked_at=now(), attempts=F("attempts") + 1
+        )
+        if claimed:
+            return PayoutJob.objects.select_related("withdrawal_request__user__profile").get(pk=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    """Экспоненциальная задержка перед повтором со случайным разбросом ±20%."""
+    delay = min(settings.PAYOUT_RETRY_BACKOFF * 2 ** (attempts - 1), settings.PAYOUT_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(job, gateway):
+    """Выполняет захваченное задание. Возвращает итог: succeeded, retry или failed."""
+    withdrawal_request = job.withdrawal_request
+    try:
+        reference, message = gateway.payout(withdrawal_request, idempotency_key=f"withdrawal-{withdrawal_request.pk}")
+    except Exception as e:
+        retryable = e.retryable if isinstance(e, PayoutError) else True
+        if not isinstance(e, PayoutError):
+            logger.exception(f"Сбой платежного шлюза по заявке {withdrawal_request.pk}")
+        if retryable and job.attempts < settings.PAYOUT_MAX_ATTEMPTS:
+            PayoutJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+                status="queued", locked_by="", last_error=str(e),
+                next_attempt_at=now() + timedelta(seconds=retry_delay(job.attempts)),
+            )
+            return "retry"
+        _decline(job, str(e))
+        return "failed"
+
+    _complete(job, reference, message)
+    return "succeeded"
+
+
+def _complete(job, reference, message):
+    """Списывает замороженные средства и закрывает заявку после успешной выплаты."""
+    withdrawal_request = job.withdrawal_request
+    with db_transaction.atomic():
+        # Сначала запись: отметка задания занимает его, повторный вызов по тому же заданию ничего не спишет
+        finished = PayoutJob.objects.filter(pk=job.pk, status="processing", locked_by=job.locked_by).update(
+            status="succeeded", gateway_reference=reference, last_error=""
+        )
+        if not finished:
+            return
+        result = process_transaction(user_from=withdrawal_request.user, amount=withdrawal_request.amount,
+                                     transaction_type="withdrawal", comment="Вывод средств на БК")
+        if result["status"] != "success":
+            # Шлюз уже выплатил деньги, а списать их не удалось — заявку разбирает финансист
+            logger.error(f"Выплата {reference} по заявке {withdrawal_request.pk} не списана: {result['error']}")
+            PayoutJob.objects.filter(pk=job.pk).update(status="failed", last_error=result["error"])
+            return
+        withdrawal_request.status = "completed"
+        withdrawal_request.transaction = result["transaction"]
+        withdrawal_request.comment_whores = f"comment: {message}"
+        withdrawal_request.date_completed = now()
+        withdrawal_request.save()
+
+
+def _decline(job, error):
+    """Возвращает замороженные средства на фиатный счет после отказа шлюза."""
+    withdrawal_request = job.withdrawal_request
+    with db_transaction.atomic():
+        finished = PayoutJob.objects.filter(pk=job.pk, status="processing", locked_by=job.locked_by).update(
+            status="failed", last_error=error
+        )
+        if not finished:
+            return
+        result = process_transaction(user_from=withdrawal_request.user, amount=withdrawal_request.amount,
+                                     transaction_type="unfreeze", comment="Возврат средств: выплата не выполнена")
+        if result["status"] != "success":
+            logger.error(f"Не удалось вернуть средства по заявке {withdrawal_request.pk}: {result['error']}")
+            return
+        withdrawal_request.status = "cancelled_whores"
+        withdrawal_request.comment_whores = f"comment: {error}"
+        withdrawal_request.save()
+
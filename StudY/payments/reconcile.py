@@ -0,0 +1,114 @@
+"""
+Сверка проекций Balance с журналом проводок LedgerEntry.
+Проводки диапазона профилей читаются пачками по индексу (profile, account, id), суммы копятся в массивах NumPy
+в копейках, как и хранятся в журнале, поэтому память зависит от числа профилей в диапазоне, а не от числа проводок.
+"""
+import numpy as np
+from django.db import transaction as db_transaction
+from django.db.models import BigIntegerField, F, Q, Sum
+from django.db.models.functions import Cast
+
+from .ledger import get_system_balances, rebuild_balance, lock_balances
+from .models import Balance, LedgerEntry
+from .money import to_minor_units
+
+RECONCILE_CHUNK_SIZE = 100_000
+ACCOUNTS = tuple(LedgerEntry.PROFILE_ACCOUNTS)
+FIELDS = tuple(LedgerEntry.PROFILE_ACCOUNTS[account] for account in ACCOUNTS)
+ACCOUNT_INDEX = {account: index for index, account in enumerate(ACCOUNTS)}
+
+
+def reconcile_range(profile_min, profile_max, chunk_size=RECONCILE_CHUNK_SIZE):
+    """
+    Сверяет балансы профилей с id в [profile_min, profile_max).
+    Баланс сравнивается с суммой своих проводок до контрольной точки last_entry_id,
+    поэтому операции, идущие во время сверки, расхождением не считаются.
+    Возвращает (число прочитанных проводок, список расхождений).
+    """
+    size = profile_max - profile_min
+    checkpoints = np.full(size, -1, dtype=np.int64)  # -1 — у профиля нет баланса
+    actual = np.zeros((size, len(FIELDS)), dtype=np.int64)
+    expected = np.zeros((size, len(FIELDS)), dtype=np.int64)
+
+    balances = (Balance.objects
+                .filter(profile_id__gte=profile_min, profile_id__lt=profile_max)
+                .values_list('profile_id', 'last_entry_id', *[to_minor_units(F(field)) for field in FIELDS])
+                .iterator(chunk_size=chunk_size))
+    for profile_id, last_entry_id, *values in balances:
+        checkpoints[profile_id - profile_min] = last_entry_id
+        actual[profile_id - profile_min] = values
+
+    # Обход по индексу (profile, account, id): каждый процесс читает только проводки своего диапазона
+    entries = (LedgerEntry.objects
+               .filter(profile_id__gte=profile_min, profile_id__lt=profile_max)
+               .order_by('profile_id', 'account', 'id'))
+    scanned = 0
+    position = None
+    while True:
+        chunk = entries
+        if position:
+            last_profile, last_account, last_id = position
+            chunk = entries.filter(
+                Q(profile_id__gte=last_profile) & (
+                    Q(profile_id__gt=last_profile)
+                    | Q(profile_id=last_profile, account__gt=last_account)
+                    | Q(profile_id=last_profile, account=last_account, id__gt=last_id)
+                )
+            )
+        # Проводки хранятся в копейках (MoneyField), Cast отдает их целым числом без обертки Money
+        rows = list(chunk.values_list('id', 'profile_id', 'account', Cast('amount', BigIntegerField()))[:chunk_size])
+        if not rows:
+            break
+        ids, profile_ids, accounts, amounts = zip(*rows)
+        ids = np.fromiter(ids, dtype=np.int64, count=len(rows))
+        indexes = np.fromiter(profile_ids, dtype=np.int64, count=len(rows)) - profile_min
+        columns = np.fromiter((ACCOUNT_INDEX[account] for account in accounts), dtype=np.int64, count=len(rows))
+        amounts = np.fromiter(amounts, dtype=np.int64, count=len(rows))
+
+        # Проводки после контрольной точки баланса еще не отражены в проекции на момент чтения
+        counted = ids <= checkpoints[indexes]
+        np.add.at(expected, (indexes[counted], columns[counted]), amounts[counted])
+
+        scanned += len(rows)
+        position = (profile_ids[-1], accounts[-1], rows[-1][0])
+
+    has_balance = checkpoints >= 0
+    drifted = np.nonzero(has_balance & (actual != expected).any(axis=1))[0]
+    drifts = []
+    for index in drifted:
+        for column in np.nonzero(actual[index] != expected[index])[0]:
+            drifts.append({
+                'profile_id': int(profile_min + index),
+                'field': FIELDS[column],
+                'balance': int(actual[index, column]),
+                'ledger': int(expected[index, column]),
+            })
+    return scanned, drifts
+
+
+def repair_balances(profile_ids, chunk_size=1000):
+    """Пересчитывает проекции указанных профилей по журналу проводок под блокировкой балансов."""
+    profile_ids = sorted(set(profile_ids))
+    repaired = 0
+    for offset in range(0, len(profile_ids), chunk_size):
+        with db_transaction.atomic():
+            balances = lock_balances(*profile_ids[offset:offset + chunk_size])
+            for balance in balances.values():
+                rebuild_balance(balance)
+                repaired += 1
+    return repaired
+
+
+def reconcile_system_accounts():
+    """
+    Сверяет суммы частей SystemAccountShard с проводками системных счетов.
+    Возвращает список расхождений: счет, сумма частей, сумма по журналу.
+    """
+    shards = get_system_balances()
+    journal = dict(LedgerEntry.objects.filter(profile__isnull=True).values_list('account')
+                   .annotate(total=Sum('amount')).order_by())
+    return [
+        {'account': account, 'shards': shards.get(account, 0), 'ledger': journal.get(account, 0)}
+        for account in sorted(shards.keys() | journal.keys())
+        if shards.get(account, 0) != journal.get(account, 0)
+    ]
@@ -0,0 +1,145 @@
+"""
+Дневные итоги транзакций (TransactionDailyRollup), обновляемые инкрементально.
+Новые транзакции берутся по журналу событий (payments.outbox) в порядке фиксации: итоги — обработчик
+ROLLUP_CONSUMER, его позиция — номер последнего учтенного события. Транзакция, которая получила id раньше,
+а зафиксировалась позже, получит больший номер и не окажется за позицией, как окажется за отметкой по id.
+Обновление идет пачками по номерам событий, каждая пачка — в своей транзакции БД вместе со сдвигом позиции.
+Пока позиции нет (первый запуск или сброс), итоги пересчитываются по всей истории обеих таблиц.
+"""
+from django.db import connections, transaction as db_transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+
+from .models import (OutboxConsumer, OutboxEvent, OutboxSequence, RollupWatermark, Transaction, TransactionArchive,
+                     TransactionDailyRollup)
+from .outbox import acknowledge, sequence_events
+
+WATERMARK_NAME = 'transaction_daily'
+ROLLUP_CONSUMER = 'transaction_daily_rollup'
+ROLLUP_CHUNK_SIZE = 50_000
+SOURCES = (Transaction, TransactionArchive)
+
+
+def _lock_watermark():
+    """Берет отметку под блокировку, чтобы два обработчика не учли одни и те же строки дважды."""
+    queryset = RollupWatermark.objects.filter(name=WATERMARK_NAME)
+    if connections[queryset.db].features.has_select_for_update:
+        return queryset.select_for_update().get()
+    # На SQLite холостой UPDATE сразу берет блокировку записи, как в lock_balances
+    queryset.update(last_created_at=F('last_created_at'))
+    return queryset.get()
+
+
+def _aggregate(condition):
+    """Итоги транзакций обеих таблиц, подходящих под condition: {(день, тип, статус): строка}."""
+    groups = {}
+    # Архивные транзакции сохраняют id, поэтому условие по id покрывает обе таблицы
+    for model in SOURCES:
+        rows = (model.objects
+                .filter(condition)
+                .annotate(day=TruncDate('created_at'))
+                .values('day', 'transaction_type', 'status')
+                .annotate(count=Count('id'), total=Sum('amount'), last_created_at=Max('created_at'))
+                .order_by())
+        for row in rows:
+            key = (row['day'], row['transaction_type'], row['status'])
+            if key in groups:
+                groups[key]['count'] += row['count']
+                groups[key]['total'] += row['total']
+                groups[key]['last_created_at'] = max(groups[key]['last_created_at'], row['last_created_at'])
+            else:
+                groups[key] = row
+    return groups
+
+
+def _merge(groups):
+    """Прибавляет группы к итогам. Возвращает число учтенных транзакций."""
+    if not groups:
+        return 0
+    existing = TransactionDailyRollup.objects.filter(day__in={day for day, _, _ in groups})
+    existing = {(row.day, row.transaction_type, row.status): row for row in existing}
+    to_create, to_update = [], []
+    for key, group in groups.items():
+        row = existing.get(key)
+        if row is None:
+            to_create.append(TransactionDailyRollup(
+                day=key[0], transaction_type=key[1], status=key[2], count=group['count'], total=group['total']
+            ))
+        else:
+            row.count += group['count']
+            row.total += group['total']
+            to_update.append(row)
+    TransactionDailyRollup.objects.bulk_create(to_create)
+    TransactionDailyRollup.objects.bulk_update(to_update, ['count', 'total'])
+    return sum(group['count'] for group in groups.values())
+
+
+def _advance(watermark, groups):
+    last_created_at = max((group['last_created_at'] for group in groups.values()), default=None)
+    watermark.last_created_at = max(filter(None, [watermark.last_created_at, last_created_at]), default=None)
+    watermark.save(update_fields=['last_created_at', 'updated_at'])
+
+
+def _rebuild(watermark):
+    """
+    Пересчитывает итоги по всей истории и ставит позицию на последний выданный номер события.
+    Транзакции, события которых еще без номера или с номером после позиции, не учитываются:
+    их учтет следующее обновление.
+    """
+    position = OutboxSequence.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+    pending = (OutboxEvent.objects.filter(Q(sequence__isnull=True) | Q(sequence__gt=position))
+               .values('transaction_id'))
+    groups = _aggregate(~Q(id__in=pending))
+    TransactionDailyRollup.objects.all().delete()
+    processed = _merge(groups)
+    OutboxConsumer.objects.update_or_create(name=ROLLUP_CONSUMER, defaults={'position': position})
+    watermark.last_created_at = None
+    _advance(watermark, groups)
+    return processed
+
+
+def update_rollups(chunk_size=ROLLUP_CHUNK_SIZE, max_chunks=None):
+    """
+    Догоняет итоги до последнего зафиксированного события журнала.
+    Возвращает (учтено строк, обработано пачек).
+    """
+    RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    processed = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        sequence_events()
+        with db_transaction.atomic():
+            watermark = _lock_watermark()
+            consumer = OutboxConsumer.objects.filter(name=ROLLUP_CONSUMER).first()
+            if consumer is None:
+                processed += _rebuild(watermark)
+            else:
+                sequences = (OutboxEvent.objects.filter(sequence__gt=consumer.position)
+                             .order_by('sequence').values_list('sequence', flat=True))
+                boundary = list(sequences[chunk_size - 1:chunk_size])
+                upper = boundary[0] if boundary else sequences.aggregate(upper=Max('sequence'))['upper']
+                if upper is None:
+                    break
+                events = OutboxEvent.objects.filter(sequence__gt=consumer.position, sequence__lte=upper)
+                groups = _aggregate(Q(id__in=events.values('transaction_id')))
+                processed += _merge(groups)
+                acknowledge(ROLLUP_CONSUMER, upper)
+                _advance(watermark, groups)
+        chunks += 1
+    return processed, chunks
+
+
+def reset_rollups():
+    """Удаляет итоги и позицию: следующий update_rollups пересчитает всю историю."""
+    with db_transaction.atomic():
+        TransactionDailyRollup.objects.all().delete()
+        OutboxConsumer.objects.filter(name=ROLLUP_CONSUMER).delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).update(last_created_at=None)
+
+
+def get_watermark():
+    return RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+
+
+def get_position():
+    """Номер последнего учтенного в итогах события журнала или None до первого пересчета."""
+    return OutboxConsumer.objects.filter(name=ROLLUP_CONSUMER).values_list('position', flat=True).first()
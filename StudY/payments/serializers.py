@@ -15,9 +15,22 @@ class WithdrawalRequestSerializer(serializers.ModelSerializer):
 
 
 class BalanceSerializer(serializers.ModelSerializer):
+    # Сумма действующих удержаний по заказам (EscrowHold), не колонка Balance
+    escrow_balance = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True, default=Decimal('0.00'))
+
     class Meta:
         model = Balance
-        fields = ['fiat_balance', 'frozen_balance', 'bonus_balance', 'forfeited_balance']
+        fields = ['fiat_balance', 'frozen_balance', 'bonus_balance', 'forfeited_balance', 'escrow_balance']
+
+
+class BalanceAsOfSerializer(serializers.Serializer):
+    as_of = serializers.DateTimeField()
+    fiat_balance = serializers.DecimalField(max_digits=10, decimal_places=2)
+    frozen_balance = serializers.DecimalField(max_digits=10, decimal_places=2)
+    bonus_balance = serializers.DecimalField(max_digits=10, decimal_places=2)
+    forfeited_balance = serializers.DecimalField(max_digits=10, decimal_places=2)
+    snapshot_at = serializers.DateTimeField(allow_null=True)
+    replayed_entries = serializers.IntegerField()
 
 
 class BonusTransferSerializer(serializers.Serializer):
@@ -46,4 +59,9 @@ class TransactionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Transaction
-        fields = ['transaction_type', 'amount', 'status', 'comment', 'created_at', 'dsc']
\ No newline at end of file
+        fields = ['transaction_type', 'amount', 'status', 'comment', 'created_at', 'dsc']
+
+class OutboxAcknowledgeSerializer(serializers.Serializer):
+    # Длина как у OutboxConsumer.name: длинное имя не обрезается до чужого обработчика, а отклоняется
+    consumer = serializers.CharField(max_length=50)
+    cursor = serializers.IntegerField(min_value=0)
@@ -1,14 +1,31 @@
+import uuid
+from datetime import timedelta
 from decimal import Decimal
-from django.db import transaction as db_transaction
+from django.db import connections, transaction as db_transaction
+from django.db.models import Count, F, Max, Q
 from django.utils.timezone import now
 from requests import Response
 from rest_framework import status
 import logging
 from .models import *
+from .balance_cache import store_balances
+from .fees import commission_amount as calculate_commission, get_bonus_account_limits, quantize_money, with_bonus_percent
+from .gateways import payouts_enabled
+from .ledger import LedgerOperation, apply_system_deltas, lock_balances
+from .outbox import publish_transactions
+from .statements import invalidate_late_statements
 from rank.services import check_user_rank
 
 logger = logging.getLogger(__name__)
 
+NO_ERROR_MESSAGE = "Тех. ошибки не обнаружено"
+
+# Ограничения вывода для профилей без настроек ранга
+DEFAULT_MIN_WITHDRAWAL_AMOUNT = 5000
+DEFAULT_WEEKLY_WITHDRAWAL_LIMIT = 3
+WITHDRAWAL_WINDOW = timedelta(days=7)
+WITHDRAWAL_BATCH_LIMIT = 500
+
 
 def generate_transaction_description(transaction_type, amount, bonus_used=Decimal("0.00"), fiat_used=Decimal("0.00")):
     """Генерирует описание транзакции в зависимости от типа."""
@@ -19,18 +36,52 @@ def generate_transaction_description(transaction_type, amount, bonus_used=Decima
     return "Неизвестная транзакция"
 
 
-def create_transaction(profile, amount, transaction_type, comment, status="completed", dsc=""):
-    """Универсальная функция для создания транзакций."""
-    return Transaction.objects.create(
-        profile=profile,
-        amount=amount,
-        transaction_type=transaction_type,
-        comment=comment,
-        status=status,
-        dsc=dsc,
-        created_at=now(),
-        error_message="Тех. ошибки не обнаружено"
-    )
+class TransactionBuffer:
+    """
+    Транзакции одной операции: add собирает их в памяти, flush записывает одним bulk_create
+    вместе с событиями outbox и проставляет id. Вызывается в конце блока atomic, до LedgerOperation.commit.
+    """
+
+    def __init__(self):
+        self.transactions = []
+
+    def add(self, profile, amount, transaction_type, comment, status="completed", dsc="", target_profile=None):
+        transaction = Transaction(
+            profile=profile,
+            target_profile=target_profile,
+            amount=amount,
+            transaction_type=transaction_type,
+            comment=comment,
+            status=status,
+            dsc=dsc,
+            created_at=now(),
+            error_message=NO_ERROR_MESSAGE
+        )
+        self.transactions.append(transaction)
+        return transaction
+
+    def flush(self):
+        if not self.transactions:
+            return []
+        if connections[Transaction.objects.db].features.can_return_rows_from_bulk_insert:
+            Transaction.objects.bulk_create(self.transactions)
+        else:
+            # Без RETURNING bulk_create не проставит id, а они нужны проводкам и ответу
+            for transaction in self.transactions:
+                transaction.save()
+        publish_transactions(self.transactions)
+        invalidate_late_statements(self.transactions)
+        transactions, self.transactions = self.transactions, []
+        return transactions
+
+
+def create_transaction(profile, amount, transaction_type, comment, status="completed", dsc="", target_profile=None):
+    """Универсальная функция для создания транзакций. Событие в outbox пишется в той же транзакции БД."""
+    buffer = TransactionBuffer()
+    transaction = buffer.add(profile, amount, transaction_type, comment, status, dsc, target_profile)
+    with db_transaction.atomic():
+        buffer.flush()
+    return transaction
 
 
 def process_transaction(
@@ -48,33 +99,35 @@ def process_transaction(
     """
     Функция обработки платежей в системе.
     """
+    # Профили получаем до начала транзакции: на SQLite любое чтение внутри нее
+    # взяло бы разделяемую блокировку раньше блокировки записи
+    sender_profile = user_from if is_profile else user_from.profile
+    receiver_profile = user_to.profile if user_to else None
+    dsc_message = ""
+
     try:
         with db_transaction.atomic():
-            # Получаем балансы пользователей
-            if is_profile:
-                sender_balance = Balance.objects.get(profile=user_from)
-            else:
-                sender_balance = Balance.objects.get(profile=user_from.profile)
-            receiver_balance = Balance.objects.get(profile=user_to.profile) if user_to else None
+            # Блокируем балансы пользователей
+            balances = lock_balances(sender_profile, receiver_profile)
+            sender_balance = balances[sender_profile.pk]
+            receiver_balance = balances[receiver_profile.pk] if receiver_profile else None
+            ledger = LedgerOperation()
+            buffer = TransactionBuffer()
 
             # Рассчитываем комиссию
-            commission_amount = (amount * commission) / 100 if commission > 0 else Decimal("0.00")
-            total_deduction = amount + commission_amount if commission > 0 else amount
+            commission_amount = calculate_commission(amount, commission)
+            total_deduction = amount + commission_amount
 
             bonus_used = Decimal("0.00")
             fiat_used = Decimal("0.00")
-            dsc_message = ""
 
             # Обрабатываем разные типы транзакций
             if transaction_type == "deposit":
-                sender_balance.fiat_balance += amount
+                ledger.move(amount, "external", (sender_balance, "fiat"))
                 comment = comment or "Пополнение фиата"
 
             elif transaction_type == "bonus_add":
-                if is_profile:
-                    receiver_limit = check_user_rank(user_from, "bonus_account_limit", is_profile=True)
-                else:
-                    receiver_limit = check_user_rank(user_from.profile, "bonus_account_limit")
+                receiver_limit = check_user_rank(sender_profile, "bonus_account_limit", is_profile=True)
                 if receiver_limit is False:
                     raise ValueError("Ошибка получения лимита бонусного счета")
                 current_receiver_bonus = sender_balance.bonus_balance
@@ -82,17 +135,19 @@ def process_transaction(
 
                 if available_limit >= amount:
                     # Полное зачисление бонусов
-                    sender_balance.bonus_balance += amount + (amount * rank_commission / 100)
+                    bonus_amount = with_bonus_percent(amount, rank_commission)
+                    ledger.move(bonus_amount, "bonus_fund", (sender_balance, "bonus"))
                     comment = comment or "Пополнение бонусов"
                     if is_profile:
-                        transaction = create_transaction(
-                            user_from, amount+ (amount * rank_commission / 100), "bonus_add", comment, "completed"
+                        transaction = buffer.add(
+                            sender_profile, bonus_amount, "bonus_add", comment, "completed"
                         )
                     else:
-                        transaction = create_transaction(
-                            user_from.profile, amount, "bonus_add", comment, "completed"
+                        transaction = buffer.add(
+                            sender_profile, amount, "bonus_add", comment, "completed"
                         )
-                    sender_balance.save()
+                    buffer.flush()
+                    ledger.commit(transaction)
 
                     return {
                         "status": "success",
@@ -102,24 +157,21 @@ def process_transaction(
                     }
 
                 elif available_limit > 0:
-                    if is_profile:
-                        user = user_from
-                    else:
-                        user = user_from.profile
                     # Частичное зачисление + остаток в упущенную прибыль
-                    sender_balance.bonus_balance += available_limit
                     forfeited_amount = amount - available_limit
-                    sender_balance.forfeited_balance += forfeited_amount
-                    transaction_success = create_transaction(
-                        user, available_limit, "bonus_add",
+                    ledger.move(available_limit, "bonus_fund", (sender_balance, "bonus"))
+                    ledger.move(forfeited_amount, "bonus_fund", (sender_balance, "forfeited"))
+                    transaction_success = buffer.add(
+                        sender_profile, available_limit, "bonus_add",
                         f"Частичное пополнение бонусов ({available_limit}р)", "completed"
                     )
-                    transaction_forfeited = create_transaction(
-                        user, forfeited_amount, "bonus_forfeited",
+                    transaction_forfeited = buffer.add(
+                        sender_profile, forfeited_amount, "bonus_forfeited",
                         f"Вам предназначалось {amount}р, к сожалению ваш лимит на бонусный счет заполнен, "
                         f"остаток {forfeited_amount}р не смогли перевести  .", "completed"
                     )
-                    sender_balance.save()
+                    buffer.flush()
+                    ledger.commit(transaction_success)
                     return {
                         "status": "partial_success",
                         "comment": f"Пополнение {available_limit}р, остаток {forfeited_amount}р не переведен",
@@ -132,14 +184,15 @@ def process_transaction(
                     }
                 else:
                     # Лимит уже заполнен, весь бонус уходит в упущенную прибыль
-                    sender_balance.forfeited_balance += amount
-                    transaction_forfeited = create_transaction(
-                        user_from.profile, amount, "bonus_forfeited",
+                    ledger.move(amount, "bonus_fund", (sender_balance, "forfeited"))
+                    transaction_forfeited = buffer.add(
+                        sender_profile, amount, "bonus_forfeited",
                         f"Вам предназначалось {amount}р, к сожалению ваш лимит на бонусный счет заполнен, "
                         f"перевод не выполнен.", "completed"
 
                     )
-                    sender_balance.save()
+                    buffer.flush()
+                    ledger.commit(transaction_forfeited)
                     return {
                         "status": "failed",
                         "comment": f"Пополнение не выполнено: ваш лимит заполнен, сумма {amount}р зачислена в упущенную прибыль.",
@@ -162,17 +215,18 @@ def process_transaction(
                 available_limit = receiver_limit - current_receiver_bonus
                 if available_limit >= amount:
                     # Полный перевод возможен
-                    sender_balance.bonus_balance -= total_deduction
-                    receiver_balance.bonus_balance += amount
+                    ledger.move(amount, (sender_balance, "bonus"), (receiver_balance, "bonus"))
+                    ledger.move(commission_amount, (sender_balance, "bonus"), "commission")
                     dsc_message = f"Перевод бонусов {amount}р"
-                    transaction_out = create_transaction(
-                        user_from.profile, amount, "bonus_transfer", f"Перевод бонусов пользователю {user_to.username}"
+                    transaction_out = buffer.add(
+                        sender_profile, amount, "bonus_transfer", f"Перевод бонусов пользователю {user_to.username}",
+                        target_profile=receiver_profile
                     )
-                    transaction_in = create_transaction(
-                        user_to.profile, amount, "bonus_add", f"Пополнение бонусов от {user_from.username}"
+                    transaction_in = buffer.add(
+                        receiver_profile, amount, "bonus_add", f"Пополнение бонусов от {user_from.username}"
                     )
-                    sender_balance.save()
-                    receiver_balance.save()
+                    buffer.flush()
+                    ledger.commit(transaction_out)
                     return {
                         "status": "success",
                         "comment": f"Перевод {amount}р пользователю {user_to.username} выполнен",
@@ -185,26 +239,26 @@ def process_transaction(
 
                 elif available_limit > 0:
                     # Частичный перевод (переводим только доступную сумму)
-                    sender_balance.bonus_balance -= available_limit
-                    receiver_balance.bonus_balance += available_limit
-                    transaction_out_partial = create_transaction(
-                        user_from.profile, available_limit, "bonus_transfer",
-                        f"Частичный перевод бонусов пользователю {user_to.username}"
+                    ledger.move(available_limit, (sender_balance, "bonus"), (receiver_balance, "bonus"))
+                    transaction_out_partial = buffer.add(
+                        sender_profile, available_limit, "bonus_transfer",
+                        f"Частичный перевод бонусов пользователю {user_to.username}",
+                        target_profile=receiver_profile
                     )
 
-                    transaction_in_partial = create_transaction(
-                        user_to.profile, available_limit, "bonus_add",
+                    transaction_in_partial = buffer.add(
+                        receiver_profile, available_limit, "bonus_add",
                         f"Пополнение бонусов от {user_from.username}"
                     )
                     # Неуспешная транзакция на оставшуюся сумму
                     failed_amount = amount - available_limit
-                    transaction_out_failed = create_transaction(
-                        user_from.profile, failed_amount, "bonus_transfer_failed",
+                    transaction_out_failed = buffer.add(
+                        sender_profile, failed_amount, "bonus_transfer_failed",
                         "У {} заполнился лимит, перевод невозможен".format(user_to.username),
-                        "failed"
+                        "failed", target_profile=receiver_profile
                     )
-                    sender_balance.save()
-                    receiver_balance.save()
+                    buffer.flush()
+                    ledger.commit(transaction_out_partial)
                     return {
                         "status": "partial_success",
                         "comment": f"Частичный перевод {available_limit}р, оставшиеся {failed_amount}р не переведены",
@@ -218,11 +272,12 @@ def process_transaction(
 
                 else:
                     # Лимит получателя уже заполнен — перевод невозможен
-                    transaction_out_failed = create_transaction(
-                        user_from.profile, amount, "bonus_transfer_failed",
+                    transaction_out_failed = buffer.add(
+                        sender_profile, amount, "bonus_transfer_failed",
                         "У {} заполнился лимит, перевод невозможен".format(user_to.username),
-                        "failed"
+                        "failed", target_profile=receiver_profile
                     )
+                    buffer.flush()
 
                     return {
                         "status": "failed",
@@ -233,24 +288,24 @@ def process_transaction(
 
             elif transaction_type == "payment":
                 if use_bonus:
-                    max_bonus_usage = min(sender_balance.bonus_balance, amount)
-                    sender_balance.bonus_balance -= max_bonus_usage
-                    bonus_used = max_bonus_usage
-                    amount -= max_bonus_usage
+                    bonus_used = min(sender_balance.bonus_balance, amount)
+                    amount -= bonus_used
 
                 if sender_balance.fiat_balance < amount + commission_amount:
                     shortfall = (amount + commission_amount) - sender_balance.fiat_balance
                     raise ValueError(f"Недостаточно фиатных средств. Вам не хватает {shortfall}р")
 
-                sender_balance.fiat_balance -= (amount + commission_amount)
                 fiat_used = amount + commission_amount
+                ledger.move(bonus_used, (sender_balance, "bonus"), "revenue")
+                ledger.move(amount, (sender_balance, "fiat"), "revenue")
+                ledger.move(commission_amount, (sender_balance, "fiat"), "commission")
                 dsc_message = generate_transaction_description(transaction_type, amount, bonus_used, fiat_used)
 
                 # receiver_balance.frozen_balance += amount
                 comment = comment or "Оплата с фиатного счета"
 
             elif transaction_type == "refund":
-                sender_balance.fiat_balance += amount
+                ledger.move(amount, "revenue", (sender_balance, "fiat"))
                 comment = comment or "Возврат средств"
 
             elif transaction_type == "withdrawal":
@@ -258,7 +313,8 @@ def process_transaction(
                     shortfall = total_deduction - sender_balance.frozen_balance
                     raise ValueError(f"Недостаточно средств для вывода. Не хватает {shortfall}р")
 
-                sender_balance.frozen_balance -= total_deduction
+                ledger.move(amount, (sender_balance, "frozen"), "external")
+                ledger.move(commission_amount, (sender_balance, "frozen"), "commission")
                 comment = comment or "Вывод средств"
 
             elif transaction_type == "freeze":
@@ -266,29 +322,23 @@ def process_transaction(
                     shortfall = amount - sender_balance.fiat_balance
                     raise ValueError(f"Недостаточно средств для заморозки. Не хватает {shortfall}р")
 
-                sender_balance.fiat_balance -= amount
-                sender_balance.frozen_balance += amount
+                ledger.move(amount, (sender_balance, "fiat"), (sender_balance, "frozen"))
                 comment = comment or "Заморозка средств"
 
             elif transaction_type == "unfreeze":
                 if sender_balance.frozen_balance < amount:
                     raise ValueError("Недостаточно замороженных средств.")
 
-                sender_balance.frozen_balance -= amount
-                sender_balance.fiat_balance += amount
+                ledger.move(amount, (sender_balance, "frozen"), (sender_balance, "fiat"))
                 comment = comment or "Разморозка средств"
 
             else:
                 raise ValueError("Некорректный тип транзакции.")
 
-            # Сохраняем изменения в балансах
-            sender_balance.save()
-            if receiver_balance:
-                receiver_balance.save()
-
             # Записываем успешную транзакцию
-            transaction = create_transaction(user_from.profile, amount, transaction_type, comment, "completed",
-                                             dsc_message)
+            transaction = buffer.add(sender_profile, amount, transaction_type, comment, "completed", dsc_message)
+            buffer.flush()
+            ledger.commit(transaction)
 
             return {
                 "status": "success",
@@ -302,7 +352,7 @@ def process_transaction(
         logger.error(f"Ошибка при обработке транзакции: {error_message}, тип: {transaction_type}")
 
         # В случае ошибки создаем транзакцию с неудачным статусом
-        transaction = create_transaction(user_from.profile, amount, transaction_type, "Ошибка платежа", "failed",
+        transaction = create_transaction(sender_profile, amount, transaction_type, "Ошибка платежа", "failed",
                                          error_message)
 
         return {"status": "failed",
@@ -328,3 +378,300 @@ def transaction_to_dict(transaction):
         "error_message": transaction.error_message
     }
 
+
+def bulk_credit_bonuses(items, chunk_size=1000):
+    """
+    Массовое начисление бонусов (акции, реферальные выплаты).
+    items — итерируемое из кортежей (profile_id, amount, comment).
+    Лимиты бонусного счета берутся одним запросом по всем рангам; сумма сверх лимита
+    уходит в упущенную прибыль по тем же правилам, что и bonus_add в process_transaction.
+    Каждая пачка из chunk_size начислений записывается в отдельной транзакции БД
+    через bulk_create/bulk_update. Возвращает сводку по начислениям.
+    """
+    rank_limits = get_bonus_account_limits()
+    summary = {
+        "credited": 0, "partial": 0, "forfeited": 0, "missing": [],
+        "credited_total": Decimal("0.00"), "forfeited_total": Decimal("0.00"),
+    }
+
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            _credit_bonus_chunk(chunk, rank_limits, summary)
+            chunk = []
+    if chunk:
+        _credit_bonus_chunk(chunk, rank_limits, summary)
+    return summary
+
+
+def _credit_bonus_chunk(chunk, rank_limits, summary):
+    """Начисляет одну пачку бонусов в рамках одной транзакции БД."""
+    with db_transaction.atomic():
+        profile_ids = {profile_id for profile_id, _, _ in chunk}
+        profile_ranks = dict(
+            Profile.objects.filter(id__in=profile_ids, balance__isnull=False).values_list('id', 'rank_id')
+        )
+        balances = lock_balances(*profile_ranks)
+
+        transactions = []
+        postings = []
+        for profile_id, amount, comment in chunk:
+            balance = balances.get(profile_id)
+            if balance is None:
+                summary["missing"].append(profile_id)
+                continue
+
+            amount = quantize_money(amount)
+            available_limit = max(rank_limits.get(profile_ranks[profile_id], 0) - balance.bonus_balance, 0)
+            credited = min(amount, available_limit)
+            forfeited = amount - credited
+            balance.bonus_balance += credited
+            balance.forfeited_balance += forfeited
+
+            if credited:
+                transactions.append(Transaction(
+                    profile_id=profile_id, amount=credited, transaction_type="bonus_add",
+                    comment=comment or "Пополнение бонусов", status="completed", error_message=NO_ERROR_MESSAGE
+                ))
+                postings.append((balance, "bonus", credited))
+            if forfeited:
+                transactions.append(Transaction(
+                    profile_id=profile_id, amount=forfeited, transaction_type="bonus_forfeited",
+                    comment=f"Вам предназначалось {amount}р, к сожалению ваш лимит на бонусный счет заполнен, "
+                            f"остаток {forfeited}р не смогли перевести.",
+                    status="completed", error_message=NO_ERROR_MESSAGE
+                ))
+                postings.append((balance, "forfeited", forfeited))
+
+            summary["credited_total"] += credited
+            summary["forfeited_total"] += forfeited
+            if not forfeited:
+                summary["credited"] += 1
+            elif credited:
+                summary["partial"] += 1
+            else:
+                summary["forfeited"] += 1
+
+        transactions = Transaction.objects.bulk_create(transactions, batch_size=500)
+        publish_transactions(transactions)
+        invalidate_late_statements(transactions)
+        entries = []
+        for transaction, (balance, account, amount) in zip(transactions, postings):
+            operation = uuid.uuid4()
+            entries.append(LedgerEntry(operation=operation, transaction=transaction, account="bonus_fund",
+                                       amount=-amount))
+            entries.append(LedgerEntry(operation=operation, transaction=transaction,
+                                       profile_id=balance.profile_id, account=account, amount=amount))
+        entries = LedgerEntry.objects.bulk_create(entries, batch_size=500)
+        apply_system_deltas(entries)
+
+        for entry in entries:
+            if entry.profile_id and entry.pk:
+                balance = balances[entry.profile_id]
+                balance.last_entry_id = max(balance.last_entry_id, entry.pk)
+        Balance.objects.bulk_update(
+            list(balances.values()),
+            ['bonus_balance', 'forfeited_balance', 'last_entry_id'],
+            batch_size=500
+        )
+        store_balances(balances.values())
+
+
+def get_withdrawal_stats(user):
+    """
+    Одним запросом собирает все, что нужно для проверки заявки на вывод:
+    активные заявки, дату последнего успешного вывода, число выводов за 7 дней и лимиты ранга.
+    """
+    window_start = now() - WITHDRAWAL_WINDOW
+    settings = 'profile__rank__settings__'
+    return (User.objects
+            .filter(pk=user.pk)
+            .values(
+                min_amount=F(f'{settings}min_withdrawal_amount'),
+                weekly_limit=F(f'{settings}weekly_withdrawal_limit'),
+                unlimited=F(f'{settings}unlimited_fiat_withdrawals'),
+                customer_unlimited=F(f'{settings}customer_unlimited_fiat_withdrawals'),
+                executer_unlimited=F(f'{settings}executer_unlimited_fiat_withdrawals'),
+            )
+            .annotate(
+                pending=Count('withdrawalrequest', filter=Q(withdrawalrequest__status__in=['pending', 'processing'])),
+                last_completed=Max('withdrawalrequest__date_submitted',
+                                   filter=Q(withdrawalrequest__status='completed')),
+                weekly_count=Count('withdrawalrequest', filter=Q(withdrawalrequest__status='completed',
+                                                                 withdrawalrequest__date_submitted__gte=window_start)),
+            )
+            .get())
+
+
+def check_withdrawal_eligibility(user, amount):
+    """
+    Проверяет, может ли пользователь подать заявку на вывод суммы amount.
+    Возвращает None, если может, иначе словарь с ошибкой для ответа API.
+    """
+    stats = get_withdrawal_stats(user)
+
+    if stats['pending']:
+        return {"error": "У вас уже есть активная заявка на вывод средств"}
+
+    min_amount = stats['min_amount'] if stats['min_amount'] is not None else DEFAULT_MIN_WITHDRAWAL_AMOUNT
+    if amount < min_amount:
+        return {
+            "error": f"Минимальная сумма для вывода {min_amount}р, для успешного вывода вам не хватает {min_amount - amount}р"
+        }
+
+    unlimited = stats['unlimited'] or stats['customer_unlimited'] or stats['executer_unlimited']
+    weekly_limit = stats['weekly_limit'] if stats['weekly_limit'] is not None else DEFAULT_WEEKLY_WITHDRAWAL_LIMIT
+    if not unlimited and stats['last_completed'] and stats['weekly_count'] >= weekly_limit:
+        days_since_last_withdrawal = (now().date() - stats['last_completed'].date()).days
+        remaining_days = max(WITHDRAWAL_WINDOW.days - days_since_last_withdrawal, 0)
+        return {
+            'remaining_days': remaining_days,
+            "error": f"Вы превысили количество выводов на этой неделе, вывести денежные средства вы сможете через {remaining_days} дней"
+        }
+    return None
+
+
+def process_withdrawal_batch(items):
+    """
+    Пакетное одобрение и отклонение заявок на вывод финансистом.
+    items — список словарей {"id", "action": "approve" | "reject", "comment"}.
+    Заявки и балансы блокируются в одной транзакции БД, проводки withdrawal/unfreeze
+    записываются через bulk_create. Ошибка одной заявки не отменяет остальные.
+    Возвращает результаты в порядке items: {"id", "status": "success" | "failed", "message"}.
+    """
+    results = []
+    accepted = {}
+    for item in items:
+        request_id, action = item.get("id"), item.get("action")
+        comment = (item.get("comment") or "").strip()
+        if not isinstance(request_id, int) or isinstance(request_id, bool):
+            message = "Некорректный id заявки"
+        elif request_id in accepted:
+            message = "Заявка указана в пакете повторно"
+        elif action not in ("approve", "reject"):
+            message = "Некорректное действие"
+        elif action == "reject" and not comment:
+            message = "При отклонении заявки поле комментарий является обязательным"
+        else:
+            accepted[request_id] = (action, comment)
+            message = None
+        results.append({"id": request_id, "status": "failed" if message else "pending", "message": message})
+
+    if accepted:
+        # Профили читаем до транзакции, внутри первой идет блокировка балансов (см. process_transaction)
+        profile_ids = dict(WithdrawalRequest.objects.filter(id__in=accepted, user__profile__isnull=False)
+                           .values_list('id', 'user__profile__id'))
+        outcomes = _process_withdrawal_chunk(accepted, profile_ids)
+        for result in results:
+            if result["status"] == "pending":
+                result["status"], result["message"] = outcomes[result["id"]]
+    return results
+
+
+def _process_withdrawal_chunk(accepted, profile_ids):
+    """Проводит одобрения и отклонения одной транзакцией БД. Возвращает {id: (status, message)}."""
+    outcomes = {request_id: ("failed", "Заявка не найдена") for request_id in accepted}
+    timestamp = now()
+
+    with db_transaction.atomic():
+        balances = lock_balances(*set(profile_ids.values())) if profile_ids else {}
+        requests = WithdrawalRequest.objects.filter(id__in=profile_ids).order_by('id')
+        if connections[requests.db].features.has_select_for_update:
+            requests = requests.select_for_update()
+
+        to_update = []
+        transactions = []
+        postings = []
+        jobs = []
+        for withdrawal_request in requests:
+            action, comment = accepted[withdrawal_request.id]
+            if withdrawal_request.status != "pending":
+                outcomes[withdrawal_request.id] = ("failed", "Изменение заявки запрещено, так как она уже обработана")
+                continue
+
+            if action == "approve" and payouts_enabled():
+                # Средства остаются замороженными до ответа платежного шлюза
+                withdrawal_request.status = "processing"
+                withdrawal_request.date_updated = timestamp
+                jobs.append(PayoutJob(withdrawal_request=withdrawal_request, next_attempt_at=timestamp))
+                outcomes[withdrawal_request.id] = ("success", "Заявка одобрена и передана на выплату")
+                continue
+
+            balance = balances[profile_ids[withdrawal_request.id]]
+            amount = withdrawal_request.amount
+            transaction_type = "withdrawal" if action == "approve" else "unfreeze"
+            if balance.frozen_balance < amount:
+                error_message = (f"Недостаточно средств для вывода. Не хватает {amount - balance.frozen_balance}р"
+                                 if action == "approve" else "Недостаточно замороженных средств.")
+                transactions.append(Transaction(
+                    profile_id=balance.profile_id, amount=amount, transaction_type=transaction_type,
+                    comment="Ошибка платежа", status="failed", dsc=error_message, error_message=NO_ERROR_MESSAGE
+                ))
+                postings.append(None)
+                outcomes[withdrawal_request.id] = (
+                    "failed", "Ошибка при обработке вывода" if action == "approve"
+                    else "Ошибка при возврате средств с замороженного счета"
+                )
+                continue
+
+            balance.frozen_balance -= amount
+            if action == "approve":
+                transaction = Transaction(
+                    profile_id=balance.profile_id, amount=amount, transaction_type="withdrawal",
+                    comment="Вывод средств на БК", status="completed", dsc="", error_message=NO_ERROR_MESSAGE
+                )
+                withdrawal_request.status = "completed"
+                withdrawal_request.comment_whores = "comment: "
+                postings.append((balance, "external"))
+                outcomes[withdrawal_request.id] = ("success", "Заявка одобрена и обработана")
+            else:
+                balance.fiat_balance += amount
+                transaction = Transaction(
+                    profile_id=balance.profile_id, amount=amount, transaction_type="unfreeze",
+                    comment="Возврат средств после отклонения заявки", status="completed", dsc="",
+                    error_message=NO_ERROR_MESSAGE
+                )
+                withdrawal_request.status = "cancelled"
+                withdrawal_request.comment = comment
+                postings.append((balance, "fiat"))
+                outcomes[withdrawal_request.id] = ("success", "Заявка отклонена, средства возвращены на фиатный счет")
+            transactions.append(transaction)
+            withdrawal_request.date_updated = timestamp
+            to_update.append((withdrawal_request, transaction, action))
+
+        transactions = Transaction.objects.bulk_create(transactions, batch_size=500)
+        publish_transactions(transactions)
+        invalidate_late_statements(transactions)
+        entries = []
+        for transaction, posting in zip(transactions, postings):
+            if posting is None:
+                continue
+            balance, target = posting
+            operation = uuid.uuid4()
+            entries.append(LedgerEntry(operation=operation, transaction=transaction,
+                                       profile_id=balance.profile_id, account="frozen", amount=-transaction.amount))
+            entries.append(LedgerEntry(operation=operation, transaction=transaction,
+                                       profile_id=balance.profile_id if target == "fiat" else None,
+                                       account=target, amount=transaction.amount))
+        entries = LedgerEntry.objects.bulk_create(entries, batch_size=500)
+        apply_system_deltas(entries)
+
+        for entry in entries:
+            if entry.profile_id and entry.pk:
+                balance = balances[entry.profile_id]
+                balance.last_entry_id = max(balance.last_entry_id, entry.pk)
+        Balance.objects.bulk_update(list(balances.values()),
+                                    ['fiat_balance', 'frozen_balance', 'last_entry_id'], batch_size=500)
+        store_balances(balances.values())
+
+        for withdrawal_request, transaction, action in to_update:
+            # Одобренная заявка ссылается на транзакцию вывода, отклоненная сохраняет транзакцию заморозки
+            if action == "approve":
+                withdrawal_request.transaction = transaction
+        WithdrawalRequest.objects.bulk_update(
+            [withdrawal_request for withdrawal_request, _, _ in to_update] + [job.withdrawal_request for job in jobs],
+            ['status', 'transaction', 'comment', 'comment_whores', 'date_updated'], batch_size=500
+        )
+        PayoutJob.objects.bulk_create(jobs, batch_size=500)
+    return outcomes
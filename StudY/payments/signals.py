@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from order.models import Order
+from rank.models import RankSettings
+
+from .balance_cache import invalidate_balances
+from .escrow import refund_cancelled_order
+from .fees import invalidate_rank_tables
+from .models import Balance
+
+
+@receiver([post_save, post_delete], sender=Balance)
+def invalidate_balance_cache(sender, instance, **kwargs):
+    # Движок пишет балансы через UPDATE и сам обновляет кэш; сюда попадают правки через save() — админка, get_or_create
+    invalidate_balances([instance.profile_id])
+
+
+@receiver([post_save, post_delete], sender=RankSettings)
+def invalidate_rank_fee_tables(sender, instance, **kwargs):
+    invalidate_rank_tables()
+
+
+@receiver(post_save, sender=Order)
+def refund_cancelled_order_holds(sender, instance, **kwargs):
+    # Отмена заказа в работе (через save(), в том числе из админки) возвращает удержанную стоимость заказчику
+    refund_cancelled_order(instance)
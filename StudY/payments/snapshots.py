@@ -0,0 +1,112 @@
+"""
+Баланс на дату по снимкам BalanceSnapshot.
+Снимок хранит проекцию Balance вместе с контрольной точкой last_entry_id, поэтому баланс
+на момент X — это ближайший снимок не позже X (поиск по индексу profile, taken_at)
+плюс проводки профиля после его контрольной точки, созданные не позже X.
+Хвост ограничен частотой снимков, а не длиной истории профиля.
+"""
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .fees import quantize_money
+from .models import Balance, BalanceSnapshot, LedgerEntry
+
+SNAPSHOT_CHUNK_SIZE = 5000
+ACCOUNTS = tuple(LedgerEntry.PROFILE_ACCOUNTS)
+SNAPSHOT_FIELDS = tuple(LedgerEntry.PROFILE_ACCOUNTS.values())
+
+
+def _profile_entries(profile_id, after_id=0):
+    # account__in вместе с profile дает поиск по индексу (profile, account, id) по каждому счету
+    return LedgerEntry.objects.filter(profile_id=profile_id, account__in=ACCOUNTS, id__gt=after_id)
+
+
+def take_snapshots(every=None, max_age=None, chunk_size=SNAPSHOT_CHUNK_SIZE):
+    """
+    Записывает снимки балансов, у которых с прошлого снимка накопилось every проводок
+    или прошло больше max_age. Балансы без новых проводок пропускаются.
+    Строка Balance меняется одним UPDATE вместе с last_entry_id, поэтому снимок берется без блокировки.
+    Возвращает число записанных снимков.
+    """
+    every = every or settings.BALANCE_SNAPSHOT_EVERY
+    max_age = max_age or settings.BALANCE_SNAPSHOT_MAX_AGE
+    stale_before = timezone.now() - max_age
+    latest = BalanceSnapshot.objects.filter(profile_id=OuterRef('profile_id')).order_by('-taken_at', '-last_entry_id')
+    balances = (Balance.objects
+                .annotate(snapshot_entry_id=Subquery(latest.values('last_entry_id')[:1]),
+                          snapshot_taken_at=Subquery(latest.values('taken_at')[:1]))
+                .order_by('profile_id'))
+
+    written = 0
+    last_profile_id = 0
+    while True:
+        chunk = list(balances.filter(profile_id__gt=last_profile_id, last_entry_id__gt=0)
+                     .values('profile_id', 'last_entry_id', 'snapshot_entry_id', 'snapshot_taken_at',
+                             *SNAPSHOT_FIELDS)[:chunk_size])
+        if not chunk:
+            break
+        last_profile_id = chunk[-1]['profile_id']
+
+        due = []
+        for row in chunk:
+            snapshot_entry_id = row['snapshot_entry_id'] or 0
+            if row['last_entry_id'] <= snapshot_entry_id:
+                continue
+            if row['snapshot_taken_at'] is None or row['snapshot_taken_at'] < stale_before:
+                due.append(row)
+            # Считаем не больше every проводок: достаточно знать, что порог достигнут
+            elif _profile_entries(row['profile_id'], snapshot_entry_id)[:every].count() >= every:
+                due.append(row)
+        if not due:
+            continue
+
+        # Момент снимка — время проводки контрольной точки, а не время запуска команды
+        taken_at = dict(LedgerEntry.objects.filter(id__in=[row['last_entry_id'] for row in due])
+                        .values_list('id', 'created_at'))
+        # ignore_conflicts не сообщает, какие строки вставлены: снимки, которые уже есть, отбрасываем заранее
+        existing = set(BalanceSnapshot.objects
+                       .filter(profile_id__in=[row['profile_id'] for row in due],
+                               last_entry_id__in=[row['last_entry_id'] for row in due])
+                       .values_list('profile_id', 'last_entry_id'))
+        snapshots = [
+            BalanceSnapshot(profile_id=row['profile_id'], last_entry_id=row['last_entry_id'],
+                            taken_at=taken_at[row['last_entry_id']],
+                            **{field: row[field] for field in SNAPSHOT_FIELDS})
+            for row in due
+            if row['last_entry_id'] in taken_at and (row['profile_id'], row['last_entry_id']) not in existing
+        ]
+        # Конфликт остается возможен только с параллельным запуском, записавшим тот же снимок
+        BalanceSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+        written += len(snapshots)
+    return written
+
+
+def balance_as_of(profile_id, moment):
+    """
+    Баланс профиля на момент moment: ближайший снимок не позже moment и проводки после него.
+    Возвращает словарь полей баланса с датой снимка и числом доигранных проводок.
+    """
+    snapshot = (BalanceSnapshot.objects
+                .filter(profile_id=profile_id, taken_at__lte=moment)
+                .order_by('-taken_at', '-last_entry_id')
+                .first())
+    values = {field: getattr(snapshot, field) if snapshot else 0 for field in SNAPSHOT_FIELDS}
+
+    tail = (_profile_entries(profile_id, snapshot.last_entry_id if snapshot else 0)
+            .filter(created_at__lte=moment)
+            .values('account')
+            .annotate(total=Sum('amount'), entries=Count('id'))
+            .order_by())
+    replayed = 0
+    for row in tail:
+        field = LedgerEntry.PROFILE_ACCOUNTS[row['account']]
+        values[field] += row['total'].amount
+        replayed += row['entries']
+
+    return {
+        'as_of': moment,
+        **{field: quantize_money(value) for field, value in values.items()},
+        'snapshot_at': snapshot.taken_at if snapshot else None,
+        'replayed_entries': replayed,
+    }
@@ -0,0 +1,237 @@
+"""
+Месячные выписки по счету (AccountStatement).
+Запрос выписки только ставит ее в очередь; команда run_statement_worker собирает итоги месяца
+одним сгруппированным запросом по каждой таблице транзакций (горячей и архиву), остатки на начало
+и конец месяца — по снимкам балансов, и сохраняет файл в хранилище. Закрытый месяц не меняется,
+поэтому готовая выписка отдается из кэша по неизменяемому ключу. Исключение — транзакция, зафиксированная
+уже после закрытия своего месяца: invalidate_late_statements сбрасывает такие выписки и ставит их в очередь заново.
+"""
+import csv
+import io
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import transaction as db_transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.timezone import now
+
+from .export import EXPORT_HEADERS, export_rows
+from .fees import quantize_money
+from .models import AccountStatement, Transaction, TransactionArchive
+from .snapshots import SNAPSHOT_FIELDS, balance_as_of
+
+try:
+    import reportlab  # noqa: F401
+except ImportError:
+    reportlab = None
+
+CLAIM_CANDIDATES = 10
+SOURCES = (Transaction, TransactionArchive)
+
+
+def month_bounds(month):
+    """Начало месяца и начало следующего в текущем часовом поясе."""
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return start, timezone.make_aware(datetime(following.year, following.month, 1))
+
+
+def is_closed(month):
+    """Месяц закрыт, если закончился и параллельные транзакции последних секунд уже зафиксированы."""
+    return month_bounds(month)[1] + settings.TRANSACTION_ROLLUP_DELAY <= now()
+
+
+def statement_cache_key(profile_id, month, statement_format):
+    # Ключ сбрасывается только при поздней фиксации транзакции закрытого месяца (invalidate_late_statements)
+    return f'statement:{profile_id}:{month:%Y-%m}:{statement_format}'
+
+
+def get_cached_statement(profile_id, month, statement_format):
+    """Имя файла готовой выписки из кэша или None."""
+    return caches[settings.STATEMENT_CACHE_ALIAS].get(statement_cache_key(profile_id, month, statement_format))
+
+
+def cache_statement(statement):
+    caches[settings.STATEMENT_CACHE_ALIAS].set(
+        statement_cache_key(statement.profile_id, statement.month, statement.statement_format),
+        statement.file.name, None
+    )
+
+
+def invalidate_late_statements(transactions):
+    """
+    Время транзакции выдается при вставке, а фиксация может прийти после закрытия ее месяца.
+    После фиксации выписки таких месяцев возвращаются в очередь, а их записи в кэше удаляются.
+    Вызывается в транзакции БД, создавшей transactions, рядом с publish_transactions.
+    """
+    months = {(transaction.profile_id, timezone.localtime(transaction.created_at).date().replace(day=1))
+              for transaction in transactions}
+
+    def invalidate():
+        late = [(profile_id, month) for profile_id, month in months if is_closed(month)]
+        if not late:
+            return
+        condition = Q()
+        for profile_id, month in late:
+            condition |= Q(profile_id=profile_id, month=month)
+        # Сначала очередь, потом кэш: представление не вернет в кэш файл выписки, уже поставленной в очередь.
+        # Обработчик, который сейчас формирует выписку, не сможет ее сохранить и сформирует заново
+        AccountStatement.objects.filter(condition).exclude(status='queued').update(status='queued', locked_by='')
+        caches[settings.STATEMENT_CACHE_ALIAS].delete_many([
+            statement_cache_key(profile_id, month, statement_format)
+            for profile_id, month in late for statement_format, _ in AccountStatement.FORMAT_CHOICES
+        ])
+
+    db_transaction.on_commit(invalidate)
+
+
+def request_statement(profile, month, statement_format):
+    """Возвращает выписку, при необходимости ставя ее в очередь. Выписка с ошибкой ставится заново."""
+    statement, _ = AccountStatement.objects.get_or_create(
+        profile=profile, month=month, statement_format=statement_format
+    )
+    if statement.status == 'failed':
+        AccountStatement.objects.filter(pk=statement.pk, status='failed').update(status='queued', last_error='')
+        statement.status = 'queued'
+    return statement
+
+
+def requeue_stale_statements():
+    """Возвращает в очередь выписки, обработчик которых пропал дольше STATEMENT_JOB_TIMEOUT назад."""
+    return AccountStatement.objects.filter(
+        status='processing', locked_at__lt=now() - settings.STATEMENT_JOB_TIMEOUT
+    ).update(status='queued', locked_by='')
+
+
+def claim_statement(worker_name):
+    """Забирает выписку из очереди условным UPDATE, как claim_job в очереди выплат."""
+    candidates = list(AccountStatement.objects.filter(status='queued').order_by('id')
+                      .values_list('id', flat=True)[:CLAIM_CANDIDATES])
+    for statement_id in candidates:
+        claimed = AccountStatement.objects.filter(pk=statement_id, status='queued').update(
+            status='processing', locked_by=worker_name, locked_at=now()
+        )
+        if claimed:
+            return AccountStatement.objects.select_related('profile__user').get(pk=statement_id)
+    return None
+
+
+def build_statement(profile, month):
+    """Данные выписки: остатки на начало и конец месяца, итоги по типам и статусам, строки транзакций."""
+    start, end = month_bounds(month)
+    totals = {}
+    querysets = []
+    for model in SOURCES:
+        month_transactions = model.objects.filter(profile=profile, created_at__gte=start, created_at__lt=end)
+        rows = (month_transactions
+                .values('transaction_type', 'status')
+                .annotate(count=Count('id'), total=Sum('amount'))
+                .order_by())
+        for row in rows:
+            key = (row['transaction_type'], row['status'])
+            count, total = totals.get(key, (0, 0))
+            totals[key] = (count + row['count'], total + row['total'])
+        querysets.append(month_transactions.order_by('created_at', 'id'))
+
+    types = dict(Transaction.TRANSACTION_TYPES)
+    statuses = dict(Transaction.STATUS_CHOICES)
+    return {
+        'username': profile.user.username,
+        'month': month,
+        # Остаток на начало — все проводки до первой секунды месяца
+        'opening': balance_as_of(profile.pk, start - timedelta(microseconds=1)),
+        'closing': balance_as_of(profile.pk, end - timedelta(microseconds=1)),
+        'totals': [
+            (types.get(transaction_type, transaction_type), statuses.get(status, status), count, quantize_money(total))
+            for (transaction_type, status), (count, total) in sorted(totals.items())
+        ],
+        'rows': export_rows(querysets),
+    }
+
+
+def render_csv(data):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Выписка', data['username'], f"{data['month']:%m.%Y}"])
+    writer.writerow(['Счет', 'На начало месяца', 'На конец месяца'])
+    for field in SNAPSHOT_FIELDS:
+        writer.writerow([field, data['opening'][field], data['closing'][field]])
+    writer.writerow([])
+    writer.writerow(['Тип', 'Статус', 'Количество', 'Сумма'])
+    writer.writerows(data['totals'])
+    writer.writerow([])
+    writer.writerow(EXPORT_HEADERS)
+    writer.writerows(data['rows'])
+    # BOM, чтобы Excel открыл кириллицу в UTF-8, как в выгрузке транзакций
+    return ('\ufeff' + buffer.getvalue()).encode('utf-8')
+
+
+def render_pdf(data):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    if 'StatementFont' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont('StatementFont', settings.STATEMENT_PDF_FONT))
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    y = height - 40
+
+    def line(text, size=9):
+        nonlocal y
+        if y < 40:
+            pdf.showPage()
+            y = height - 40
+        pdf.setFont('StatementFont', size)
+        pdf.drawString(40, y, str(text)[:120])
+        y -= size + 5
+
+    line(f"Выписка по счету {data['username']} за {data['month']:%m.%Y}", 13)
+    for field in SNAPSHOT_FIELDS:
+        line(f"{field}: на начало {data['opening'][field]}, на конец {data['closing'][field]}")
+    line('')
+    for transaction_type, status, count, total in data['totals']:
+        line(f"{transaction_type} ({status}): {count} шт. на {total}р")
+    line('')
+    for row in data['rows']:
+        transaction_id, created_at, _, target, transaction_type, status, amount, comment, *_ = row
+        line(f"{timezone.localtime(created_at):%d.%m.%Y %H:%M}  {transaction_type}  {status}  {amount}р  "
+             f"{target or ''}  {comment or ''}")
+    pdf.save()
+    return buffer.getvalue()
+
+
+STATEMENT_FORMATS = {'csv': (render_csv, 'text/csv; charset=utf-8')}
+if reportlab is not None:
+    STATEMENT_FORMATS['pdf'] = (render_pdf, 'application/pdf')
+
+
+def generate_statement(statement):
+    """Формирует файл захваченной выписки. Возвращает итог: ready или failed."""
+    render, _ = STATEMENT_FORMATS.get(statement.statement_format, (None, None))
+    try:
+        if render is None:
+            raise ValueError(f"Формат {statement.statement_format} недоступен")
+        content = render(build_statement(statement.profile, statement.month))
+    except Exception as e:
+        AccountStatement.objects.filter(pk=statement.pk, locked_by=statement.locked_by).update(
+            status='failed', locked_by='', last_error=str(e)
+        )
+        return 'failed'
+
+    name = f"statement_{statement.profile_id}_{statement.month:%Y_%m}.{statement.statement_format}"
+    statement.file.save(name, ContentFile(content), save=False)
+    updated = AccountStatement.objects.filter(pk=statement.pk, locked_by=statement.locked_by).update(
+        status='ready', file=statement.file.name, locked_by='', generated_at=now(), last_error=''
+    )
+    if not updated:
+        # Выписку вернули в очередь по таймауту и забрал другой обработчик: наш файл не нужен
+        statement.file.delete(save=False)
+        return 'failed'
+    cache_statement(statement)
+    return 'ready'
@@ -1,3 +1,1244 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import uuid
+from importlib import import_module
+from unittest import mock
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import ProtectedError, Sum
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from order.models import Order
+from rank.models import Rank, RankSettings
+from rank.services import get_referral_bonus_percent
+from server.models import User
+
+from . import balance_cache, fees, services
+from .archive import archive_transactions
+from .bench import check_invariants, run_workload, seed_profiles
+from .checks import check_velocity_cache
+from .escrow import get_escrow_totals
+from .export import EXPORT_HEADERS
+from .fees import commission_amount, get_rank_settings, invalidate_rank_tables, with_bonus_percent
+from .gateways import StubPayoutGateway, get_payout_gateway
+from .insights import get_insights
+from .ledger import apply_system_deltas, get_system_balances
+from .models import (AccountStatement, Balance, BalanceSnapshot, EscrowHold, LedgerEntry, OutboxConsumer, OutboxEvent,
+                     PayoutJob, SystemAccountShard, Transaction, TransactionArchive, TransactionDailyRollup,
+                     WithdrawalRequest)
+from .money import Money
+from .outbox import acknowledge, compact_outbox, publish_transactions, read_events
+from .rollups import get_position, get_watermark, reset_rollups, update_rollups
+from .payouts import claim_job, run_job
+from .reconcile import reconcile_range, reconcile_system_accounts, repair_balances
+from .services import (DEFAULT_MIN_WITHDRAWAL_AMOUNT, WITHDRAWAL_BATCH_LIMIT, bulk_credit_bonuses,
+                       check_withdrawal_eligibility, process_transaction)
+from .snapshots import balance_as_of, take_snapshots
+from .statements import build_statement, get_cached_statement
+from .velocity import check_velocity
+
+
+def total_balance(profiles):
+    """Сумма всех счетов профилей, как ее считает check_invariants."""
+    fields = LedgerEntry.PROFILE_ACCOUNTS.values()
+    totals = Balance.objects.filter(profile__in=profiles).aggregate(**{field: Sum(field) for field in fields})
+    return sum(total or 0 for total in totals.values())
+
+
+def assert_ledger_consistent(test):
+    """Проекции совпадают с журналом, проводки каждой операции и журнал целиком дают ноль."""
+    _, drifts = reconcile_range(0, Balance.objects.order_by('-profile_id').values_list('profile_id', flat=True)[0] + 1)
+    test.assertEqual(drifts, [])
+    test.assertEqual(reconcile_system_accounts(), [])
+    unbalanced = LedgerEntry.objects.values('operation').annotate(total=Sum('amount')).exclude(total=0)
+    test.assertFalse(unbalanced.exists())
+    test.assertEqual(LedgerEntry.objects.aggregate(total=Sum('amount'))['total'], Money(0))
+
+
+class ProcessStateMixin:
+    """
+    Кэши процесса (таблицы рангов, балансы) переживают откат тестовой транзакции,
+    а id строк после отката повторяются: каждый тест начинает с пустых кэшей.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Тесты идут в одном процессе: счетчикам ограничений частоты хватает кэша процесса
+        self.enterContext(override_settings(VELOCITY_CACHE_ALIAS='default'))
+        fees._tables = None
+        balance_cache._local.clear()
+        balance_cache._profile_ids.clear()
+        aliases = {settings.BALANCE_CACHE_ALIAS, settings.STATEMENT_CACHE_ALIAS, settings.INSIGHTS_CACHE_ALIAS,
+                   settings.VELOCITY_CACHE_ALIAS}
+        for alias in aliases:
+            caches[alias].clear()
+
+
+class ConcurrentTransferTests(ProcessStateMixin, TransactionTestCase):
+    """Параллельные операции над одними балансами: суммы сохраняются, журнал сходится с проекциями."""
+    threads = 4
+    operations = 40
+
+    def test_concurrent_operations_keep_balances(self):
+        profiles = seed_profiles('stress', 6, fiat=Decimal('500.00'), bonus=Decimal('500.00'))
+        opening_total = total_balance(profiles)
+        samples = []
+        lock = threading.Lock()
+
+        def worker(seed):
+            rows = run_workload('stress', seed, self.operations)
+            with lock:
+                samples.extend(rows)
+
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(len(samples), self.threads * self.operations)
+        self.assertEqual([row for row in samples if row[1] == 'error'], [])
+        report = check_invariants('stress', opening_total, samples)
+        self.assertTrue(report['ok'], report)
+        assert_ledger_consistent(self)
+
+    def test_concurrent_transfers_to_each_other(self):
+        # Встречные переводы одной пары: без фиксированного порядка блокировок это взаимоблокировка
+        first, second = seed_profiles('pair', 2, bonus=Decimal('1000.00'))
+        errors = []
+
+        def worker(user_from, user_to):
+            try:
+                for _ in range(self.operations):
+                    process_transaction(user_from=user_from, user_to=user_to, amount=Decimal('3.00'),
+                                        transaction_type='bonus_transfer')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=pair)
+                   for pair in ((first.user, second.user), (second.user, first.user))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        bonuses = Balance.objects.filter(profile__in=[first, second]).aggregate(total=Sum('bonus_balance'))
+        commission = LedgerEntry.objects.filter(account='commission').aggregate(total=Sum('amount'))['total']
+        self.assertEqual(Money.of(bonuses['total']) + (commission or Money(0)), Money.of('2000.00'))
+        assert_ledger_consistent(self)
+
+
+class IdempotencyTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender, self.recipient = seed_profiles('idem', 2, fiat=Decimal('6000.00'), bonus=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+
+    def test_replayed_transfer_is_charged_once(self):
+        data = {'username': self.recipient.user.username, 'amount': '10.00'}
+        first = self.client.post('/api/payments/bonus-transfer/', data, format='json', HTTP_IDEMPOTENCY_KEY='transfer-1')
+        second = self.client.post('/api/payments/bonus-transfer/', data, format='json', HTTP_IDEMPOTENCY_KEY='transfer-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.filter(profile=self.sender, transaction_type='bonus_transfer').count(), 1)
+        self.assertEqual(Balance.objects.get(profile=self.recipient).bonus_balance, Decimal('110.00'))
+        assert_ledger_consistent(self)
+
+    def test_key_reused_for_other_request_is_rejected(self):
+        data = {'username': self.recipient.user.username, 'amount': '10.00'}
+        self.client.post('/api/payments/bonus-transfer/', data, format='json', HTTP_IDEMPOTENCY_KEY='transfer-2')
+        response = self.client.post('/api/payments/bonus-transfer/', {**data, 'amount': '20.00'}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='transfer-2')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Balance.objects.get(profile=self.recipient).bonus_balance, Decimal('110.00'))
+
+    def test_replayed_withdrawal_freezes_once(self):
+        data = {'amount': '5000.00', 'card_number': '4000000000000002'}
+        for _ in range(2):
+            response = self.client.post('/api/payments/create-withdrawal/', data, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='withdrawal-1')
+            self.assertEqual(response.status_code, 201, response.data)
+
+        balance = Balance.objects.get(profile=self.sender)
+        self.assertEqual(balance.frozen_balance, Decimal('5000.00'))
+        self.assertEqual(balance.fiat_balance, Decimal('1000.00'))
+        self.assertEqual(WithdrawalRequest.objects.filter(user=self.sender.user).count(), 1)
+
+
+class LedgerTests(ProcessStateMixin, TestCase):
+    def test_every_operation_is_zero_sum(self):
+        first, second = seed_profiles('ledger', 2, fiat=Decimal('300.00'), bonus=Decimal('50.00'))
+        operations = [
+            ('bonus_add', Decimal('20.00'), None),
+            ('bonus_transfer', Decimal('15.00'), second.user),
+            ('payment', Decimal('30.00'), None),
+            ('freeze', Decimal('100.00'), None),
+            ('unfreeze', Decimal('40.00'), None),
+            ('withdrawal', Decimal('25.00'), None),
+        ]
+        for transaction_type, amount, user_to in operations:
+            result = process_transaction(user_from=first.user, user_to=user_to, amount=amount,
+                                         transaction_type=transaction_type)
+            self.assertEqual(result['status'], 'success', (transaction_type, result))
+
+        assert_ledger_consistent(self)
+        # Каждая успешная транзакция отражена в журнале
+        posted = LedgerEntry.objects.values_list('transaction', flat=True).distinct().count()
+        self.assertGreaterEqual(posted, len(operations))
+
+    def test_transfer_with_commission_agrees_to_the_kopeck(self):
+        sender, recipient = seed_profiles('kopeck', 2, fiat=Decimal('100.00'), bonus=Decimal('100.00'))
+        # 5% от 33.33 — 1.6665: комиссия округляется до 1.67 и в проекции, и в журнале
+        for transaction_type, user_to in (('bonus_transfer', recipient.user), ('payment', None)):
+            result = process_transaction(user_from=sender.user, user_to=user_to, amount=Decimal('33.33'),
+                                         transaction_type=transaction_type, commission=5)
+            self.assertEqual(result['status'], 'success', (transaction_type, result))
+
+        balance = Balance.objects.get(profile=sender)
+        self.assertEqual((balance.bonus_balance, balance.fiat_balance), (Decimal('65.00'), Decimal('65.00')))
+        self.assertEqual(Balance.objects.get(profile=recipient).bonus_balance, Decimal('133.33'))
+        ledger = dict(LedgerEntry.objects.filter(profile=sender).values_list('account')
+                      .annotate(total=Sum('amount')).order_by())
+        self.assertEqual((ledger['bonus'].minor, ledger['fiat'].minor), (6500, 6500))
+        self.assertEqual(get_system_balances()['commission'], Money.of('3.34'))
+        assert_ledger_consistent(self)
+
+    def test_profile_with_entries_cannot_be_deleted(self):
+        profile, = seed_profiles('ledger', 1, fiat=Decimal('10.00'))
+        entries = LedgerEntry.objects.count()
+
+        with self.assertRaises(ProtectedError):
+            profile.user.delete()
+        self.assertEqual(LedgerEntry.objects.count(), entries)
+        assert_ledger_consistent(self)
+
+
+STUB_GATEWAY = 'payments.gateways.StubPayoutGateway'
+STUB_OPTIONS = {'latency': 0, 'jitter': 0, 'failure_rate': 0, 'decline_rate': 0}
+
+
+class PayoutTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile, finance = seed_profiles('payout', 2, frozen=Decimal('5000.00'))
+        finance.user.role = 'finance'
+        finance.user.save()
+        self.request = WithdrawalRequest.objects.create(user=self.profile.user, amount=Decimal('5000.00'),
+                                                        status='pending', card_number='4000000000000002')
+        self.client = APIClient()
+        self.client.force_authenticate(finance.user)
+
+    def approve(self):
+        return self.client.post(f'/api/payments/approve-reject-withdrawal/{self.request.pk}/', {'action': 'approve'},
+                                format='json')
+
+    def run_payout(self):
+        job = claim_job('test')
+        return run_job(job, get_payout_gateway())
+
+    def test_without_gateway_approval_pays_out_at_once(self):
+        self.assertEqual(self.approve().status_code, 200)
+
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'completed')
+        self.assertFalse(PayoutJob.objects.exists())
+        self.assertEqual(Balance.objects.get(profile=self.profile).frozen_balance, Decimal('0.00'))
+        with self.assertRaises(ImproperlyConfigured):
+            get_payout_gateway()
+
+    @override_settings(DEBUG=True, PAYOUT_GATEWAY=STUB_GATEWAY, PAYOUT_GATEWAY_OPTIONS=STUB_OPTIONS)
+    def test_gateway_payout_completes_request(self):
+        self.assertEqual(self.approve().status_code, 202)
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'processing')
+
+        self.assertEqual(self.run_payout(), 'succeeded')
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'completed')
+        self.assertIn('деньги не переводились', self.request.comment_whores)
+        self.assertEqual(Balance.objects.get(profile=self.profile).frozen_balance, Decimal('0.00'))
+        assert_ledger_consistent(self)
+
+    @override_settings(DEBUG=True, PAYOUT_GATEWAY=STUB_GATEWAY,
+                       PAYOUT_GATEWAY_OPTIONS={**STUB_OPTIONS, 'decline_rate': 1})
+    def test_declined_payout_returns_funds(self):
+        self.approve()
+
+        self.assertEqual(self.run_payout(), 'failed')
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, 'cancelled_whores')
+        balance = Balance.objects.get(profile=self.profile)
+        self.assertEqual((balance.fiat_balance, balance.frozen_balance), (Decimal('5000.00'), Decimal('0.00')))
+        assert_ledger_consistent(self)
+
+    @override_settings(DEBUG=True, PAYOUT_GATEWAY=STUB_GATEWAY,
+                       PAYOUT_GATEWAY_OPTIONS={**STUB_OPTIONS, 'failure_rate': 1})
+    def test_gateway_failure_is_retried(self):
+        self.approve()
+
+        self.assertEqual(self.run_payout(), 'retry')
+        job = PayoutJob.objects.get(withdrawal_request=self.request)
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertEqual(Balance.objects.get(profile=self.profile).frozen_balance, Decimal('5000.00'))
+
+    def test_stub_gateway_requires_debug(self):
+        with self.assertRaises(ImproperlyConfigured):
+            StubPayoutGateway()
+
+
+class TransactionHistoryTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner, self.other = seed_profiles('history', 2, fiat=Decimal('100.00'))
+        for profile in (self.owner, self.other):
+            process_transaction(user_from=profile.user, amount=Decimal('5.00'), transaction_type='payment')
+        self.client = APIClient()
+
+    def history(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/payments/transactions/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_history_merges_archive_and_hides_other_profiles(self):
+        process_transaction(user_from=self.owner.user, amount=Decimal('7.00'), transaction_type='payment')
+        archived = Transaction.objects.filter(profile=self.owner).order_by('id').first()
+        Transaction.objects.filter(pk=archived.pk).update(created_at=timezone.now() - timedelta(days=1))
+        archive_transactions(before=timezone.now() - timedelta(hours=1))
+        self.assertTrue(TransactionArchive.objects.filter(pk=archived.pk).exists())
+
+        # Свежая оплата из горячей таблицы, затем архивная; оплата другого профиля не видна
+        rows = self.history(self.owner.user)
+        self.assertEqual([row['amount'] for row in rows], ['7.00', '5.00'])
+
+        self.client.force_authenticate(self.other.user)
+        self.assertEqual(self.client.get(f'/api/payments/transactions/{archived.pk}/').status_code, 404)
+
+    def test_user_without_profile_gets_empty_history(self):
+        user = User.objects.create(username='history_noprofile', role='заказчик', is_verification=True)
+        self.assertEqual(self.history(user), [])
+
+
+class TransactionExportTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner, self.other = seed_profiles('export', 2)
+        self.archived = Transaction.objects.create(profile=self.owner, amount=Decimal('1.00'),
+                                                   transaction_type='deposit', status='completed', comment='архив')
+        Transaction.objects.filter(pk=self.archived.pk).update(created_at=timezone.now() - timedelta(days=1))
+        archive_transactions(before=timezone.now() - timedelta(hours=1))
+        self.recent = Transaction.objects.create(profile=self.owner, amount=Decimal('2.50'),
+                                                 transaction_type='deposit', status='completed', comment='свежая')
+        Transaction.objects.create(profile=self.other, amount=Decimal('9.00'), transaction_type='deposit',
+                                   status='completed', comment='чужая')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='export_finance', role='finance',
+                                                           is_verification=True))
+
+    def export(self, **params):
+        response = self.client.get('/api/payments/transactions-finance-export/', params)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_header_and_rows(self):
+        content = self.export(username=self.owner.user.username)
+
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.reader(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(tuple(rows[0]), EXPORT_HEADERS)
+        # Архивная строка идет первой по дате; строки другого профиля отсечены фильтром
+        self.assertEqual([(row[0], row[2], row[4], row[6], row[7]) for row in rows[1:]], [
+            (str(self.archived.pk), self.owner.user.username, 'deposit', '1.00', 'архив'),
+            (str(self.recent.pk), self.owner.user.username, 'deposit', '2.50', 'свежая'),
+        ])
+
+    def test_archived_rows_are_included(self):
+        self.assertTrue(TransactionArchive.objects.filter(pk=self.archived.pk).exists())
+
+        rows = [json.loads(line) for line in self.export(export_format='ndjson').splitlines()]
+
+        self.assertEqual([row['comment'] for row in rows], ['архив', 'свежая', 'чужая'])
+
+    def test_only_finance_can_export(self):
+        self.client.force_authenticate(self.owner.user)
+        self.assertEqual(self.client.get('/api/payments/transactions-finance-export/').status_code, 403)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get('/api/payments/transactions-finance-export/', {'export_format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+
+class FeeTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.rank = Rank.objects.create(rank_name='fees', rank_type='customer', rank_price=0)
+        RankSettings.objects.create(rank=self.rank, type_role='customer', bonus_account_limit=10 ** 6,
+                                    commission_reduction=3, referral_bonus_self=10)
+
+    def test_commission_is_plain_percent_with_half_up_rounding(self):
+        self.assertEqual(commission_amount(Decimal('100.00'), 5), Decimal('5.00'))
+        self.assertEqual(commission_amount(Decimal('0.10'), 5), Decimal('0.01'))
+        self.assertEqual(commission_amount(Decimal('100.00'), 0), Decimal('0.00'))
+        self.assertEqual(with_bonus_percent(Decimal('50.00'), 10), Decimal('55.00'))
+
+    def test_rank_commission_reduction_does_not_change_commission(self):
+        sender, recipient = seed_profiles('fees', 2, bonus=Decimal('100.00'), rank=self.rank)
+        process_transaction(user_from=sender.user, user_to=recipient.user, amount=Decimal('20.00'),
+                            transaction_type='bonus_transfer', commission=5)
+
+        self.assertEqual(Balance.objects.get(profile=sender).bonus_balance, Decimal('79.00'))
+        commission = LedgerEntry.objects.filter(account='commission').aggregate(total=Sum('amount'))['total']
+        self.assertEqual(commission, Money.of('1.00'))
+
+    def test_rank_settings_are_read_from_memory(self):
+        referrer, = seed_profiles('fees', 1, rank=self.rank)
+        get_rank_settings(self.rank.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rank_settings(self.rank.pk)['referral_bonus_self'], 10)
+
+        self.assertEqual(get_referral_bonus_percent(referrer.user), 10)
+        RankSettings.objects.filter(rank=self.rank).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_rank_tables()
+        self.assertEqual(get_referral_bonus_percent(referrer.user), 0)
+
+
+class EscrowTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer, self.performer = seed_profiles('escrow', 2, fiat=Decimal('1000.00'))
+        self.order = Order.objects.create(customer=self.customer, performer=self.performer, title='Курсовая',
+                                          type_order='coursework', description='-', cost=Decimal('300.00'),
+                                          status='accepted_executor', deadlines=timezone.now() + timedelta(days=7))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer.user)
+
+    def confirm(self):
+        return self.client.post(f'/api/order/orders/{self.order.pk}/confirm/', {'decision': 'accept'}, format='json')
+
+    def test_confirm_holds_cost_and_starts_order(self):
+        response = self.confirm()
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'in_progress')
+        self.assertEqual(Balance.objects.get(profile=self.customer).fiat_balance, Decimal('700.00'))
+        balance = self.client.get('/api/payments/balance/').data['results'][0]
+        self.assertEqual(balance['escrow_balance'], '300.00')
+        assert_ledger_consistent(self)
+
+    def test_failed_status_change_rolls_back_hold(self):
+        with mock.patch('order.views.OrderStatusLog.objects.create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.confirm()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'accepted_executor')
+        self.assertFalse(EscrowHold.objects.filter(order=self.order).exists())
+        self.assertEqual(Balance.objects.get(profile=self.customer).fiat_balance, Decimal('1000.00'))
+
+    def test_cancelled_order_returns_hold(self):
+        self.confirm()
+        self.order.refresh_from_db()
+        self.order.status = 'rejected_executor'
+        self.order.save()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'rejected_executor')
+        self.assertEqual(EscrowHold.objects.get(order=self.order).status, 'refunded')
+        self.assertEqual(Balance.objects.get(profile=self.customer).fiat_balance, Decimal('1000.00'))
+        balance = self.client.get('/api/payments/balance/').data['results'][0]
+        self.assertEqual(balance['escrow_balance'], '0.00')
+        assert_ledger_consistent(self)
+
+    def test_complete_pays_performer(self):
+        self.confirm()
+        response = self.client.post(f'/api/order/orders/{self.order.pk}/complete/')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Balance.objects.get(profile=self.performer).fiat_balance, Decimal('1300.00'))
+        self.assertEqual(get_escrow_totals([self.customer.pk]), {})
+        assert_ledger_consistent(self)
+
+
+class BalanceCacheTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender, self.recipient = seed_profiles('cached', 2, fiat=Decimal('6000.00'), bonus=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+
+    def stored(self, profile):
+        return balance_cache._cache().get(balance_cache._key(profile.pk))
+
+    def database(self, profile):
+        return Balance.objects.filter(profile=profile).values(*balance_cache.BALANCE_FIELDS).get()
+
+    def listed(self):
+        return self.client.get('/api/payments/balance/').data['results'][0]
+
+    def test_cold_cache_reads_database(self):
+        self.assertIsNone(self.stored(self.sender))
+
+        balance = self.listed()
+
+        self.assertEqual(balance['fiat_balance'], '6000.00')
+        self.assertEqual(self.stored(self.sender), self.database(self.sender))
+
+    def test_transfer_writes_through(self):
+        self.listed()
+        with self.captureOnCommitCallbacks(execute=True):
+            process_transaction(user_from=self.sender.user, user_to=self.recipient.user, amount=Decimal('10.00'),
+                                transaction_type='bonus_transfer', comment='-')
+
+        self.assertEqual(self.stored(self.sender), self.database(self.sender))
+        self.assertEqual(self.stored(self.recipient), self.database(self.recipient))
+        self.assertEqual(self.listed()['bonus_balance'], '90.00')
+
+    def test_withdrawal_and_escrow_refresh_cached_balance(self):
+        self.listed()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/payments/create-withdrawal/',
+                                        {'amount': '5000.00', 'card_number': '4000000000000002'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        balance = self.listed()
+        self.assertEqual(balance['fiat_balance'], '1000.00')
+        self.assertEqual(balance['frozen_balance'], '5000.00')
+
+        order = Order.objects.create(customer=self.sender, performer=self.recipient, title='Реферат',
+                                     type_order='coursework', description='-', cost=Decimal('300.00'),
+                                     status='accepted_executor', deadlines=timezone.now() + timedelta(days=7))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/order/orders/{order.pk}/confirm/', {'decision': 'accept'},
+                                        format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        balance = self.listed()
+        self.assertEqual(balance['fiat_balance'], '700.00')
+        self.assertEqual(balance['escrow_balance'], '300.00')
+
+    def test_save_outside_engine_invalidates(self):
+        self.listed()
+        balance = Balance.objects.get(profile=self.sender)
+        balance.bonus_balance = Decimal('55.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            balance.save()
+
+        self.assertIsNone(self.stored(self.sender))
+        self.assertEqual(self.listed()['bonus_balance'], '55.00')
+
+    def test_never_stale_after_mutating_services(self):
+        operations = [
+            lambda: process_transaction(user_from=self.sender.user, user_to=self.recipient.user,
+                                        amount=Decimal('10.00'), transaction_type='bonus_transfer', comment='-'),
+            lambda: process_transaction(user_from=self.sender.user, amount=Decimal('200.00'),
+                                        transaction_type='payment', comment='-'),
+            lambda: bulk_credit_bonuses([(self.sender.pk, Decimal('30.00'), 'Акция')]),
+            lambda: self.client.post('/api/payments/create-withdrawal/',
+                                     {'amount': '1000.00', 'card_number': '4000000000000002'}, format='json'),
+        ]
+        for operation in operations:
+            self.listed()
+            with self.captureOnCommitCallbacks(execute=True):
+                operation()
+            for profile in (self.sender, self.recipient):
+                self.assertEqual(balance_cache.get_balance(profile.pk), self.database(profile))
+
+
+class ReconcileTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.drifted, self.consistent = seed_profiles('reconcile', 2, fiat=Decimal('500.00'), bonus=Decimal('50.00'))
+        process_transaction(user_from=self.drifted.user, user_to=self.consistent.user, amount=Decimal('20.00'),
+                            transaction_type='bonus_transfer', comment='-')
+        self.bounds = (self.drifted.pk, self.consistent.pk + 1)
+
+    def reconcile(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_ledger', *args, stdout=out)
+        return out.getvalue()
+
+    def test_corrupted_balance_is_detected_and_repaired(self):
+        Balance.objects.filter(profile=self.drifted).update(fiat_balance=Decimal('999.99'))
+
+        _, drifts = reconcile_range(*self.bounds)
+        self.assertEqual(drifts, [{'profile_id': self.drifted.pk, 'field': 'fiat_balance',
+                                   'balance': 99999, 'ledger': 50000}])
+        self.assertIn('для исправления запустите с --repair', self.reconcile())
+        self.assertEqual(Balance.objects.get(profile=self.drifted).fiat_balance, Decimal('999.99'))
+
+        self.assertIn('Пересчитано балансов: 1', self.reconcile('--repair'))
+        self.assertEqual(Balance.objects.get(profile=self.drifted).fiat_balance, Decimal('500.00'))
+        assert_ledger_consistent(self)
+
+    def test_corrupted_checkpoint_is_detected_and_repaired(self):
+        Balance.objects.filter(profile=self.drifted).update(last_entry_id=0)
+
+        _, drifts = reconcile_range(*self.bounds)
+        self.assertEqual({drift['profile_id'] for drift in drifts}, {self.drifted.pk})
+        self.assertEqual({drift['field'] for drift in drifts}, {'fiat_balance', 'bonus_balance'})
+
+        self.assertEqual(repair_balances([self.drifted.pk]), 1)
+        last_entry = LedgerEntry.objects.filter(profile=self.drifted).latest('id')
+        self.assertEqual(Balance.objects.get(profile=self.drifted).last_entry_id, last_entry.pk)
+        assert_ledger_consistent(self)
+
+    def test_consistent_account_is_left_untouched(self):
+        before = Balance.objects.values(*balance_cache.BALANCE_FIELDS).get(profile=self.consistent)
+        with mock.patch('payments.management.commands.reconcile_ledger.repair_balances') as repair:
+            self.assertIn('Расхождений не обнаружено', self.reconcile('--repair'))
+        repair.assert_not_called()
+
+        Balance.objects.filter(profile=self.drifted).update(bonus_balance=Decimal('0.00'))
+        with mock.patch('payments.management.commands.reconcile_ledger.repair_balances',
+                        wraps=repair_balances) as repair:
+            self.reconcile('--repair')
+        repair.assert_called_once_with({self.drifted.pk})
+        self.assertEqual(Balance.objects.values(*balance_cache.BALANCE_FIELDS).get(profile=self.consistent), before)
+
+
+class VelocityTests(ProcessStateMixin, TestCase):
+    RULES = {'bonus_transfer': [{'name': 'amount_per_day', 'metric': 'amount', 'window': 86400, 'limit': 0}]}
+
+    def setUp(self):
+        super().setUp()
+        self.sender, self.recipient = seed_profiles('velocity', 2, bonus=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+
+    def transfer(self, amount='10.00'):
+        return self.client.post('/api/payments/bonus-transfer/',
+                                {'username': self.recipient.user.username, 'amount': amount}, format='json')
+
+    def test_rules_are_off_by_default(self):
+        with override_settings(VELOCITY_CACHE_ALIAS='velocity'):
+            self.assertEqual(check_velocity_cache(None), [])
+            self.assertEqual(self.transfer().status_code, 200)
+
+    def test_process_local_cache_is_rejected(self):
+        with override_settings(VELOCITY_RULES=self.RULES):
+            self.assertEqual([error.id for error in check_velocity_cache(None)], ['payments.E001'])
+        self.assertEqual(check_velocity_cache(None), [])
+
+    def test_unreachable_cache_is_rejected(self):
+        unreachable = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/0'}
+        with override_settings(CACHES={**settings.CACHES, 'velocity': unreachable}, VELOCITY_CACHE_ALIAS='velocity',
+                               VELOCITY_RULES=self.RULES):
+            self.assertEqual([error.id for error in check_velocity_cache(None)], ['payments.E002'])
+        with override_settings(VELOCITY_CACHE_ALIAS='missing', VELOCITY_RULES=self.RULES):
+            self.assertEqual([error.id for error in check_velocity_cache(None)], ['payments.E002'])
+
+    def test_cache_outage_rejects_transfer_with_503(self):
+        with override_settings(VELOCITY_RULES=self.RULES), \
+                mock.patch('payments.velocity._cache', side_effect=ConnectionError('down')):
+            response = self.transfer()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Transaction.objects.filter(transaction_type='bonus_transfer').exists())
+
+    def test_cache_outage_after_transfer_is_logged(self):
+        rules = {'bonus_transfer': [{**self.RULES['bonus_transfer'][0], 'limit': 1000}]}
+        with override_settings(VELOCITY_RULES=rules), \
+                mock.patch('payments.velocity._record', side_effect=ConnectionError('down')), \
+                self.assertLogs('payments.velocity', 'ERROR'):
+            response = self.transfer()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Balance.objects.get(profile=self.recipient).bonus_balance, Decimal('110.00'))
+
+    def test_partial_transfer_counts_transferred_amount(self):
+        rank = Rank.objects.create(rank_name='velocity', rank_type='customer', rank_price=0)
+        RankSettings.objects.create(rank=rank, type_role='customer', bonus_account_limit=100)
+        recipient, = seed_profiles('velocity_to', 1, bonus=Decimal('80.00'), rank=rank)
+
+        with override_settings(VELOCITY_RULES={'bonus_transfer': [{**self.RULES['bonus_transfer'][0], 'limit': 1000}]}):
+            response = self.client.post('/api/payments/bonus-transfer/',
+                                        {'username': recipient.user.username, 'amount': '50.00'}, format='json')
+        self.assertEqual(response.data['status'], 'partial_success')
+
+        with override_settings(VELOCITY_RULES=self.RULES):
+            violation, = check_velocity(self.sender.pk, recipient.pk, Decimal('1.00'))
+        self.assertEqual(violation['value'], str(Money.of('21.00')))
+
+
+class OutboxTests(ProcessStateMixin, TestCase):
+    def publish(self, event_id=None):
+        return OutboxEvent.objects.create(id=event_id, event_type='transaction_created', transaction_id=0, payload={})
+
+    def test_late_commit_with_smaller_id_is_delivered(self):
+        self.publish(100)
+        events, cursor = read_events('tests')
+        self.assertEqual([event['id'] for event in events], [100])
+        acknowledge('tests', cursor)
+
+        # Транзакция БД, получившая id раньше, фиксируется после чтения
+        self.publish(99)
+        events, cursor = read_events('tests')
+        self.assertEqual([event['id'] for event in events], [99])
+        self.assertEqual(cursor, events[0]['sequence'])
+
+    def test_compact_keeps_unacknowledged_events(self):
+        self.publish()
+        second = self.publish()
+        _, cursor = read_events('tests', limit=1)
+        acknowledge('tests', cursor)
+
+        self.assertEqual(compact_outbox(), 1)
+        self.assertEqual(list(OutboxEvent.objects.values_list('id', flat=True)), [second.pk])
+        events, _ = read_events('tests')
+        self.assertEqual([event['id'] for event in events], [second.pk])
+
+    def test_lag_is_counted_in_sequence_numbers(self):
+        self.publish(1000)
+        self.publish(1001)
+        _, cursor = read_events('tests', limit=1)
+        acknowledge('tests', cursor)
+
+        out = io.StringIO()
+        call_command('compact_outbox', stdout=out)
+        self.assertIn(f'tests: позиция {cursor}, отставание 1 событий', out.getvalue())
+
+    def test_acknowledge_validates_consumer(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='outbox_finance', role='finance', is_verification=True))
+        self.publish()
+        _, cursor = read_events('tests')
+
+        response = client.post('/api/payments/outbox/events/', {'consumer': 'x' * 51, 'cursor': cursor},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('consumer', response.data)
+        self.assertEqual(client.get('/api/payments/outbox/events/', {'consumer': 'x' * 51}).status_code, 400)
+        self.assertEqual(client.post('/api/payments/outbox/events/', {'consumer': 'tests', 'cursor': 'last'},
+                                     format='json').status_code, 400)
+        self.assertFalse(OutboxConsumer.objects.filter(name__startswith='x').exists())
+
+        response = client.post('/api/payments/outbox/events/', {'consumer': 'tests', 'cursor': cursor}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(OutboxConsumer.objects.get(name='tests').position, cursor)
+
+
+class MoneyTests(ProcessStateMixin, TestCase):
+    def test_value_type(self):
+        self.assertEqual(Money.of('10.005'), Money(1001))
+        self.assertEqual(Money.of(3), Money(300))
+        self.assertEqual(sum([Money(150), Money(250)]), Money(400))
+        self.assertEqual(Money(1000).percent(5), Money(50))
+        self.assertEqual(str(Money(-12345)), '-123.45')
+        with self.assertRaises(TypeError):
+            Money.of(0.1)
+        with self.assertRaises(TypeError):
+            Money(100) + Decimal('1.00')
+        with self.assertRaises(AttributeError):
+            Money(100).minor = 1
+
+    def test_field_stores_kopecks_without_digit_limit(self):
+        amount = Money.of('123456789012.34')
+        shard = SystemAccountShard.objects.create(account='revenue', shard=0, balance=amount)
+
+        shard.refresh_from_db()
+        self.assertEqual(shard.balance, amount)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT balance FROM payments_systemaccountshard WHERE id = %s', [shard.pk])
+            self.assertEqual(cursor.fetchone()[0], 12345678901234)
+        self.assertTrue(SystemAccountShard.objects.filter(balance__gt=Decimal('123456789012.33')).exists())
+        self.assertEqual(SystemAccountShard.objects.aggregate(total=Sum('balance'))['total'], amount)
+
+
+class SystemAccountShardTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.profiles = seed_profiles('shards', 4, fiat=Decimal('1000.00'), bonus=Decimal('100.00'))
+        for sender, recipient in zip(self.profiles, self.profiles[1:] + self.profiles[:1]):
+            for amount in ('10.00', '25.50'):
+                process_transaction(user_from=sender.user, amount=Decimal(amount), transaction_type='payment')
+                process_transaction(user_from=sender.user, user_to=recipient.user, amount=Decimal(amount),
+                                    transaction_type='bonus_transfer', comment='-')
+
+    def journal(self):
+        return dict(LedgerEntry.objects.filter(profile__isnull=True).values_list('account')
+                    .annotate(total=Sum('amount')).order_by())
+
+    def test_shards_sum_to_system_entries(self):
+        journal = self.journal()
+
+        self.assertIn('revenue', journal)
+        self.assertEqual(get_system_balances(), journal)
+        self.assertEqual(reconcile_system_accounts(), [])
+
+    def test_postings_spread_across_shards(self):
+        self.assertGreater(SystemAccountShard.objects.filter(account='revenue').count(), 1)
+
+        SystemAccountShard.objects.all().delete()
+        revenue = LedgerEntry(account='revenue', amount=Money.of('1.00'))
+        for key in range(settings.SYSTEM_ACCOUNT_SHARDS + 1):
+            apply_system_deltas([revenue], uuid.UUID(int=key))
+        shards = dict(SystemAccountShard.objects.values_list('shard', 'balance'))
+        self.assertEqual(set(shards), set(range(settings.SYSTEM_ACCOUNT_SHARDS)))
+        self.assertEqual(shards[0], Money.of('2.00'))
+
+    def test_backfill_moves_journal_into_first_shard(self):
+        journal = self.journal()
+        SystemAccountShard.objects.all().delete()
+
+        import_module('payments.migrations.0019_system_account_shard').fill_system_shards(django_apps, None)
+
+        self.assertEqual(set(SystemAccountShard.objects.values_list('shard', flat=True)), {0})
+        self.assertEqual(get_system_balances(), {account: total for account, total in journal.items() if total})
+        self.assertEqual(reconcile_system_accounts(), [])
+
+
+class BalanceSnapshotTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender, self.recipient = seed_profiles('snapshot', 2, bonus=Decimal('100.00'))
+
+    def transfer(self, amount):
+        result = process_transaction(user_from=self.sender.user, user_to=self.recipient.user, amount=Decimal(amount),
+                                     transaction_type='bonus_transfer')
+        self.assertEqual(result['status'], 'success')
+        return timezone.now()
+
+    def test_balance_as_of_replays_tail_after_snapshot(self):
+        opened = timezone.now()
+        after_first = self.transfer('10.00')
+        self.assertEqual(take_snapshots(every=1), 2)
+        after_second = self.transfer('20.00')
+
+        self.assertEqual(balance_as_of(self.sender.pk, opened)['bonus_balance'], Decimal('100.00'))
+        at_snapshot = balance_as_of(self.sender.pk, after_first)
+        self.assertEqual(at_snapshot['bonus_balance'], Decimal('90.00'))
+        self.assertEqual(at_snapshot['replayed_entries'], 0)
+        latest = balance_as_of(self.sender.pk, after_second)
+        self.assertEqual(latest['bonus_balance'], Balance.objects.get(profile=self.sender).bonus_balance)
+        self.assertEqual(latest['snapshot_at'], at_snapshot['snapshot_at'])
+        self.assertEqual(latest['replayed_entries'], 1)
+
+    def test_snapshot_is_skipped_without_new_entries(self):
+        take_snapshots(every=1)
+        self.assertEqual(take_snapshots(every=1), 0)
+
+    def test_existing_snapshot_is_not_counted(self):
+        self.transfer('10.00')
+        last_entry_id = Balance.objects.get(profile=self.sender).last_entry_id
+        # Последний по времени снимок отправителя старше контрольной точки, а снимок на нее уже записан раньше
+        BalanceSnapshot.objects.create(profile=self.sender, last_entry_id=last_entry_id,
+                                       taken_at=timezone.now() - timedelta(days=1), fiat_balance=0, frozen_balance=0,
+                                       bonus_balance=Decimal('90.00'), forfeited_balance=0)
+        BalanceSnapshot.objects.create(profile=self.sender, last_entry_id=1, taken_at=timezone.now(), fiat_balance=0,
+                                       frozen_balance=0, bonus_balance=Decimal('100.00'), forfeited_balance=0)
+
+        self.assertEqual(take_snapshots(every=1), 1)
+        self.assertEqual(BalanceSnapshot.objects.filter(profile=self.recipient).count(), 1)
+        self.assertEqual(BalanceSnapshot.objects.filter(profile=self.sender).count(), 2)
+
+    def test_endpoint_returns_own_balance(self):
+        moment = self.transfer('10.00')
+        client = APIClient()
+        client.force_authenticate(self.sender.user)
+
+        response = client.get('/api/payments/balance-as-of/', {'at': moment.isoformat()})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['bonus_balance'], '90.00')
+        self.assertEqual(client.get('/api/payments/balance-as-of/').status_code, 400)
+
+
+class TransactionBufferTests(ProcessStateMixin, TestCase):
+    def test_partial_transfer_writes_rows_in_one_insert(self):
+        rank = Rank.objects.create(rank_name='buffer', rank_type='customer', rank_price=0)
+        RankSettings.objects.create(rank=rank, type_role='customer', bonus_account_limit=100)
+        sender, = seed_profiles('buffer_from', 1, bonus=Decimal('100.00'))
+        recipient, = seed_profiles('buffer_to', 1, bonus=Decimal('80.00'), rank=rank)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = process_transaction(user_from=sender.user, user_to=recipient.user, amount=Decimal('50.00'),
+                                         transaction_type='bonus_transfer')
+
+        self.assertEqual(result['status'], 'partial_success')
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "payments_transaction"')]
+        self.assertEqual(len(inserts), 1)
+        ids = [transaction['id'] for transaction in result['transactions']]
+        self.assertEqual(sorted(Transaction.objects.filter(id__in=ids).values_list('amount', flat=True)),
+                         [Decimal('20.00'), Decimal('20.00'), Decimal('30.00')])
+        self.assertEqual(set(OutboxEvent.objects.values_list('transaction_id', flat=True)), set(ids))
+        assert_ledger_consistent(self)
+
+
+class StatementTests(ProcessStateMixin, TestCase):
+    MONTH = date(2026, 3, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.started = timezone.now()
+        self.profile, = seed_profiles('statement', 1, fiat=Decimal('100.00'))
+        self.backdate(timezone.make_aware(datetime(2026, 2, 15)))
+        self.pay('30.00', timezone.make_aware(datetime(2026, 3, 1)))
+        self.pay('20.00', timezone.make_aware(datetime(2026, 3, 31, 23, 59, 59, 999999)))
+        self.pay('5.00', timezone.make_aware(datetime(2026, 4, 1)))
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def backdate(self, moment):
+        """Переносит на moment транзакции и проводки, созданные в тесте и еще не перенесенные."""
+        for model in (Transaction, LedgerEntry):
+            model.objects.filter(created_at__gte=self.started).update(created_at=moment)
+
+    def pay(self, amount, moment):
+        process_transaction(user_from=self.profile.user, amount=Decimal(amount), transaction_type='payment')
+        self.backdate(moment)
+
+    def statement(self):
+        return self.client.get('/api/payments/statements/', {'month': '2026-03'})
+
+    def test_balances_and_period_bounds(self):
+        data = build_statement(self.profile, self.MONTH)
+
+        self.assertEqual(data['opening']['fiat_balance'], Decimal('100.00'))
+        self.assertEqual(data['closing']['fiat_balance'], Decimal('50.00'))
+        # Первая и последняя микросекунды месяца входят в выписку, первая секунда следующего — нет
+        self.assertEqual([row[6] for row in data['rows']], [Decimal('30.00'), Decimal('20.00')])
+        self.assertEqual([(count, total) for _, _, count, total in data['totals']], [(2, Decimal('50.00'))])
+
+    def test_ready_statement_is_served_from_cache(self):
+        self.assertEqual(self.statement().status_code, 202)
+        call_command('run_statement_worker', '--once', stdout=io.StringIO())
+
+        response = self.statement()
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('fiat_balance,100.00,50.00', content)
+        with mock.patch('payments.views.request_statement') as request_statement:
+            again = self.client.get('/api/payments/statements/', {'month': '2026-03'},
+                                    HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        request_statement.assert_not_called()
+
+    def test_late_transaction_invalidates_cached_statement(self):
+        self.statement()
+        call_command('run_statement_worker', '--once', stdout=io.StringIO())
+        etag = self.statement()['ETag']
+
+        # Транзакция получила время в марте, а зафиксировалась, когда месяц уже закрыт
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2026, 3, 20))):
+                process_transaction(user_from=self.profile.user, amount=Decimal('10.00'),
+                                    transaction_type='payment')
+
+        self.assertIsNone(get_cached_statement(self.profile.pk, self.MONTH, 'csv'))
+        self.assertEqual(self.statement().status_code, 202)
+        call_command('run_statement_worker', '--once', stdout=io.StringIO())
+        response = self.statement()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('fiat_balance,100.00,40.00', b''.join(response.streaming_content).decode())
+
+    def test_transaction_of_open_month_keeps_statements(self):
+        self.statement()
+        call_command('run_statement_worker', '--once', stdout=io.StringIO())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_transaction(user_from=self.profile.user, amount=Decimal('10.00'), transaction_type='payment')
+
+        self.assertIsNotNone(get_cached_statement(self.profile.pk, self.MONTH, 'csv'))
+        self.assertEqual(AccountStatement.objects.get(profile=self.profile).status, 'ready')
+
+
+class InsightsTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender, self.recipient = seed_profiles('insights', 2, bonus=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+
+    def transfer(self, amount):
+        # Кэш балансов обновляется после фиксации транзакции БД, а с ним и ключ сводки
+        with self.captureOnCommitCallbacks(execute=True):
+            process_transaction(user_from=self.sender.user, user_to=self.recipient.user, amount=Decimal(amount),
+                                transaction_type='bonus_transfer')
+
+    def test_totals_by_type_and_month(self):
+        self.transfer('10.00')
+        self.transfer('15.00')
+
+        data = self.client.get('/api/payments/insights/').data
+        self.assertEqual([(row['transaction_type'], row['count'], row['total']) for row in data['types']],
+                         [('bonus_transfer', 2, Decimal('25.00'))])
+        month, = data['months']
+        self.assertEqual(month['month'], f'{timezone.localdate():%Y-%m}')
+        self.assertEqual((month['spent'], month['earned']), (Decimal('25.00'), Decimal('0.00')))
+
+    def test_cached_until_next_posting(self):
+        self.transfer('10.00')
+        key, data = get_insights(self.sender.pk, 12)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_insights(self.sender.pk, 12), (key, data))
+
+        self.transfer('5.00')
+        new_key, data = get_insights(self.sender.pk, 12)
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(data['types'][0]['total'], Decimal('15.00'))
+
+    def test_etag_returns_not_modified(self):
+        self.transfer('10.00')
+        etag = self.client.get('/api/payments/insights/')['ETag']
+
+        self.assertEqual(self.client.get('/api/payments/insights/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.transfer('5.00')
+        self.assertEqual(self.client.get('/api/payments/insights/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/payments/insights/', {'months': 0}).status_code, 400)
+
+
+class RollupTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile, = seed_profiles('rollup', 1)
+
+    def deposit(self, amount, transaction_id=None):
+        """Транзакция с событием журнала, как ее пишут сервисы; transaction_id — зафиксированная позже с меньшим id."""
+        transaction = Transaction.objects.create(id=transaction_id, profile=self.profile, amount=Decimal(amount),
+                                                 transaction_type='deposit', status='completed')
+        publish_transactions([transaction])
+        return transaction
+
+    def totals(self):
+        return {(row.transaction_type, row.status): (row.count, row.total)
+                for row in TransactionDailyRollup.objects.all()}
+
+    def test_first_run_rebuilds_history_then_follows_journal(self):
+        self.deposit('10.00')
+        Transaction.objects.create(profile=self.profile, amount=Decimal('1.00'), transaction_type='penalty')
+
+        self.assertEqual(update_rollups(), (2, 1))
+        self.assertEqual(self.totals(), {('deposit', 'completed'): (1, Decimal('10.00')),
+                                         ('penalty', 'completed'): (1, Decimal('1.00'))})
+        last = self.deposit('5.00')
+        self.assertEqual(update_rollups(), (1, 1))
+        self.assertEqual(self.totals()[('deposit', 'completed')], (2, Decimal('15.00')))
+        self.assertEqual(get_position(), OutboxEvent.objects.get(transaction_id=last.pk).sequence)
+        self.assertEqual(get_watermark().last_created_at, last.created_at)
+        self.assertEqual(update_rollups(), (0, 0))
+
+    def test_late_commit_with_smaller_id_is_counted(self):
+        update_rollups()
+        self.deposit('10.00', transaction_id=200)
+        update_rollups()
+
+        self.deposit('7.00', transaction_id=150)
+        self.assertEqual(update_rollups(), (1, 1))
+        self.assertEqual(self.totals(), {('deposit', 'completed'): (2, Decimal('17.00'))})
+
+    def test_chunks_and_reset_give_same_totals(self):
+        update_rollups()
+        for amount in ('1.00', '2.00', '3.00'):
+            self.deposit(amount)
+        self.assertEqual(update_rollups(chunk_size=2), (3, 2))
+        incremental = self.totals()
+
+        reset_rollups()
+        self.assertEqual(TransactionDailyRollup.objects.count(), 0)
+        update_rollups()
+        self.assertEqual(self.totals(), incremental)
+
+    def test_archived_transactions_stay_counted(self):
+        transaction = self.deposit('4.00')
+        TransactionArchive.objects.create(id=transaction.pk, profile=self.profile, amount=transaction.amount,
+                                          transaction_type='deposit', status='completed',
+                                          created_at=transaction.created_at)
+        transaction.delete()
+        update_rollups()
+        self.assertEqual(self.totals(), {('deposit', 'completed'): (1, Decimal('4.00'))})
+
+    def test_summary_endpoint(self):
+        update_rollups()
+        self.deposit('10.00')
+        self.deposit('2.50')
+        update_rollups()
+        finance = User.objects.create(username='rollup_finance', role='finance', is_verification=True)
+        client = APIClient()
+        client.force_authenticate(finance)
+
+        response = client.get('/api/payments/transactions-finance-summary/', {'transaction_type': 'deposit'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['count'], 2)
+        total, = response.data['totals']
+        self.assertEqual((total['status'], total['count'], total['total']), ('completed', 2, Decimal('12.50')))
+        self.assertEqual(response.data['updated_to'], get_watermark().last_created_at)
+
+
+class WithdrawalBatchTests(ProcessStateMixin, TestCase):
+    URL = '/api/payments/approve-reject-withdrawal/batch/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='finance_batch', role='finance'))
+
+    def request(self, profile, amount, status='pending'):
+        return WithdrawalRequest.objects.create(user=profile.user, amount=Decimal(amount), card_number='4000',
+                                                status=status)
+
+    def test_mixed_outcomes(self):
+        approved, rejected = seed_profiles('batch', 2, frozen=Decimal('100.00'))
+        short, = seed_profiles('batchshort', 1, frozen=Decimal('10.00'))
+        to_approve = self.request(approved, '60.00')
+        to_reject = self.request(rejected, '30.00')
+        too_large = self.request(short, '50.00')
+        done = self.request(approved, '5.00', status='completed')
+
+        response = self.client.post(self.URL, {'items': [
+            {'id': to_approve.pk, 'action': 'approve'},
+            {'id': to_reject.pk, 'action': 'reject', 'comment': 'Неверная карта'},
+            {'id': too_large.pk, 'action': 'approve'},
+            {'id': done.pk, 'action': 'approve'},
+            {'id': to_approve.pk, 'action': 'reject', 'comment': 'Повтор'},
+            {'id': 999999, 'action': 'approve'},
+            {'id': to_reject.pk + 1000, 'action': 'reject'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (2, 5))
+        messages = [(result['status'], result['message']) for result in response.data['results']]
+        self.assertEqual(messages, [
+            ('success', 'Заявка одобрена и обработана'),
+            ('success', 'Заявка отклонена, средства возвращены на фиатный счет'),
+            ('failed', 'Ошибка при обработке вывода'),
+            ('failed', 'Изменение заявки запрещено, так как она уже обработана'),
+            ('failed', 'Заявка указана в пакете повторно'),
+            ('failed', 'Заявка не найдена'),
+            ('failed', 'При отклонении заявки поле комментарий является обязательным'),
+        ])
+
+        statuses = dict(WithdrawalRequest.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[request.pk] for request in (to_approve, to_reject, too_large, done)],
+                         ['completed', 'cancelled', 'pending', 'completed'])
+        balances = {balance.profile_id: balance for balance in Balance.objects.all()}
+        self.assertEqual((balances[approved.pk].frozen_balance, balances[approved.pk].fiat_balance),
+                         (Decimal('40.00'), Decimal('0.00')))
+        self.assertEqual((balances[rejected.pk].frozen_balance, balances[rejected.pk].fiat_balance),
+                         (Decimal('70.00'), Decimal('30.00')))
+        self.assertEqual(balances[short.pk].frozen_balance, Decimal('10.00'))
+        self.assertTrue(Transaction.objects.filter(profile=short, transaction_type='withdrawal', status='failed').exists())
+        assert_ledger_consistent(self)
+
+    def test_batch_limit(self):
+        profile, = seed_profiles('batchlimit', 1, frozen=Decimal('1000.00'))
+        WithdrawalRequest.objects.bulk_create([
+            WithdrawalRequest(user=profile.user, amount=Decimal('1.00'), card_number='4000', status='pending')
+            for _ in range(WITHDRAWAL_BATCH_LIMIT + 1)
+        ])
+        items = [{'id': request_id, 'action': 'approve'}
+                 for request_id in WithdrawalRequest.objects.order_by('id').values_list('id', flat=True)]
+
+        self.assertEqual(self.client.post(self.URL, {'items': items}, format='json').status_code, 400)
+        response = self.client.post(self.URL, {'items': items[:WITHDRAWAL_BATCH_LIMIT]}, format='json')
+        self.assertEqual(response.data['succeeded'], WITHDRAWAL_BATCH_LIMIT)
+        self.assertEqual(Balance.objects.get(profile=profile).frozen_balance,
+                         Decimal('1000.00') - WITHDRAWAL_BATCH_LIMIT)
+        self.assertEqual(WithdrawalRequest.objects.filter(status='pending').count(), 1)
+        assert_ledger_consistent(self)
+
+
+class BulkBonusCreditTests(ProcessStateMixin, TestCase):
+    def test_split_and_chunks(self):
+        rank = Rank.objects.create(rank_name='bulk', rank_type='customer', rank_price=0)
+        RankSettings.objects.create(rank=rank, type_role='customer', bonus_account_limit=100)
+        empty, = seed_profiles('bulkempty', 1, rank=rank)
+        almost, = seed_profiles('bulkalmost', 1, bonus=Decimal('80.00'), rank=rank)
+        full, = seed_profiles('bulkfull', 1, bonus=Decimal('100.00'), rank=rank)
+        items = [
+            (empty.pk, Decimal('40.00'), 'Акция'),
+            (almost.pk, Decimal('50.00'), ''),
+            (full.pk, Decimal('10.00'), ''),
+            (999999, Decimal('5.00'), ''),
+            (empty.pk, Decimal('70.00'), 'Акция'),
+        ]
+
+        with mock.patch.object(services, '_credit_bonus_chunk', wraps=services._credit_bonus_chunk) as chunk:
+            summary = bulk_credit_bonuses(items, chunk_size=2)
+
+        self.assertEqual(chunk.call_count, 3)
+        self.assertEqual(summary, {
+            'credited': 1, 'partial': 2, 'forfeited': 1, 'missing': [999999],
+            'credited_total': Decimal('120.00'), 'forfeited_total': Decimal('50.00'),
+        })
+        balances = {balance.profile_id: (balance.bonus_balance, balance.forfeited_balance)
+                    for balance in Balance.objects.all()}
+        self.assertEqual(balances, {
+            empty.pk: (Decimal('100.00'), Decimal('10.00')),
+            almost.pk: (Decimal('100.00'), Decimal('30.00')),
+            full.pk: (Decimal('100.00'), Decimal('10.00')),
+        })
+        self.assertEqual(Transaction.objects.filter(transaction_type='bonus_add').count(), 3)
+        self.assertEqual(Transaction.objects.filter(transaction_type='bonus_forfeited').count(), 3)
+        assert_ledger_consistent(self)
+
+
+class WithdrawalEligibilityTests(ProcessStateMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.rank = Rank.objects.create(rank_name='eligibility', rank_type='customer', rank_price=0)
+        self.settings = RankSettings.objects.create(rank=self.rank, type_role='customer', min_withdrawal_amount=1000,
+                                                    weekly_withdrawal_limit=2)
+        self.profile, = seed_profiles('eligibility', 1, rank=self.rank)
+        self.user = self.profile.user
+
+    def withdrawal(self, status='completed', days_ago=0):
+        request = WithdrawalRequest.objects.create(user=self.user, amount=Decimal('1000.00'), status=status)
+        WithdrawalRequest.objects.filter(pk=request.pk).update(
+            date_submitted=timezone.now() - timedelta(days=days_ago))
+
+    def test_rank_minimum(self):
+        error = check_withdrawal_eligibility(self.user, Decimal('999.99'))
+        self.assertIn('Минимальная сумма для вывода 1000р', error['error'])
+        self.assertIsNone(check_withdrawal_eligibility(self.user, Decimal('1000.00')))
+
+    def test_default_minimum_without_rank_settings(self):
+        self.settings.delete()
+        self.assertIsNotNone(check_withdrawal_eligibility(self.user, DEFAULT_MIN_WITHDRAWAL_AMOUNT - 1))
+        self.assertIsNone(check_withdrawal_eligibility(self.user, DEFAULT_MIN_WITHDRAWAL_AMOUNT))
+
+    def test_weekly_limit(self):
+        self.withdrawal(days_ago=8)
+        self.withdrawal(days_ago=2)
+        self.assertIsNone(check_withdrawal_eligibility(self.user, Decimal('1000.00')))
+
+        self.withdrawal(days_ago=1)
+        error = check_withdrawal_eligibility(self.user, Decimal('1000.00'))
+        self.assertEqual(error['remaining_days'], 6)
+
+    def test_unlimited_flags_lift_weekly_limit(self):
+        self.withdrawal(days_ago=1)
+        self.withdrawal(days_ago=1)
+        for flag in ('unlimited_fiat_withdrawals', 'customer_unlimited_fiat_withdrawals',
+                     'executer_unlimited_fiat_withdrawals'):
+            RankSettings.objects.filter(pk=self.settings.pk).update(**{flag: True})
+            self.assertIsNone(check_withdrawal_eligibility(self.user, Decimal('1000.00')), flag)
+            RankSettings.objects.filter(pk=self.settings.pk).update(**{flag: False})
+        self.assertIsNotNone(check_withdrawal_eligibility(self.user, Decimal('1000.00')))
+
+    def test_active_request_blocks_new_one(self):
+        self.withdrawal(status='processing')
+        self.assertEqual(check_withdrawal_eligibility(self.user, Decimal('1000.00')),
+                         {'error': 'У вас уже есть активная заявка на вывод средств'})
@@ -21,11 +21,20 @@ router.register(r'transactions-finance', TransactionForFinanceViewSet, basename=
 urlpatterns = [
     path('', include(router.urls)),
     path('transaction-types/', TransactionTypesView.as_view(), name='transaction-types'),
+    path('transactions-finance-export/', TransactionExportView.as_view(), name='finance-transaction-export'),
+    path('transactions-finance-summary/', TransactionSummaryView.as_view(), name='finance-transaction-summary'),
+    path('balance-as-of/', BalanceAsOfView.as_view(), name='balance-as-of'),
+    path('statements/', AccountStatementView.as_view(), name='account-statement'),
+    path('insights/', TransactionInsightsView.as_view(), name='transaction-insights'),
 
     path('create-withdrawal/', CreateWithdrawalRequest.as_view(), name='create-withdrawal'),
     path('approve-reject-withdrawal/<int:pk>/', ApproveRejectWithdrawalRequest.as_view(),
          name='approve-reject-withdrawal/'),
+    path('approve-reject-withdrawal/batch/', BatchApproveRejectWithdrawalRequests.as_view(),
+         name='approve-reject-withdrawal-batch'),
     path('bonus-transfer/', BonusTransferView.as_view(), name='bonus-transfer'),
+    path('escrow/settle/', EscrowSettleView.as_view(), name='escrow-settle'),
+    path('outbox/events/', OutboxEventsView.as_view(), name='outbox-events'),
 
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,264 @@
+"""
+Ограничения частоты переводов по профилю (правила VELOCITY_RULES).
+Счетчики скользящих окон хранятся в кэше VELOCITY_CACHE_ALIAS: окно делится на VELOCITY_BUCKETS корзин,
+перевод увеличивает счетчики текущей корзины, проверка читает корзины окна одним get_many —
+обе операции не зависят от числа переводов профиля. Окно считается с точностью до корзины
+в строгую сторону: в него попадает и корзина, начавшаяся чуть раньше окна.
+
+Недоступный кэш не пропускает переводы без проверки: check_velocity выбрасывает VelocityUnavailable.
+Учет уже состоявшегося перевода при сбое кэша пропускается с записью в лог.
+
+backtest_rules прогоняет правила по истории транзакций в NumPy с точными окнами — для подбора лимитов.
+"""
+import logging
+import time
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+
+from .models import Transaction, TransactionArchive
+from .money import Money, to_minor_units
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('count', 'amount', 'recipients')
+SOURCES = (Transaction, TransactionArchive)
+BACKTEST_CHUNK_SIZE = 50_000
+
+
+class VelocityUnavailable(Exception):
+    """Кэш счетчиков VELOCITY_CACHE_ALIAS недоступен: перевод нельзя проверить."""
+
+
+class VelocityRule(NamedTuple):
+    name: str
+    metric: str  # count — переводов, amount — сумма, recipients — разных получателей
+    window: int  # секунд
+    limit: int  # для amount — в копейках
+
+    @classmethod
+    def from_settings(cls, row):
+        if row['metric'] not in METRICS:
+            raise ImproperlyConfigured(f"VELOCITY_RULES: неизвестная метрика {row['metric']} в правиле {row['name']}")
+        limit = Money.from_decimal(row['limit']).minor if row['metric'] == 'amount' else int(row['limit'])
+        return cls(row['name'], row['metric'], int(row['window']), limit)
+
+    def display(self, value):
+        return str(Money(value)) if self.metric == 'amount' else value
+
+
+def get_rules(transaction_type):
+    return [VelocityRule.from_settings(row) for row in settings.VELOCITY_RULES.get(transaction_type, [])]
+
+
+def _cache():
+    return caches[settings.VELOCITY_CACHE_ALIAS]
+
+
+def _bucket_width(window):
+    return max(window // settings.VELOCITY_BUCKETS, 1)
+
+
+def _timeout(window):
+    # Корзина нужна, пока она попадает в окно: окно плюс корзина до него и текущая корзина
+    return window + 2 * _bucket_width(window)
+
+
+def _counter_key(transaction_type, profile_id, metric, window, bucket):
+    return f'velocity:{transaction_type}:{profile_id}:{metric}:{window}:{bucket}'
+
+
+def _pair_key(transaction_type, profile_id, window, recipient_id):
+    # Значение — корзина, в которой получатель учтен в счетчике recipients
+    return f'velocity:{transaction_type}:{profile_id}:pair:{window}:{recipient_id}'
+
+
+def _window_buckets(window, moment):
+    current = int(moment // _bucket_width(window))
+    return range(current - settings.VELOCITY_BUCKETS, current + 1)
+
+
+def _incr(cache, key, delta, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Ключ истек между add и incr
+        cache.set(key, delta, timeout)
+
+
+def check_velocity(profile_id, recipient_id, amount, transaction_type='bonus_transfer', moment=None):
+    """
+    Правила, которые нарушит перевод amount от profile_id к recipient_id:
+    список {'rule', 'limit', 'value'}, где value — значение метрики вместе с этим переводом.
+    Проверка и учет перевода (record_transfer) не атомарны: параллельные переводы одного профиля
+    могут превысить лимит на несколько переводов. При сбое кэша выбрасывает VelocityUnavailable.
+    """
+    rules = get_rules(transaction_type)
+    if not rules:
+        return []
+    moment = moment or time.time()
+    keys = {}
+    for rule in rules:
+        keys[rule] = [_counter_key(transaction_type, profile_id, rule.metric, rule.window, bucket)
+                      for bucket in _window_buckets(rule.window, moment)]
+        if rule.metric == 'recipients':
+            keys[rule].append(_pair_key(transaction_type, profile_id, rule.window, recipient_id))
+    try:
+        values = _cache().get_many([key for rule_keys in keys.values() for key in rule_keys])
+    except Exception as exc:
+        raise VelocityUnavailable(f"Кэш '{settings.VELOCITY_CACHE_ALIAS}' недоступен: {exc}") from exc
+
+    violations = []
+    for rule in rules:
+        if rule.metric == 'recipients':
+            *counters, pair = keys[rule]
+            counted = values.get(pair)
+            value = sum(values.get(key, 0) for key in counters)
+            if counted is None or counted < _window_buckets(rule.window, moment)[0]:
+                value += 1
+        else:
+            value = sum(values.get(key, 0) for key in keys[rule])
+            value += 1 if rule.metric == 'count' else Money.of(amount).minor
+        if value > rule.limit:
+            violations.append({'rule': rule.name, 'limit': rule.display(rule.limit), 'value': rule.display(value)})
+    return violations
+
+
+def record_transfer(profile_id, recipient_id, amount, transaction_type='bonus_transfer', moment=None):
+    """
+    Учитывает состоявшийся перевод в счетчиках всех окон правил типа transaction_type.
+    Перевод уже проведен, поэтому сбой кэша не прерывает ответ: перевод не попадет в окна,
+    ошибка пишется в лог. Возвращает True, если перевод учтен.
+    """
+    rules = get_rules(transaction_type)
+    if not rules:
+        return True
+    try:
+        _record(_cache(), rules, transaction_type, profile_id, recipient_id, amount, moment or time.time())
+    except Exception:
+        logger.exception(f"Перевод профиля {profile_id} не учтен в ограничениях частоты: кэш недоступен")
+        return False
+    return True
+
+
+def _record(cache, rules, transaction_type, profile_id, recipient_id, amount, moment):
+    for window in {rule.window for rule in rules}:
+        metrics = {rule.metric for rule in rules if rule.window == window}
+        bucket = _window_buckets(window, moment)[-1]
+        timeout = _timeout(window)
+        if 'count' in metrics:
+            _incr(cache, _counter_key(transaction_type, profile_id, 'count', window, bucket), 1, timeout)
+        if 'amount' in metrics:
+            _incr(cache, _counter_key(transaction_type, profile_id, 'amount', window, bucket),
+                  Money.of(amount).minor, timeout)
+        if 'recipients' in metrics:
+            # Получатель учитывается в корзине последнего перевода ему: переносим его из прежней корзины
+            pair = _pair_key(transaction_type, profile_id, window, recipient_id)
+            counted = cache.get(pair)
+            if counted != bucket:
+                if counted is not None:
+                    try:
+                        cache.decr(_counter_key(transaction_type, profile_id, 'recipients', window, counted))
+                    except ValueError:
+                        pass
+                _incr(cache, _counter_key(transaction_type, profile_id, 'recipients', window, bucket), 1, timeout)
+                cache.set(pair, bucket, timeout)
+
+
+def _load_transfers(transaction_type, since, until):
+    """Завершенные переводы из обеих таблиц: массивы профилей, получателей, времени (секунды) и сумм в копейках."""
+    profiles, recipients, moments, amounts = [], [], [], []
+    for model in SOURCES:
+        queryset = model.objects.filter(transaction_type=transaction_type, status='completed')
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+        rows = queryset.values_list('profile_id', 'target_profile_id', 'created_at', to_minor_units(F('amount')))
+        for profile_id, recipient_id, created_at, amount in rows.iterator(chunk_size=BACKTEST_CHUNK_SIZE):
+            profiles.append(profile_id)
+            recipients.append(recipient_id or 0)
+            moments.append(created_at.timestamp())
+            amounts.append(amount)
+    return (np.array(profiles, dtype=np.int64), np.array(recipients, dtype=np.int64),
+            np.array(moments, dtype=np.float64), np.array(amounts, dtype=np.int64))
+
+
+def _window_starts(keys, window):
+    """Для каждого перевода — индекс первого перевода того же профиля в окне (t - window, t]."""
+    return np.searchsorted(keys, keys - window, side='right')
+
+
+def _distinct_in_window(pairs, starts):
+    """
+    Число разных получателей в окне каждого перевода.
+    Перевод i учитывается в окнах j >= i, которые начинаются не позже i и позже предыдущего перевода
+    той же пары: starts не убывает, поэтому такие j образуют отрезок и считаются разностным массивом.
+    """
+    count = len(pairs)
+    positions = np.arange(count)
+    by_pair = np.lexsort((positions, pairs))
+    previous = np.full(count, -1, dtype=np.int64)
+    same = pairs[by_pair][1:] == pairs[by_pair][:-1]
+    previous[by_pair[1:][same]] = by_pair[:-1][same]
+
+    begin = np.maximum(positions, np.searchsorted(starts, previous, side='right'))
+    end = np.searchsorted(starts, positions, side='right')
+    covered = begin < end
+    diff = np.zeros(count + 1, dtype=np.int64)
+    np.add.at(diff, begin[covered], 1)
+    np.add.at(diff, end[covered], -1)
+    return np.cumsum(diff)[:count]
+
+
+def backtest_rules(rules=None, transaction_type='bonus_transfer', since=None, until=None, top=10):
+    """
+    Прогоняет правила по истории: сколько переводов и профилей каждое правило отклонило бы.
+    Отклоненный перевод в истории состоялся и учитывается в окнах следующих, поэтому оценка — сверху.
+    """
+    rules = rules if rules is not None else get_rules(transaction_type)
+    profiles, recipients, moments, amounts = _load_transfers(transaction_type, since, until)
+    report = {'transaction_type': transaction_type, 'transfers': len(profiles),
+              'profiles': len(np.unique(profiles)), 'rules': []}
+    if not len(profiles):
+        return report
+
+    order = np.lexsort((moments, profiles))
+    profiles, recipients, moments, amounts = profiles[order], recipients[order], moments[order], amounts[order]
+    # Профили разносятся на непересекающиеся отрезки оси времени, чтобы окно не захватывало соседний профиль
+    _, blocks = np.unique(profiles, return_inverse=True)
+    stride = moments.max() - moments.min() + max(rule.window for rule in rules) + 1
+    keys = blocks * stride + (moments - moments.min())
+    _, pairs = np.unique(np.stack([profiles, recipients]), axis=1, return_inverse=True)
+    pairs = pairs.reshape(-1)
+    cumulative = np.concatenate([[0], np.cumsum(amounts)])
+    positions = np.arange(len(profiles))
+
+    for rule in rules:
+        starts = _window_starts(keys, rule.window)
+        if rule.metric == 'count':
+            values = positions - starts + 1
+        elif rule.metric == 'amount':
+            values = cumulative[positions + 1] - cumulative[starts]
+        else:
+            values = _distinct_in_window(pairs, starts)
+        flagged = values > rule.limit
+        flagged_profiles, counts = np.unique(profiles[flagged], return_counts=True)
+        worst = np.argsort(-counts, kind='stable')[:top]
+        report['rules'].append({
+            'rule': rule.name,
+            'metric': rule.metric,
+            'window': rule.window,
+            'limit': rule.display(rule.limit),
+            'max_value': rule.display(int(values.max())),
+            'flagged_transfers': int(flagged.sum()),
+            'flagged_profiles': len(flagged_profiles),
+            'top_profiles': [{'profile_id': int(flagged_profiles[index]), 'flagged': int(counts[index])}
+                             for index in worst],
+        })
+    return report
@@ -1,7 +1,11 @@
-from datetime import timedelta, datetime
+from datetime import datetime
 from decimal import Decimal
 from functools import partial
 
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
@@ -10,6 +14,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from .filters import *
 from .models import WithdrawalRequest, Balance
@@ -17,7 +22,20 @@ from server.decorators import *
 from rest_framework import generics, viewsets
 
 from .serializers import *
-from .services import process_transaction
+from .balance_cache import get_balance, get_profile_id
+from .escrow import ESCROW_BATCH_LIMIT, SETTLEMENT_ACTIONS, get_escrow_totals, settle_order_holds
+from .export import EXPORT_FORMATS
+from .idempotency import idempotent
+from .insights import get_insights
+from .outbox import acknowledge, read_events
+from .pagination import KeysetPagination
+from .payouts import enqueue_payout, payouts_enabled
+from .rollups import get_watermark
+from .services import (WITHDRAWAL_BATCH_LIMIT, check_withdrawal_eligibility, process_transaction,
+                       process_withdrawal_batch)
+from .snapshots import balance_as_of
+from .statements import STATEMENT_FORMATS, cache_statement, get_cached_statement, is_closed, request_statement
+from .velocity import VelocityUnavailable, check_velocity, record_transfer
 
 
 class CreateWithdrawalRequest(APIView):
@@ -27,19 +45,14 @@ class CreateWithdrawalRequest(APIView):
         partial(IsVerified)
     ]
 
+    @idempotent
     def post(self, request):
         user = request.user
 
-        # Проверка на наличие активной заявки со статусом "pending"
-        if WithdrawalRequest.objects.filter(user=user, status="pending").exists():
-            return Response({
-                "error": "У вас уже есть активная заявка на вывод средств"
-            }, status=status.HTTP_400_BAD_REQUEST)
-
         # Получение и валидация суммы
         try:
             amount = Decimal(request.data.get('amount'))  # Приводим к Decimal
-        except (ValueError, TypeError):
+        except (ValueError, TypeError, ArithmeticError):
             return Response({
                 "error": "Некорректное значение суммы. Введите корректное число."
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -53,32 +66,10 @@ class CreateWithdrawalRequest(APIView):
 
         comment = request.data.get('comment', '')
 
-        # Минимальная сумма вывода
-        if amount < Decimal('5000'):
-            return Response({
-                "error": f"Минимальная сумма для вывода 5000р, для успешного вывода вам не хватает {5000 - amount}р"
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Проверяем дату последнего успешного вывода
-        last_withdrawal = WithdrawalRequest.objects.filter(
-            user=user, status="completed"
-        ).order_by('-date_submitted').first()
-
-        if last_withdrawal:
-            days_since_last_withdrawal = (timezone.now().date() - last_withdrawal.date_submitted.date()).days
-            remaining_days = max(7 - days_since_last_withdrawal, 0)
-
-            # Если за последние 7 дней уже было 3 успешных вывода — запретить новый вывод
-            week_ago = timezone.now() - timedelta(days=7)
-            withdrawal_count = WithdrawalRequest.objects.filter(
-                user=user, status="completed", date_submitted__gte=week_ago
-            ).count()
-
-            if withdrawal_count >= 3:
-                return Response({
-                    'remaining_days': remaining_days,
-                    "error": f"Вы превысили количество выводов на этой неделе, вывести денежные средства вы сможете через {remaining_days} дней"
-                }, status=status.HTTP_400_BAD_REQUEST)
+        # Активная заявка, минимальная сумма и лимит выводов за неделю — одним запросом
+        error = check_withdrawal_eligibility(user, amount)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
 
         # Проводим транзакцию с использованием process_transaction
         try:
@@ -179,8 +170,8 @@ class ApproveRejectWithdrawalRequest(APIView):
         # Получаем заявку или возвращаем 404
         withdrawal_request = get_object_or_404(WithdrawalRequest, id=pk)
 
-        # Запрещаем изменять заявки со статусами completed, cancelled, cancelled_whores
-        if withdrawal_request.status in ["completed", "cancelled", "cancelled_whores"]:
+        # Запрещаем изменять заявки со статусами processing, completed, cancelled, cancelled_whores
+        if withdrawal_request.status in ["processing", "completed", "cancelled", "cancelled_whores"]:
             return Response(
                 {"error": "Изменение заявки запрещено, так как она уже обработана"},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -188,6 +179,18 @@ class ApproveRejectWithdrawalRequest(APIView):
 
         # Функция для обработки успешного вывода
         def handle_approve():
+            if payouts_enabled():
+                # Выплату проводит run_payout_worker, средства пока остаются замороженными
+                if not enqueue_payout(withdrawal_request):
+                    return Response(
+                        {"error": "Изменение заявки запрещено, так как она уже обработана"},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                return Response(
+                    {"status": "processing", "message": "Заявка одобрена и передана на выплату"},
+                    status=status.HTTP_202_ACCEPTED,
+                )
+
             transaction_result = process_transaction(user_from=withdrawal_request.user,
                                                      amount=withdrawal_request.amount, transaction_type="withdrawal",
                                                      comment="Вывод средств на БК")
@@ -251,11 +254,64 @@ class ApproveRejectWithdrawalRequest(APIView):
             )
 
 
+class BatchApproveRejectWithdrawalRequests(APIView):
+    """
+    Пакетная обработка заявок на вывод: {"items": [{"id": 1, "action": "approve"},
+    {"id": 2, "action": "reject", "comment": "..."}]}. Возвращает результат по каждой заявке.
+    """
+    permission_classes = [IsAuthenticated, partial(IsRole, allowed_roles=["finance"])]
+
+    @idempotent
+    def post(self, request):
+        items = request.data.get("items")
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            return Response({"error": "Передайте непустой список items с полями id и action"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > WITHDRAWAL_BATCH_LIMIT:
+            return Response({"error": f"Не более {WITHDRAWAL_BATCH_LIMIT} заявок за один запрос"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = process_withdrawal_batch(items)
+        succeeded = sum(result["status"] == "success" for result in results)
+        return Response({
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        })
+
+
+class EscrowSettleView(APIView):
+    """
+    Пакетный расчет по удержаниям заказов: {"orders": [1, 2], "action": "release" | "refund", "comment": "..."}.
+    release передает оплату исполнителям и завершает заказы, refund возвращает ее заказчикам.
+    """
+    permission_classes = [IsAuthenticated, partial(IsRole, allowed_roles=["finance"])]
+
+    @idempotent
+    def post(self, request):
+        orders = request.data.get("orders")
+        action = request.data.get("action")
+        if not isinstance(orders, list) or not orders or not all(isinstance(order_id, int) for order_id in orders):
+            return Response({"error": "Передайте непустой список id заказов в orders"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(orders) > ESCROW_BATCH_LIMIT:
+            return Response({"error": f"Не более {ESCROW_BATCH_LIMIT} заказов за один запрос"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if action not in SETTLEMENT_ACTIONS:
+            return Response({"error": "Некорректное действие. Ожидается release или refund"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        summary = settle_order_holds(orders, action, request.data.get("comment", ""))
+        return Response(summary)
+
+
 class BonusTransferView(APIView):
     permission_classes = [IsAuthenticated,
                           partial(IsRole, allowed_roles=['исполнитель', 'заказчик']),
                           partial(IsVerified)
                           ]
+
+    @idempotent
     def post(self, request, *args, **kwargs):
         # Сериализуем входящие данные
         serializer = BonusTransferSerializer(data=request.data)
@@ -276,10 +332,25 @@ class BonusTransferView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            # Ограничения частоты переводов проверяем до блокировки балансов
+            profile_id = get_profile_id(user_from)
+            recipient_id = serializer.validated_data['recipient_profile'].pk
+            try:
+                violations = check_velocity(profile_id, recipient_id, amount)
+            except VelocityUnavailable:
+                return Response({"error": "Проверка ограничений на переводы временно недоступна, повторите позже"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if violations:
+                return Response({"error": "Превышены ограничения на переводы бонусов", "rules": violations},
+                                status=status.HTTP_429_TOO_MANY_REQUESTS)
+
             # Вызываем функцию обработки транзакции
             result = process_transaction(user_from=user_from, user_to=user_to, amount=amount,
                                          transaction_type="bonus_transfer", comment=comment)
 
+            if result['status'] in ('success', 'partial_success'):
+                # В окна учитывается фактически переведенная сумма: при частичном переводе — доступный остаток лимита
+                record_transfer(profile_id, recipient_id, Decimal(result['transactions'][0]['amount']))
             if result['status'] == 'success':
                 return Response({
                     "status": "success",
@@ -303,11 +374,178 @@ class BalanceViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         # Получаем баланс только для текущего пользователя
-        return Balance.objects.filter(profile__user=self.request.user)
+        return Balance.objects.filter(profile__user=self.request.user).annotate(
+            escrow_balance=Sum('profile__escrow_holds__amount', filter=Q(profile__escrow_holds__status='held'))
+        )
+
+    def list(self, request, *args, **kwargs):
+        # Счета текущего пользователя из кэша балансов и сумма удержаний одним запросом по индексу,
+        # в том же формате страницы
+        profile_id = get_profile_id(request.user)
+        balance = get_balance(profile_id) if profile_id is not None else None
+        results = []
+        if balance:
+            escrow_balance = get_escrow_totals([profile_id]).get(profile_id, Decimal('0.00'))
+            results.append(self.get_serializer({**balance, 'escrow_balance': escrow_balance}).data)
+        return Response({'count': len(results), 'next': None, 'previous': None, 'results': results})
+
+
+def get_requested_profile(request):
+    """
+    Профиль для отчетов по счету: финансовый отдел указывает id параметром profile, остальные получают свой.
+    None — финансовый отдел не указал корректный id.
+    """
+    if request.user.role == 'finance':
+        profile_id = request.query_params.get('profile', '')
+        return get_object_or_404(Profile, pk=profile_id) if profile_id.isdigit() else None
+    return get_object_or_404(Profile, user=request.user)
+
+
+class BalanceAsOfView(APIView):
+    """
+    Баланс на дату (?at=2024-05-01T00:00:00) по ближайшему снимку и проводкам после него.
+    Финансовый отдел указывает профиль параметром profile, остальные получают свой баланс.
+    """
+    permission_classes = [IsAuthenticated,
+                          partial(IsRole, allowed_roles=['исполнитель', 'заказчик', 'finance']),
+                          ]
+
+    def get(self, request):
+        moment = parse_datetime(request.query_params.get('at', ''))
+        if moment is None:
+            return Response({"error": "Укажите дату и время в параметре at, например 2024-05-01T00:00:00"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+
+        profile = get_requested_profile(request)
+        if profile is None:
+            return Response({"error": "Укажите id профиля в параметре profile"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(BalanceAsOfSerializer(balance_as_of(profile.pk, moment)).data)
+
+
+class AccountStatementView(APIView):
+    """
+    Месячная выписка по счету (?month=2024-05&statement_format=csv). Выписка закрытого месяца
+    формируется один раз в фоне: пока файла нет, ответ 202 со статусом, потом — файл с ETag.
+    Выписку, сброшенную поздней транзакцией, клиент перезапросит по изменившемуся ETag.
+    """
+    permission_classes = [IsAuthenticated,
+                          partial(IsRole, allowed_roles=['исполнитель', 'заказчик', 'finance']),
+                          ]
 
+    def get(self, request):
+        try:
+            month = datetime.strptime(request.query_params.get('month', ''), '%Y-%m').date()
+        except ValueError:
+            return Response({"error": "Укажите месяц в параметре month в формате ГГГГ-ММ"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        statement_format = request.query_params.get('statement_format', 'csv')
+        if statement_format not in STATEMENT_FORMATS:
+            return Response({
+                "error": f"Неизвестный формат выписки. Доступные: {', '.join(STATEMENT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not is_closed(month):
+            return Response({"error": "Выписка доступна только за закончившийся месяц"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        profile = get_requested_profile(request)
+        if profile is None:
+            return Response({"error": "Укажите id профиля в параметре profile"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        name = get_cached_statement(profile.pk, month, statement_format)
+        if name is None:
+            statement = request_statement(profile, month, statement_format)
+            if statement.status != 'ready':
+                return Response({
+                    "status": statement.status,
+                    "message": "Выписка формируется, повторите запрос позже"
+                }, status=status.HTTP_202_ACCEPTED)
+            cache_statement(statement)
+            name = statement.file.name
+
+        # Повторно сформированная выписка сохраняется под новым именем файла, и ETag меняется вместе с ним
+        etag = f'"{name}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(default_storage.open(name), as_attachment=True,
+                                    filename=f"statement_{month:%Y_%m}.{statement_format}",
+                                    content_type=STATEMENT_FORMATS[statement_format][1])
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class TransactionInsightsView(APIView):
+    """
+    Сводка завершенных транзакций профиля за последние месяцы (?months=12): итоги по типам
+    и расходы/поступления по месяцам. До следующей проводки профиля отдается из кэша,
+    повторный запрос с If-None-Match получает 304.
+    """
+    permission_classes = [IsAuthenticated,
+                          partial(IsRole, allowed_roles=['исполнитель', 'заказчик', 'finance']),
+                          ]
 
-class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Transaction.objects.filter(status="completed")
+    def get(self, request):
+        try:
+            months = int(request.query_params.get('months', settings.INSIGHTS_MONTHS))
+        except ValueError:
+            return Response({"error": "months должен быть целым числом"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= months <= settings.INSIGHTS_MAX_MONTHS:
+            return Response({"error": f"months должен быть от 1 до {settings.INSIGHTS_MAX_MONTHS}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        profile = get_requested_profile(request)
+        if profile is None:
+            return Response({"error": "Укажите id профиля в параметре profile"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        key, data = get_insights(profile.pk, months)
+        etag = f'"{key}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ArchivedHistoryMixin:
+    """
+    История транзакций из горячей таблицы и архивной модели archive_model: к обеим выборкам применяются
+    условия get_history_filters, фильтры и сортировка, страницы выборок сливаются в KeysetPagination.
+    """
+    archive_model = TransactionArchive
+
+    def get_history_filters(self):
+        return {}
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**self.get_history_filters())
+
+    def get_archive_queryset(self):
+        return self.archive_model.objects.filter(**self.get_history_filters())
+
+    def filter_archive_queryset(self, queryset):
+        queryset = self.filterset_class(self.request.query_params, queryset=queryset, request=self.request).qs
+        return OrderingFilter().filter_queryset(self.request, queryset, self)
+
+    def paginate_queryset(self, queryset):
+        archive_queryset = self.filter_archive_queryset(self.get_archive_queryset())
+        return self.paginator.paginate_queryset([queryset, archive_queryset], self.request, view=self)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            return get_object_or_404(self.get_archive_queryset(), pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+
+
+class TransactionViewSet(ArchivedHistoryMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated,
                           partial(IsRole, allowed_roles=['исполнитель', 'заказчик']),
@@ -318,9 +556,10 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = TransactionFilter
     ordering_fields = ['created_at', 'amount']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
 
-    def get_queryset(self):
-        return Transaction.objects.filter(profile__user=self.request.user, status="completed")
+    def get_history_filters(self):
+        return {'profile__user': self.request.user, 'status': 'completed'}
 
 
 class TransactionTypesView(APIView):
@@ -334,7 +573,7 @@ class TransactionTypesView(APIView):
         return Response(transaction_types)
 
 
-class TransactionForFinanceViewSet(viewsets.ReadOnlyModelViewSet):
+class TransactionForFinanceViewSet(ArchivedHistoryMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated,
@@ -344,4 +583,110 @@ class TransactionForFinanceViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend, OrderingFilter)
     filterset_class = TransactionForFinanceFilter
     ordering_fields = ['created_at', 'amount']
-    ordering = ['-created_at']
\ No newline at end of file
+    ordering = ['-created_at']
+    pagination_class = KeysetPagination
+
+
+class TransactionExportView(APIView):
+    """
+    Выгрузка транзакций для финансового отдела целиком, вместе с архивом, с теми же фильтрами,
+    что и TransactionForFinanceViewSet. Формат задается параметром export_format: csv или ndjson.
+    """
+    permission_classes = [IsAuthenticated,
+                          partial(IsRole, allowed_roles=['finance']),
+                          ]
+
+    def get(self, request):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({
+                "error": f"Неизвестный формат выгрузки. Доступные: {', '.join(EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        querysets = []
+        for queryset in (Transaction.objects.all(), TransactionArchive.objects.all()):
+            filterset = TransactionForFinanceFilter(request.query_params, queryset=queryset)
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+            querysets.append(filterset.qs.order_by('created_at', 'id'))
+
+        stream, content_type = EXPORT_FORMATS[export_format]
+        filename = f"transactions_{timezone.now():%Y%m%d_%H%M%S}.{export_format}"
+        response = StreamingHttpResponse(stream(querysets), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class TransactionSummaryView(APIView):
+    """
+    Итоги транзакций за период по типам и статусам из дневных итогов.
+    Время ответа не зависит от размера таблицы транзакций; updated_to — до какого момента учтены данные.
+    """
+    permission_classes = [IsAuthenticated,
+                          partial(IsRole, allowed_roles=['finance']),
+                          ]
+
+    def get(self, request):
+        filterset = TransactionRollupFilter(request.query_params, queryset=TransactionDailyRollup.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = (filterset.qs
+                .values('transaction_type', 'status')
+                .annotate(count=Sum('count'), total=Sum('total'))
+                .order_by('transaction_type', 'status'))
+        types = dict(Transaction.TRANSACTION_TYPES)
+        statuses = dict(Transaction.STATUS_CHOICES)
+        totals = [{
+            'transaction_type': row['transaction_type'],
+            'transaction_type_display': types.get(row['transaction_type'], row['transaction_type']),
+            'status': row['status'],
+            'status_display': statuses.get(row['status'], row['status']),
+            'count': row['count'],
+            'total': row['total'],
+        } for row in rows]
+
+        watermark = get_watermark()
+        return Response({
+            'updated_to': watermark.last_created_at if watermark else None,
+            'count': sum(row['count'] for row in totals),
+            'totals': totals,
+        })
+
+
+class OutboxEventsView(APIView):
+    """
+    Чтение событий журнала обработчиком: GET ?consumer=имя&limit=500[&after=номер] — пачка событий после
+    позиции обработчика и курсор; POST {"consumer": "имя", "cursor": номер} — подтверждение прочитанного.
+    Пока пачка не подтверждена, GET возвращает ее снова.
+    """
+    permission_classes = [IsAuthenticated,
+                          partial(IsRole, allowed_roles=['finance']),
+                          ]
+
+    def get(self, request):
+        consumer = request.query_params.get('consumer')
+        if not consumer or len(consumer) > 50:
+            return Response({"error": "Укажите обработчика в параметре consumer, не длиннее 50 символов"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            after = request.query_params.get('after')
+            after = int(after) if after is not None else None
+            limit = min(int(request.query_params.get('limit', settings.OUTBOX_BATCH_SIZE)),
+                        settings.OUTBOX_BATCH_SIZE)
+        except ValueError:
+            return Response({"error": "after и limit должны быть целыми числами"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit должен быть положительным"}, status=status.HTTP_400_BAD_REQUEST)
+
+        events, cursor = read_events(consumer, after=after, limit=limit)
+        return Response({'events': events, 'cursor': cursor})
+
+    def post(self, request):
+        serializer = OutboxAcknowledgeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        consumer = serializer.validated_data['consumer']
+        return Response({'consumer': consumer,
+                         'acknowledged': acknowledge(consumer, serializer.validated_data['cursor'])})
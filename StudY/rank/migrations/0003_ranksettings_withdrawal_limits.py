@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rank', '0002_ranksettings_bonus_account_limit_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranksettings',
+            name='min_withdrawal_amount',
+            field=models.IntegerField(default=5000, verbose_name='Минимальная сумма вывода (₽)'),
+        ),
+        migrations.AddField(
+            model_name='ranksettings',
+            name='weekly_withdrawal_limit',
+            field=models.IntegerField(default=3, verbose_name='Количество выводов за 7 дней'),
+        ),
+    ]
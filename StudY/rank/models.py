@@ -59,6 +59,8 @@ class RankSettings(models.Model):
     discount_orders = models.IntegerField(default=0, verbose_name="Скидка на заказы (%)")
     commission_reduction = models.IntegerField(default=0, verbose_name="Снижение комиссии от заказа (%)")
     bonus_account_limit = models.IntegerField(default=0, verbose_name="Ограничения бонусного счета (₽)")
+    min_withdrawal_amount = models.IntegerField(default=5000, verbose_name="Минимальная сумма вывода (₽)")
+    weekly_withdrawal_limit = models.IntegerField(default=3, verbose_name="Количество выводов за 7 дней")
 
     # Уникальные привилегии (bool)
     notifications_to_executor = models.BooleanField(default=False, verbose_name="Уведомления исполнителю")
@@ -1,13 +1,12 @@
 from django.core.exceptions import ObjectDoesNotExist
 
-from .models import RankSettings
+from payments.fees import get_rank_settings
 
 
-from django.core.exceptions import ObjectDoesNotExist
-
 def check_user_rank(user, check_type, is_profile=False):
     """
     Проверяет привилегии пользователя на основе его ранга.
+    Настройки берутся из таблиц рангов в памяти (payments.fees), без запроса к RankSettings.
     """
     try:
         if is_profile:
@@ -18,22 +17,26 @@ def check_user_rank(user, check_type, is_profile=False):
         print(f"Ошибка: Профиль для пользователя {user} не найден.")
         return False
 
-    # Получаем настройки ранга через ранг профиля
-    try:
-        rank_settings = RankSettings.objects.get(rank=profile.rank)
-    except RankSettings.DoesNotExist:
-        print(f"Ошибка: Настройки ранга для пользователя {user} (ранг: {profile.rank}) не найдены.")
+    # Получаем настройки ранга по id ранга профиля
+    rank_settings = get_rank_settings(profile.rank_id)
+    if rank_settings is None:
+        print(f"Ошибка: Настройки ранга для пользователя {user} (ранг: {profile.rank_id}) не найдены.")
         return False
 
     # Проверяем наличие запрашиваемого атрибута
-    if hasattr(rank_settings, check_type):
-        field = getattr(rank_settings, check_type, None)
+    if check_type in rank_settings:
+        field = rank_settings[check_type]
 
         if field is None:
-            print(f"Ошибка: Поле {check_type} не найдено в настройках ранга {profile.rank}.")
+            print(f"Ошибка: Поле {check_type} не найдено в настройках ранга {profile.rank_id}.")
             return False
 
         return field  # Может быть True, False или числовое значение
 
     print(f"Ошибка: Атрибут {check_type} отсутствует в модели RankSettings.")
-    return False
\ No newline at end of file
+    return False
+
+
+def get_referral_bonus_percent(referrer):
+    """Надбавка к реферальному бонусу (%) по рангу реферера; 0, если настроек ранга нет."""
+    return check_user_rank(user=referrer, check_type='referral_bonus_self') or 0
@@ -1,3 +1,44 @@
+from decimal import Decimal
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from payments.bench import seed_profiles
+from payments.models import Balance, Transaction
+
+from .models import Rank, RankSettings
+
+
+class RankPurchaseTests(TestCase):
+    def setUp(self):
+        self.current = Rank.objects.create(rank_name='Новичок', rank_type='customer', rank_price=0)
+        self.next = Rank.objects.create(rank_name='Опытный', rank_type='customer', rank_price=Decimal('300.00'))
+        for rank in (self.current, self.next):
+            RankSettings.objects.create(rank=rank, type_role='customer', bonus_account_limit=1000)
+        self.profile, = seed_profiles('rank_purchase', 1, fiat=Decimal('1000.00'), rank=self.current)
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def buy(self, key):
+        return self.client.post('/api/rank/payment-rank/', {'rank_id': self.next.pk}, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replayed_purchase_is_charged_once(self):
+        first = self.buy('rank-1')
+        second = self.buy('rank-1')
+
+        self.assertEqual(first.status_code, 200, first.data)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.rank, self.next)
+        self.assertEqual(Transaction.objects.filter(profile=self.profile, transaction_type='payment').count(), 1)
+        self.assertEqual(Balance.objects.get(profile=self.profile).fiat_balance, Decimal('700.00'))
+
+    def test_new_key_does_not_buy_again(self):
+        self.buy('rank-1')
+        response = self.buy('rank-2')
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Balance.objects.get(profile=self.profile).fiat_balance, Decimal('700.00'))
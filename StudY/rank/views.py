@@ -1,9 +1,10 @@
 from django.shortcuts import render
 from functools import partial
 
-from requests import Response
+from rest_framework.response import Response
 from rest_framework.views import APIView
 from server.decorators import *
+from payments.idempotency import idempotent
 from payments.services import process_transaction
 from rest_framework import generics, viewsets, status
 from rest_framework.permissions import IsAuthenticated
@@ -54,6 +55,7 @@ class RankPurchaseAPIView(APIView):
                           ]
 
 
+    @idempotent
     def post(self, request, *args, **kwargs):
 
         user = request.user
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def repair_search_index(using, **kwargs):
+    from django.db import connections
+    from .search import repair_username_index
+    repair_username_index(connections[using])
 
 
 class ServerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'server'
+
+    def ready(self):
+        post_migrate.connect(repair_search_index, sender=self)
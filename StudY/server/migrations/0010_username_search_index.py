@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from server.search import drop_username_index, install_username_index
+
+
+def install(apps, schema_editor):
+    install_username_index(schema_editor.connection)
+
+
+def drop(apps, schema_editor):
+    drop_username_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0009_remove_user_is_start_auth_user_count_auth'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, drop),
+    ]
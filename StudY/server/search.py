@@ -0,0 +1,104 @@
+"""
+Индекс подстрочного поиска по логинам пользователей.
+SQLite: внешняя FTS5-таблица с триграммным токенизатором, синхронизируется триггерами.
+PostgreSQL: GIN-индекс pg_trgm по UPPER(username), его использует обычный icontains.
+На остальных СУБД поиск работает через icontains без индекса.
+"""
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+USERNAME_FTS_TABLE = 'server_user_username_fts'
+USERNAME_TRGM_INDEX = 'server_user_username_trgm'
+# Триграммный индекс находит только подстроки от трех символов
+MIN_INDEXED_QUERY = 3
+
+SQLITE_TRIGGERS = {
+    'server_user_username_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS server_user_username_fts_ai AFTER INSERT ON server_user BEGIN
+            INSERT INTO {USERNAME_FTS_TABLE}(rowid, username) VALUES (new.id, new.username);
+        END""",
+    'server_user_username_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS server_user_username_fts_ad AFTER DELETE ON server_user BEGIN
+            INSERT INTO {USERNAME_FTS_TABLE}({USERNAME_FTS_TABLE}, rowid, username) VALUES ('delete', old.id, old.username);
+        END""",
+    'server_user_username_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS server_user_username_fts_au AFTER UPDATE OF username ON server_user BEGIN
+            INSERT INTO {USERNAME_FTS_TABLE}({USERNAME_FTS_TABLE}, rowid, username) VALUES ('delete', old.id, old.username);
+            INSERT INTO {USERNAME_FTS_TABLE}(rowid, username) VALUES (new.id, new.username);
+        END""",
+}
+
+_available = {}
+
+
+def sqlite_supports_trigram(connection):
+    return connection.Database.sqlite_version_info >= (3, 34, 0)
+
+
+def install_username_index(connection):
+    """Создает индекс и заполняет его текущими логинами. Повторный вызов безопасен."""
+    _available.pop(connection.alias, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite' and sqlite_supports_trigram(connection):
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {USERNAME_FTS_TABLE} USING fts5("
+                f"username, content='server_user', content_rowid='id', tokenize='trigram')"
+            )
+            for sql in SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {USERNAME_FTS_TABLE}({USERNAME_FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {USERNAME_TRGM_INDEX} "
+                f"ON server_user USING gin (UPPER(username) gin_trgm_ops)"
+            )
+
+
+def drop_username_index(connection):
+    _available.pop(connection.alias, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {USERNAME_FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {USERNAME_TRGM_INDEX}")
+
+
+def repair_username_index(connection):
+    """
+    Django пересоздает таблицу server_user при части миграций SQLite, и триггеры
+    при этом пропадают. Если индекс есть, а триггеров нет — ставим их заново и перестраиваем индекс.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                       [f'{USERNAME_FTS_TABLE}%'])
+        existing = {row[0] for row in cursor.fetchall()}
+    if USERNAME_FTS_TABLE in existing and not set(SQLITE_TRIGGERS) <= existing:
+        install_username_index(connection)
+
+
+def sqlite_index_available(connection):
+    if connection.alias not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [USERNAME_FTS_TABLE])
+            _available[connection.alias] = cursor.fetchone() is not None
+    return _available[connection.alias]
+
+
+def filter_users_by_username(queryset, value):
+    """
+    Ограничивает queryset пользователей теми, чей логин содержит value (без учета регистра).
+    На SQLite совпадения ищутся через FTS5, результат остается подзапросом и не выгружается в Python.
+    """
+    connection = connections[queryset.db]
+    if (connection.vendor == 'sqlite' and len(value) >= MIN_INDEXED_QUERY
+            and sqlite_index_available(connection)):
+        phrase = '"{}"'.format(value.replace('"', '""'))
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {USERNAME_FTS_TABLE} WHERE {USERNAME_FTS_TABLE} MATCH %s", [phrase]
+        ))
+    return queryset.filter(username__icontains=value)
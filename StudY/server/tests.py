@@ -1,7 +1,51 @@
+from django.db import connection
+from django.test import TestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from .models import User
+from .search import USERNAME_FTS_TABLE, filter_users_by_username, sqlite_index_available
+
 class ExampleAPITest(APITestCase):
     def test_example_list(self):
         response = self.client.get('/api/example/')
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class UsernameSearchTests(TestCase):
+    def setUp(self):
+        for username in ('maryanna_k', 'ivan_petrov', 'an'):
+            User.objects.create(username=username, role='заказчик')
+
+    def search(self, value):
+        queryset = filter_users_by_username(User.objects.all(), value)
+        return sorted(queryset.values_list('username', flat=True)), str(queryset.query)
+
+    def test_index_is_installed_by_migration(self):
+        self.assertTrue(sqlite_index_available(connection))
+
+    def test_substring_match_ignores_case(self):
+        usernames, sql = self.search('ANNA')
+
+        self.assertEqual(usernames, ['maryanna_k'])
+        self.assertIn(USERNAME_FTS_TABLE, sql)
+
+    def test_short_query_falls_back_to_icontains(self):
+        usernames, sql = self.search('an')
+
+        self.assertEqual(usernames, ['an', 'ivan_petrov', 'maryanna_k'])
+        self.assertNotIn(USERNAME_FTS_TABLE, sql)
+
+    def test_quotes_in_query_are_escaped(self):
+        self.assertEqual(self.search('"an')[0], [])
+
+    def test_triggers_follow_inserts_updates_and_deletes(self):
+        user = User.objects.create(username='new_student', role='исполнитель')
+        self.assertEqual(self.search('stud')[0], ['new_student'])
+
+        user.username = 'renamed_teacher'
+        user.save(update_fields=['username'])
+        self.assertEqual(self.search('stud')[0], [])
+        self.assertEqual(self.search('teach')[0], ['renamed_teacher'])
+
+        user.delete()
+        self.assertEqual(self.search('teach')[0], [])
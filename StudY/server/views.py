@@ -23,7 +23,7 @@ from django.shortcuts import get_object_or_404
 from django.db import transaction
 
 from payments.services import process_transaction
-from rank.services import check_user_rank
+from rank.services import get_referral_bonus_percent
 
 from .decorators import *
 
@@ -127,7 +127,7 @@ class RegisterProfileInfoAPIView(generics.CreateAPIView):
             # Начисляем бонус рефереру
             if bonus_to_referred > 0:
                 process_transaction(user_from=profile, amount=bonus_to_referred,
-                                    rank_commission=check_user_rank(user=referrer, check_type='referral_bonus_self'),
+                                    rank_commission=get_referral_bonus_percent(referrer),
                                     transaction_type='bonus_add',
                                     comment='Бонус за регистрацию по реферальной ссылке!',
                                     is_profile=True)
@@ -551,11 +551,12 @@ class RegisterUserView(APIView):
 
             # Бонус только новому пользователю
             bonus_to_referred = referral_setting.bonus_ref_user
+            referral_bonus_percent = get_referral_bonus_percent(referrer)
             print(f'Перевод бонусов: {profile.user.username}'
-                  f'Доп начисления (в %): {check_user_rank(user=referrer, check_type="referral_bonus_self")}')
+                  f'Доп начисления (в %): {referral_bonus_percent}')
             if bonus_to_referred > 0:
                 process_transaction(user_from=profile, amount=bonus_to_referred,
-                                    rank_commission=check_user_rank(user=referrer, check_type='referral_bonus_self'),
+                                    rank_commission=referral_bonus_percent,
                                     transaction_type='bonus_add',
                                     comment='Бонус за регистрацию по реферальной ссылке!',
                                     is_profile=True)